@@ -0,0 +1,251 @@
+"""
+    Массовая рассылка сообщений гостям (/all).
+    Темп отправки задаёт общий для всего бота token bucket (send_bucket) под лимиты Telegram,
+    сообщения уходят несколькими параллельными отправителями, RetryAfter приостанавливает все отправки.
+    Рассылка получает токены с наименьшим приоритетом: исходящая очередь (outbox.py) её опережает.
+    Задания и доставки хранятся в БД (BroadcastManager): прерванная рассылка продолжается при запуске.
+"""
+import asyncio
+import heapq
+import itertools
+from time import monotonic
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter, TelegramAPIError, BotBlocked, UserDeactivated, ChatNotFound
+
+from database_manager import load_config_section, BroadcastManager, INSPIRA_DB, OUTBOX_PRIORITY_BROADCAST
+from tracer import TracerManager, TRACER_FILE
+
+
+__version__ = '1.0.0'
+
+
+# Telegram допускает ~30 сообщений в секунду от бота в разные чаты, оставляем запас.
+# Переопределяется секцией "broadcast" в config.json, ex. {"broadcast": {"rate_per_second": 20}}
+DEFAULT_BROADCAST = {
+    'rate_per_second': 25,
+    'burst': 25,            # ёмкость корзины: сколько сообщений может уйти подряд без ожидания
+    'concurrency': 10,      # параллельные отправители
+    'max_retries': 3        # повторы одного сообщения после RetryAfter
+}
+BROADCAST = load_config_section('broadcast', DEFAULT_BROADCAST)
+
+
+tracer_l = TracerManager(TRACER_FILE)
+
+# Ошибки Telegram -> причина недоставки; первые три означают недостижимого гостя (UNREACHABLE_REASONS)
+SEND_ERROR_REASONS = (
+    (BotBlocked, 'blocked'),
+    (UserDeactivated, 'deactivated'),
+    (ChatNotFound, 'chat_not_found'),
+    (RetryAfter, 'flood')
+)
+
+# Задачи продолжения рассылок, запущенные при старте
+_running_jobs = set()
+
+
+def classify_send_error(error: Exception) -> str:
+    for error_type, reason in SEND_ERROR_REASONS:
+        if isinstance(error, error_type):
+            return reason
+    return 'error'
+
+
+class TokenBucket:
+    """
+        Общий ограничитель темпа: токены пополняются со скоростью rate в секунду до capacity,
+        каждая отправка забирает один токен. pause() останавливает выдачу на заданное время.
+        Ожидающие получают токены по приоритету (меньше – раньше), при равном – по очереди прихода.
+    """
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = monotonic()
+        self._paused_until = 0.0
+        self._waiters = []      # куча (приоритет, номер прихода)
+        self._arrivals = itertools.count()
+        self._turn_changed = asyncio.Event()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def pause(self, seconds: float):
+        """ Flood control Telegram действует на всего бота – ждут все отправители """
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+        self._tokens = 0
+
+    def _wait_time(self, now: float) -> float:
+        """ Сколько ждать первому в очереди, 0 – токен можно забрать сейчас """
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._refill(now)
+        return 0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    async def acquire(self, priority: int = OUTBOX_PRIORITY_BROADCAST):
+        waiter = (priority, next(self._arrivals))
+        heapq.heappush(self._waiters, waiter)
+        try:
+            while True:
+                # ждёт только первый в очереди, остальные – пока очередь не сдвинется
+                timeout = self._wait_time(monotonic()) if self._waiters[0] == waiter else None
+                if timeout == 0:
+                    self._tokens -= 1
+                    return
+                self._turn_changed.clear()
+                try:
+                    await asyncio.wait_for(self._turn_changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            self._turn_changed.set()
+
+
+# Темп отправки, общий для рассылок и исходящей очереди
+send_bucket = TokenBucket(BROADCAST['rate_per_second'], BROADCAST['burst'])
+
+
+class BroadcastReport:
+    __slots__ = ('sent', 'failed', 'failures', 'started_at', 'finished_at')
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.failures = {}      # {причина недоставки: количество}
+        self.started_at = monotonic()
+        self.finished_at = None
+
+    def add_failure(self, reason: str):
+        self.failed += 1
+        self.failures[reason] = self.failures.get(reason, 0) + 1
+
+    @property
+    def execution_time(self) -> float:
+        return (self.finished_at or monotonic()) - self.started_at
+
+    def format_execution_time(self) -> str:
+        execution_time = round(self.execution_time)
+        return f'{execution_time // 3600} h, {execution_time % 3600 // 60} m, {execution_time % 60} s'
+
+
+class BroadcastEngine:
+    def __init__(self, bot: Bot, bucket: TokenBucket = None, concurrency: int = BROADCAST['concurrency'],
+                 max_retries: int = BROADCAST['max_retries']):
+        self.bot = bot
+        self.bucket = bucket or send_bucket
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+
+    async def _send(self, user_id: int, text: str, parse_mode: str):
+        """
+            Отправка одного сообщения с учётом общего темпа.
+            :return: None – доставлено, иначе причина недоставки (classify_send_error)
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire(OUTBOX_PRIORITY_BROADCAST)
+            try:
+                await self.bot.send_message(chat_id=user_id, text=text, parse_mode=parse_mode)
+                return None
+            except RetryAfter as flood_error:
+                self.bucket.pause(flood_error.timeout)
+                tracer_l.tracer_charge(
+                    "WARNING", user_id, f"{__name__} -> {self._send.__name__}",
+                    f"flood control, pause {flood_error.timeout} s (attempt {attempt + 1})", f"{flood_error}")
+            except TelegramAPIError as send_error:
+                tracer_l.tracer_charge(
+                    "WARNING", user_id, f"{__name__} -> {self._send.__name__}",
+                    "fail while send broadcast message", f"{send_error}")
+                return classify_send_error(send_error)
+        return 'flood'
+
+    async def run(self, user_ids: list, text: str, parse_mode: str = 'HTML', on_delivery=None) -> BroadcastReport:
+        """
+            Рассылка text всем user_ids: concurrency отправителей разбирают общую очередь.
+            :param on_delivery: async callback(user_id, failure_reason) после каждой попытки доставки,
+                failure_reason – None, если сообщение доставлено
+            :return: BroadcastReport с количеством доставленных и недоставленных сообщений
+        """
+        report = BroadcastReport()
+        recipients = asyncio.Queue()
+        for user_id in user_ids:
+            recipients.put_nowait(user_id)
+
+        async def sender():
+            while True:
+                try:
+                    user_id = recipients.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                failure_reason = await self._send(user_id, text, parse_mode)
+                if failure_reason is None:
+                    report.sent += 1
+                else:
+                    report.add_failure(failure_reason)
+                if on_delivery is not None:
+                    await on_delivery(user_id, failure_reason)
+
+        await asyncio.gather(*(sender() for _ in range(min(self.concurrency, len(user_ids)))))
+        report.finished_at = monotonic()
+
+        return report
+
+
+def format_failures(failures: dict) -> str:
+    """ Разбивка недоставленных сообщений по причинам, ex. '• blocked – 12' """
+    return ''.join(f"• {reason} – {count}\n" for reason, count in failures.items())
+
+
+async def run_broadcast_job(bot: Bot, job_id: int, text: str, parse_mode: str = 'HTML') -> BroadcastReport:
+    """
+        Рассылка по заданию из БД: только получателям, которым ещё не отправляли.
+        Каждая доставка отмечается в БД, в конце задание закрывается.
+    """
+    broadcast_manager = BroadcastManager(INSPIRA_DB)
+    pending_recipients = await broadcast_manager.aio.get_pending_recipients(job_id)
+
+    async def checkpoint(user_id: int, failure_reason):
+        await broadcast_manager.aio.mark_recipient_delivery(job_id, user_id, failure_reason)
+
+    report = await BroadcastEngine(bot).run(pending_recipients, text, parse_mode, on_delivery=checkpoint)
+    await broadcast_manager.aio.finish_broadcast_job(job_id)
+
+    tracer_l.tracer_charge(
+        "SYSTEM", 0, f"{__name__} -> {run_broadcast_job.__name__}",
+        f"broadcast job {job_id} finished: sent {report.sent}, failed {report.failed}")
+
+    return report
+
+
+async def resume_broadcast_jobs(bot: Bot) -> list:
+    """
+        Продолжение прерванных перезапуском рассылок. Запускается при старте бота.
+        :return: запущенные задачи asyncio
+    """
+    async def resume(job_id, admin_id, text, parse_mode):
+        report = await run_broadcast_job(bot, job_id, text, parse_mode)
+        if admin_id:
+            try:
+                await bot.send_message(
+                    admin_id, f"➜ BROADCAST #{job_id} RESUMED AND DONE\n"
+                              f"➜ DONE {report.sent}\n➜ NOT COMPLETED {report.failed}\n"
+                              f"{format_failures(report.failures)}")
+            except TelegramAPIError as send_error:
+                tracer_l.tracer_charge(
+                    "WARNING", admin_id, f"{__name__} -> {resume_broadcast_jobs.__name__}",
+                    "fail while notify admin about resumed broadcast", f"{send_error}")
+
+    unfinished_jobs = await BroadcastManager(INSPIRA_DB).aio.get_unfinished_broadcast_jobs()
+
+    resumed_tasks = []
+    for job in unfinished_jobs:
+        task = asyncio.create_task(resume(*job))
+        # ссылка на задачу держится до её завершения, иначе asyncio может её собрать
+        _running_jobs.add(task)
+        task.add_done_callback(_running_jobs.discard)
+        resumed_tasks.append(task)
+
+    return resumed_tasks
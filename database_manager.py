@@ -1,13 +1,21 @@
 import os
+import json
 import datetime
 from time import sleep, time
 from server_info import timing_decorator
 from referral import RESOURCE_DICT
 import asyncio
+import enum
+import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager
 
 import sqlite3
 import aiosqlite
 
+from date_codec import to_timestamp, start_of_day_timestamp, timestamp_column, DISPLAY_DATE_FORMAT
 from referral import RESOURCE_DICT
 from tracer import TracerManager, TRACER_FILE
 
@@ -23,12 +31,89 @@ tracer_l = TracerManager(TRACER_FILE)
 INSPIRA_DB = 'inspira.db'
 FILE_LIMITED_USERS = 'limited_users.db'
 
+# Количество read-only соединений в пуле на одну БД
+READERS_IN_POOL = 4
+# Размер кэша подготовленных выражений каждого соединения
+CACHED_STATEMENTS = 256
+
+CONFIG_FILE = 'config.json'
+
+# Профиль производительности SQLite, применяется к каждому открываемому соединению.
+# Переопределяется секцией "sqlite" в config.json, ex. {"sqlite": {"synchronous": "FULL"}}
+DEFAULT_SQLITE_PROFILE = {
+    'journal_mode': 'WAL',      # читатели и писатель не блокируют друг друга
+    'synchronous': 'NORMAL',    # в WAL fsync только при checkpoint, а не на каждый commit
+    'mmap_size': 268435456,     # 256 МБ
+    'cache_size': -16000,       # отрицательное значение – размер в КиБ (~16 МБ)
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000        # мс ожидания блокировки вместо мгновенного "database is locked"
+}
+SQLITE_PROFILE_PRAGMAS = ['journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'temp_store', 'busy_timeout']
+
+# Групповая фиксация изменений: мутации, пришедшие в пределах окна, пишутся одной транзакцией.
+# Переопределяется секцией "group_commit" в config.json
+DEFAULT_GROUP_COMMIT = {
+    'enabled': True,
+    'window_ms': 5,
+    'max_batch': 100
+}
+
+
+def load_config_section(section: str, defaults: dict, config_file: str = CONFIG_FILE) -> dict:
+    values = dict(defaults)
+    try:
+        with open(config_file) as _config_file:
+            values.update(json.load(_config_file).get(section, {}))
+    except (OSError, ValueError, AttributeError) as config_error:
+        print(f"---- CONFIG ({section}): default values ({config_error}) ----")
+    return values
+
+
+def load_sqlite_profile(config_file: str = CONFIG_FILE) -> dict:
+    return load_config_section('sqlite', DEFAULT_SQLITE_PROFILE, config_file)
+
+
+def build_pragma_statements(profile: dict, with_journal_mode: bool = True) -> list:
+    """
+        PRAGMA-инструкции профиля.
+        :param with_journal_mode: journal_mode хранится в самом файле БД и не может
+        быть изменён read-only соединением, поэтому для читателей пропускается
+    """
+    statements = []
+    for pragma in SQLITE_PROFILE_PRAGMAS:
+        if pragma not in profile or (pragma == 'journal_mode' and not with_journal_mode):
+            continue
+        value = profile[pragma]
+        if not isinstance(value, int) and not str(value).isalnum():
+            raise ValueError(f"invalid value for PRAGMA {pragma}: {value}")
+        statements.append(f'PRAGMA {pragma} = {value}')
+    return statements
+
+
+SQLITE_PROFILE = load_sqlite_profile()
+GROUP_COMMIT = load_config_section('group_commit', DEFAULT_GROUP_COMMIT)
+
 USERS_TABLE_NAME = 'users'
 PRODUCTS_TABLE_NAME = 'products'
 REFERRALS_TABLE_NAME = 'referrals'
 LIMITED_USERS_TABLE_NAME = 'limited_users'
 ADMINS_TABLE_NAME = 'admins'
 APPOINTMENTS_TABLE_NAME = 'appointments'
+LESSON_SLOTS_TABLE_NAME = 'lesson_slots'
+REFERRAL_STATS_TABLE_NAME = 'referral_stats'
+BROADCAST_JOBS_TABLE_NAME = 'broadcast_jobs'
+BROADCAST_RECIPIENTS_TABLE_NAME = 'broadcast_recipients'
+UNREACHABLE_USERS_TABLE_NAME = 'unreachable_users'
+OUTBOX_TABLE_NAME = 'outbox'
+SCHEDULED_JOBS_TABLE_NAME = 'scheduled_jobs'
+DAILY_STATS_TABLE_NAME = 'daily_stats'
+
+# Время занятий, предлагаемое гостям при записи
+LESSON_TIMES = ['11:00', '13:30', '15:30']
+# Ограничитель количества гостей на одном занятии
+LESSON_GUESTS_LIMIT = 8
+# Горизонт предстоящих занятий для администратора, дней
+UPCOMING_LESSONS_DAYS = 21
 
 
 FIELDS_FOR_USERS = [
@@ -39,7 +124,10 @@ FIELDS_FOR_USERS = [
     {'name': 'username', 'type': 'TEXT'},
     {'name': 'date_register', 'type': 'TEXT'},
     {'name': 'user_status', 'type': 'BOOL'},
-    {'name': 'user_status_date_upd', 'type': 'TEXT'}
+    {'name': 'user_status_date_upd', 'type': 'TEXT'},
+    # date_register в секундах Unix – сортируемый ключ ленты последних регистраций
+    {'name': 'date_register_ts', 'type': 'INTEGER NOT NULL DEFAULT 0'},
+    {'name': 'user_status_date_upd_ts', 'type': 'INTEGER'}
 ]
 FIELDS_FOR_PRODUCTS = [
     {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
@@ -47,18 +135,21 @@ FIELDS_FOR_PRODUCTS = [
     {'name': 'status', 'type': 'TEXT'},
     {'name': 'user_id', 'type': 'INTEGER'},
     {'name': 'group_number', 'type': 'TEXT'},
-    {'name': 'status_update_date', 'type': 'TEXT'}
+    {'name': 'status_update_date', 'type': 'TEXT'},
+    {'name': 'status_update_date_ts', 'type': 'INTEGER'}
 ]
 FIELDS_FOR_REFERRALS = [
     {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
     {'name': 'user_id', 'type': 'TEXT'},
     {'name': 'arrival_id', 'type': 'TEXT'},
-    {'name': 'date_arrival', 'type': 'TEXT'}
+    {'name': 'date_arrival', 'type': 'TEXT'},
+    {'name': 'date_arrival_ts', 'type': 'INTEGER'}
 ]
 FIELDS_FOR_LIMITED_USERS = [
     {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
     {'name': 'user_id', 'type': 'INTEGER'},
-    {'name': 'date', 'type': 'TEXT'}
+    {'name': 'date', 'type': 'TEXT'},
+    {'name': 'date_ts', 'type': 'INTEGER'}
 ]
 FIELDS_FOR_ADMINS = [
     {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
@@ -73,14 +164,399 @@ FIELDS_FOR_APPOINTMENTS = [
     {'name': 'status', 'type': 'BOOL'},
     {'name': 'date_lesson', 'type': 'TEXT'},
     {'name': 'time_lesson', 'type': 'TEXT'},
-    {'name': 'date_update', 'type': 'TEXT'}
+    {'name': 'date_update', 'type': 'TEXT'},
+    {'name': 'date_lesson_ts', 'type': 'INTEGER'},
+    {'name': 'date_update_ts', 'type': 'INTEGER'}
+]
+# Свёртка appointments: текущее число гостей на каждом слоте (дата, время, занятие)
+FIELDS_FOR_LESSON_SLOTS = [
+    {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+    {'name': 'date_lesson', 'type': 'TEXT NOT NULL'},
+    {'name': 'time_lesson', 'type': 'TEXT NOT NULL'},
+    {'name': 'service_name', 'type': 'TEXT NOT NULL'},
+    {'name': 'headcount', 'type': 'INTEGER NOT NULL DEFAULT 0'},
+    {'name': 'date_lesson_ts', 'type': 'INTEGER'}
+]
+# Свёртка по источникам переходов: одна строка на источник за день, счётчики растут вместе с событиями
+FIELDS_FOR_REFERRAL_STATS = [
+    {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+    {'name': 'day', 'type': 'TEXT NOT NULL'},
+    {'name': 'day_ts', 'type': 'INTEGER NOT NULL'},
+    {'name': 'arrival_id', 'type': 'TEXT NOT NULL'},
+    {'name': 'arrivals', 'type': 'INTEGER NOT NULL DEFAULT 0'},
+    {'name': 'phone_confirmations', 'type': 'INTEGER NOT NULL DEFAULT 0'},
+    {'name': 'lesson_signups', 'type': 'INTEGER NOT NULL DEFAULT 0'},
+    {'name': 'products_received', 'type': 'INTEGER NOT NULL DEFAULT 0'}
+]
+REFERRAL_STATS_COUNTERS = ('arrivals', 'phone_confirmations', 'lesson_signups', 'products_received')
+# Рассылки (/all): задание и состояние доставки каждому получателю – точка продолжения после перезапуска
+FIELDS_FOR_BROADCAST_JOBS = [
+    {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+    {'name': 'admin_id', 'type': 'INTEGER'},
+    {'name': 'text', 'type': 'TEXT NOT NULL'},
+    {'name': 'parse_mode', 'type': 'TEXT'},
+    {'name': 'status', 'type': 'TEXT NOT NULL'},
+    {'name': 'total', 'type': 'INTEGER NOT NULL DEFAULT 0'},
+    {'name': 'sent', 'type': 'INTEGER NOT NULL DEFAULT 0'},
+    {'name': 'failed', 'type': 'INTEGER NOT NULL DEFAULT 0'},
+    {'name': 'created_date', 'type': 'TEXT'},
+    {'name': 'created_date_ts', 'type': 'INTEGER'},
+    {'name': 'finished_date_ts', 'type': 'INTEGER'}
+]
+FIELDS_FOR_BROADCAST_RECIPIENTS = [
+    {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+    {'name': 'job_id', 'type': 'INTEGER NOT NULL'},
+    {'name': 'user_id', 'type': 'INTEGER NOT NULL'},
+    {'name': 'status', 'type': 'TEXT NOT NULL'},
+    {'name': 'updated_ts', 'type': 'INTEGER'},
+    {'name': 'failure_reason', 'type': 'TEXT'}
+]
+# Гости, до которых бот не может достучаться (заблокировали бота, удалили аккаунт).
+# Запись снимается, когда гость снова пишет боту (/start)
+FIELDS_FOR_UNREACHABLE_USERS = [
+    {'name': 'user_id', 'type': 'INTEGER PRIMARY KEY'},
+    {'name': 'reason', 'type': 'TEXT NOT NULL'},
+    {'name': 'date', 'type': 'TEXT'},
+    {'name': 'date_ts', 'type': 'INTEGER'}
+]
+FIELDS_FOR_OUTBOX = [
+    {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+    {'name': 'chat_id', 'type': 'INTEGER NOT NULL'},
+    {'name': 'priority', 'type': 'INTEGER NOT NULL'},
+    {'name': 'text', 'type': 'TEXT'},
+    {'name': 'parse_mode', 'type': 'TEXT'},
+    {'name': 'reply_markup', 'type': 'TEXT'},      # JSON клавиатуры, передаётся в Telegram как есть
+    {'name': 'photo', 'type': 'BLOB'},             # при наличии сообщение отправляется фото, text – подпись
+    {'name': 'photo_filename', 'type': 'TEXT'},
+    {'name': 'status', 'type': 'TEXT NOT NULL'},
+    {'name': 'attempts', 'type': 'INTEGER NOT NULL DEFAULT 0'},
+    {'name': 'next_attempt_ts', 'type': 'INTEGER NOT NULL'},
+    {'name': 'created_ts', 'type': 'INTEGER NOT NULL'},
+    {'name': 'sent_ts', 'type': 'INTEGER'},
+    {'name': 'last_error', 'type': 'TEXT'}
 ]
 
+FIELDS_FOR_SCHEDULED_JOBS = [
+    {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+    {'name': 'name', 'type': 'TEXT NOT NULL'},
+    {'name': 'last_scheduled_ts', 'type': 'INTEGER'},  # плановое время последнего обработанного запуска
+    {'name': 'last_run_ts', 'type': 'INTEGER'},        # фактическое начало последнего запуска
+    {'name': 'last_duration', 'type': 'REAL'},
+    {'name': 'last_status', 'type': 'TEXT'},
+    {'name': 'last_error', 'type': 'TEXT'},
+    {'name': 'runs', 'type': 'INTEGER NOT NULL DEFAULT 0'},
+    {'name': 'skipped', 'type': 'INTEGER NOT NULL DEFAULT 0'}
+]
+
+# Счётчики дня: увеличиваются в транзакции самого события, отчёт читает одну строку
+DAILY_STATS_COUNTERS = ('new_users', 'phone_confirmations', 'lesson_signups', 'lesson_cancellations',
+                        'products_wait', 'products_work', 'products_done', 'products_received', 'bans')
+FIELDS_FOR_DAILY_STATS = [
+    {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+    {'name': 'day', 'type': 'TEXT NOT NULL'},
+    {'name': 'day_ts', 'type': 'INTEGER NOT NULL'}
+] + [{'name': counter, 'type': 'INTEGER NOT NULL DEFAULT 0'} for counter in DAILY_STATS_COUNTERS]
+# Переход изделия в статус -> счётчик дня
+PRODUCT_STATUS_COUNTERS = {
+    'WAIT': 'products_wait',
+    'WORK': 'products_work',
+    'DONE': 'products_done',
+    'RECEIVED': 'products_received'
+}
+
+# Статусы заданий и получателей рассылки
+BROADCAST_RUNNING = 'RUNNING'
+BROADCAST_DONE = 'DONE'
+RECIPIENT_PENDING = 'PENDING'
+RECIPIENT_SENT = 'SENT'
+RECIPIENT_FAILED = 'FAILED'
+# Причины недоставки, после которых гость считается недостижимым
+UNREACHABLE_REASONS = frozenset({'blocked', 'deactivated', 'chat_not_found'})
+
+# Статусы сообщений исходящей очереди
+OUTBOX_PENDING = 'PENDING'
+OUTBOX_SENDING = 'SENDING'
+OUTBOX_SENT = 'SENT'
+OUTBOX_FAILED = 'FAILED'
+# Приоритеты отправки: меньше – раньше. Общий темп отправки (broadcast.send_bucket) выдаётся в этом порядке
+OUTBOX_PRIORITY_REPLY = 0       # ответы гостю на его действие
+OUTBOX_PRIORITY_GUEST = 1       # уведомления гостю о статусе изделия
+OUTBOX_PRIORITY_ADMIN = 2       # уведомления администраторам
+OUTBOX_PRIORITY_BROADCAST = 3   # массовая рассылка /all
+
+# Индексы таблиц: name – имя индекса, columns – колонки, unique – уникальность значений
+INDEXES_FOR_USERS = [
+    {'name': 'idx_users_user_id', 'columns': ['user_id'], 'unique': True}
+]
+# Отдельно от INDEXES_FOR_USERS: колонка появляется только в миграции v4
+INDEXES_FOR_USERS_REGISTRATION = [
+    {'name': 'idx_users_date_register_ts', 'columns': ['date_register_ts']}
+]
+INDEXES_FOR_PRODUCTS = [
+    {'name': 'idx_products_user_id', 'columns': ['user_id'], 'unique': True},
+    # покрывающий индекс для списка групп: GROUP BY group_number, status без чтения строк таблицы
+    {'name': 'idx_products_group_status', 'columns': ['group_number', 'status']}
+]
+# Уникальность появляется в миграции v6, после удаления дублей
+INDEXES_FOR_REFERRALS = [
+    # первый источник гостя фиксируется один раз: INSERT OR IGNORE по уникальному user_id
+    {'name': 'idx_referrals_user_id', 'columns': ['user_id'], 'unique': True}
+]
+INDEXES_FOR_LIMITED_USERS = []
+INDEXES_FOR_ADMINS = [
+    {'name': 'idx_admins_user_id', 'columns': ['user_id'], 'unique': True}
+]
+INDEXES_FOR_APPOINTMENTS = [
+    {'name': 'idx_appointments_user_id', 'columns': ['user_id']},
+    {'name': 'idx_appointments_lesson', 'columns': ['date_lesson', 'time_lesson']}
+]
+INDEXES_FOR_LESSON_SLOTS = [
+    {'name': 'idx_lesson_slots_slot', 'columns': ['date_lesson', 'time_lesson', 'service_name'], 'unique': True}
+]
+INDEXES_FOR_REFERRAL_STATS = [
+    {'name': 'idx_referral_stats_day_source', 'columns': ['day_ts', 'arrival_id'], 'unique': True}
+]
+INDEXES_FOR_BROADCAST_JOBS = [
+    {'name': 'idx_broadcast_jobs_status', 'columns': ['status']}
+]
+INDEXES_FOR_BROADCAST_RECIPIENTS = [
+    {'name': 'idx_broadcast_recipients_job_user', 'columns': ['job_id', 'user_id'], 'unique': True},
+    {'name': 'idx_broadcast_recipients_job_status', 'columns': ['job_id', 'status']}
+]
+INDEXES_FOR_SCHEDULED_JOBS = [
+    {'name': 'idx_scheduled_jobs_name', 'columns': ['name'], 'unique': True}
+]
+INDEXES_FOR_DAILY_STATS = [
+    {'name': 'idx_daily_stats_day_ts', 'columns': ['day_ts'], 'unique': True}
+]
+INDEXES_FOR_OUTBOX = [
+    # выбор следующего сообщения: status = PENDING ORDER BY priority, id – без сортировки
+    {'name': 'idx_outbox_status_priority', 'columns': ['status', 'priority', 'id']}
+]
+
+# Строковые колонки дат. У каждой есть колонка-спутник <колонка>_ts с секундами Unix:
+# по ней сортируем и фильтруем диапазоны в SQL, строка остаётся только для отображения
+TIMESTAMP_COLUMNS = {
+    USERS_TABLE_NAME: ['date_register', 'user_status_date_upd'],
+    PRODUCTS_TABLE_NAME: ['status_update_date'],
+    REFERRALS_TABLE_NAME: ['date_arrival'],
+    APPOINTMENTS_TABLE_NAME: ['date_lesson', 'date_update'],
+    LIMITED_USERS_TABLE_NAME: ['date'],
+    LESSON_SLOTS_TABLE_NAME: ['date_lesson']
+}
+
+
+# Время жизни закэшированного количества пользователей, сек
+USERS_COUNT_TTL = 60
+
+
+def with_timestamps(table_name: str, data: dict) -> dict:
+    """
+        Дополняет вставляемую запись колонками <колонка>_ts для дат из TIMESTAMP_COLUMNS.
+        Нераспознанная дата не заполняется – колонка получает значение по умолчанию.
+    """
+    data = dict(data)
+    for column in TIMESTAMP_COLUMNS.get(table_name, ()):
+        if column in data and timestamp_column(column) not in data:
+            timestamp = to_timestamp(data[column])
+            if timestamp is not None:
+                data[timestamp_column(column)] = timestamp
+    return data
+
+
+def build_timestamps_backfill(table_name: str, columns: list):
+    """ Операция миграции: заполнение <колонка>_ts по уже сохранённым строкам дат """
+    def backfill(conn: sqlite3.Connection):
+        rows = conn.execute(f'SELECT rowid, {", ".join(columns)} FROM {table_name}').fetchall()
+        for column_number, column in enumerate(columns, start=1):
+            timestamps = [(to_timestamp(row[column_number]), row[0]) for row in rows]
+            conn.executemany(
+                f'UPDATE {table_name} SET {timestamp_column(column)} = ? WHERE rowid = ?',
+                [(timestamp, row_id) for timestamp, row_id in timestamps if timestamp is not None])
+    return backfill
+
+
+def build_timestamps_migration_operations(timestamp_columns: dict) -> list:
+    """
+        Операции миграции: колонки <колонка>_ts, их заполнение и индексы
+        :param timestamp_columns: {таблица: [строковые колонки дат]}
+    """
+    operations = []
+    for table_name, columns in timestamp_columns.items():
+        for column in columns:
+            operations.append(('add_column', table_name, {'name': timestamp_column(column), 'type': 'INTEGER'}))
+        operations.append(('python', build_timestamps_backfill(table_name, columns)))
+        operations.append(('create_indexes', table_name, [
+            {'name': f'idx_{table_name}_{timestamp_column(column)}', 'columns': [timestamp_column(column)]}
+            for column in columns]))
+    return operations
+
+
+# Форматы date_register: при регистрации через бот и значение по умолчанию add_record.
+# Используются только выпущенной миграцией v4, дальше даты разбирает date_codec
+REGISTER_DATE_FORMATS = ('%H:%M %d-%m-%Y', '%d-%m-%Y %H:%M:%S')
+
+
+def register_date_to_timestamp(date_register) -> int:
+    """
+        Дата регистрации в секундах Unix.
+        :return: текущее время, если даты нет; 0, если формат даты не распознан
+    """
+    if date_register is None:
+        return int(time())
+    for date_format in REGISTER_DATE_FORMATS:
+        try:
+            return int(datetime.datetime.strptime(date_register, date_format).timestamp())
+        except (TypeError, ValueError):
+            continue
+    return 0
+
+
+def _backfill_date_register_ts(conn: sqlite3.Connection):
+    users = conn.execute(f'SELECT id, date_register FROM {USERS_TABLE_NAME}').fetchall()
+    conn.executemany(
+        f'UPDATE {USERS_TABLE_NAME} SET date_register_ts = ? WHERE id = ?',
+        [(register_date_to_timestamp(date_register) if date_register else 0, row_id)
+         for row_id, date_register in users])
+
+
+def _move_legacy_referrals(conn: sqlite3.Connection):
+    """ Перенос записей из таблицы 'referral', куда раньше по ошибке писал ReferralArrival """
+    legacy_table = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'referral'").fetchone()
+    if legacy_table is None:
+        return
+
+    legacy_referrals = conn.execute('SELECT user_id, id_arrival, date FROM referral ORDER BY rowid').fetchall()
+    conn.executemany(
+        f'''
+            INSERT INTO {REFERRALS_TABLE_NAME} (user_id, arrival_id, date_arrival, date_arrival_ts)
+            VALUES (?, ?, ?, ?)
+        ''',
+        [(user_id, arrival_id, date_arrival, to_timestamp(date_arrival))
+         for user_id, arrival_id, date_arrival in legacy_referrals])
+
+
+def increment_referral_stats(conn: sqlite3.Connection, user_id, counter: str):
+    """
+        +1 к счётчику источника, с которого пришёл гость, в строке сегодняшнего дня.
+        Вызывается на соединении и в транзакции самого события. Гость без источника не учитывается.
+        :param counter: один из REFERRAL_STATS_COUNTERS
+    """
+    if counter not in REFERRAL_STATS_COUNTERS:
+        raise ValueError(f"unknown referral stats counter: {counter}")
+
+    conn.execute(
+        f'''
+            INSERT INTO {REFERRAL_STATS_TABLE_NAME} (day, day_ts, arrival_id, {counter})
+            SELECT ?, ?, arrival_id, 1 FROM {REFERRALS_TABLE_NAME} WHERE user_id = ?
+            ON CONFLICT (day_ts, arrival_id) DO UPDATE SET {counter} = {counter} + 1
+        ''',
+        (datetime.date.today().strftime(DISPLAY_DATE_FORMAT), start_of_day_timestamp(), user_id))
+
+
+def _backfill_referral_stats_sql(counter: str, source_query: str) -> str:
+    """
+        Заполнение свёртки по уже накопленным данным.
+        :param source_query: SELECT user_id, ts – событие гостя и его время в секундах Unix
+    """
+    return f'''
+        INSERT INTO {REFERRAL_STATS_TABLE_NAME} (day, day_ts, arrival_id, {counter})
+        SELECT strftime('%d.%m.%Y', event.ts, 'unixepoch', 'localtime'),
+               CAST(strftime('%s', date(event.ts, 'unixepoch', 'localtime'), 'utc') AS INTEGER),
+               r.arrival_id, COUNT(*)
+        FROM ({source_query}) AS event
+        JOIN {REFERRALS_TABLE_NAME} AS r ON r.user_id = event.user_id
+        WHERE event.ts IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (day_ts, arrival_id) DO UPDATE SET {counter} = {counter} + excluded.{counter}
+    '''
+
+
+def build_daily_stats_increment(counter: str) -> tuple:
+    """
+        Запрос +1 к счётчику в строке сегодняшнего дня – для выполнения на соединении события
+        (sqlite3 или aiosqlite), в его транзакции.
+        :param counter: один из DAILY_STATS_COUNTERS
+        :return: (sql, params)
+    """
+    if counter not in DAILY_STATS_COUNTERS:
+        raise ValueError(f"unknown daily stats counter: {counter}")
+
+    query = f'''
+        INSERT INTO {DAILY_STATS_TABLE_NAME} (day, day_ts, {counter}) VALUES (?, ?, 1)
+        ON CONFLICT (day_ts) DO UPDATE SET {counter} = {counter} + 1
+    '''
+    return query, (datetime.date.today().strftime(DISPLAY_DATE_FORMAT), start_of_day_timestamp())
+
+
+def increment_daily_stats(conn: sqlite3.Connection, counter: str):
+    conn.execute(*build_daily_stats_increment(counter))
+
+
+def _backfill_daily_stats_sql(counter: str, source_query: str) -> str:
+    """
+        Заполнение счётчиков дня по уже накопленным данным.
+        :param source_query: SELECT ts – время события в секундах Unix
+    """
+    return f'''
+        INSERT INTO {DAILY_STATS_TABLE_NAME} (day, day_ts, {counter})
+        SELECT strftime('%d.%m.%Y', event.ts, 'unixepoch', 'localtime'),
+               CAST(strftime('%s', date(event.ts, 'unixepoch', 'localtime'), 'utc') AS INTEGER),
+               COUNT(*)
+        FROM ({source_query}) AS event
+        WHERE event.ts IS NOT NULL AND event.ts > 0
+        GROUP BY 1, 2
+        ON CONFLICT (day_ts) DO UPDATE SET {counter} = {counter} + excluded.{counter}
+    '''
+
+
+def record_unreachable_user(conn: sqlite3.Connection, user_id: int, reason: str):
+    """ Отметка недостижимого гостя по ошибке Telegram. Причины вне UNREACHABLE_REASONS не учитываются """
+    if reason not in UNREACHABLE_REASONS:
+        return
+
+    date = get_format_date()
+    conn.execute(
+        f'''
+            INSERT INTO {UNREACHABLE_USERS_TABLE_NAME} (user_id, reason, date, date_ts) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET reason = excluded.reason, date = excluded.date, date_ts = excluded.date_ts
+        ''',
+        (user_id, reason, date, to_timestamp(date)))
+
 
 def get_format_date():
     return datetime.datetime.now().strftime("%d.%m.%Y-%H:%M:%S")
 
 
+def format_contact_info(fullname, phone) -> str:
+    """ Контакт гостя для отображения администратору, ex. 'Анна – +79998887766' """
+    return f"{fullname if fullname is not None else '-'} – {phone if phone is not None else '-'}"
+
+
+def build_create_table_sql(table_name: str, fields: list) -> str:
+    field_definitions = [f"{field['name']} {field['type']}" for field in fields]
+    return f'CREATE TABLE IF NOT EXISTS {table_name} ({", ".join(field_definitions)})'
+
+
+def create_index_on_connection(conn: sqlite3.Connection, table_name: str, index: dict):
+    """
+        Создание индекса на переданном соединении (в том числе внутри открытой транзакции).
+        Если уникальный индекс не строится из-за дублей в существующих данных,
+        создаётся обычный индекс с тем же именем, чтобы поиск всё равно шёл по индексу.
+    """
+    columns = ', '.join(index['columns'])
+    unique = 'UNIQUE ' if index.get('unique') else ''
+
+    try:
+        conn.execute(f'CREATE {unique}INDEX IF NOT EXISTS {index["name"]} ON {table_name} ({columns})')
+    except sqlite3.IntegrityError as duplicate_error:
+        tracer_l.tracer_charge(
+            "WARNING", 0,
+            f"{__name__} -> {create_index_on_connection.__name__}",
+            f"duplicates in {table_name} ({columns}), index is not unique", f"{duplicate_error}")
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {index["name"]} ON {table_name} ({columns})')
+
+
 class TemplatesTrackingEvents(TracerManager):
     """
         Шаблоны отображения отработавших событий в консоли.
@@ -138,9 +614,408 @@ class TemplatesTrackingEvents(TracerManager):
 templates_status_events = TemplatesTrackingEvents(TRACER_FILE)
 
 
+class ConnectionPool:
+    """
+        Пул долгоживущих соединений с одной БД: один писатель и N читателей (read-only).
+        Соединения открываются один раз при старте и переиспользуются всеми менеджерами,
+        поэтому запрос не платит за открытие файла и прогрев кэша схемы.
+    """
+    def __init__(self, db_name: str, readers: int = READERS_IN_POOL):
+        self.db_name = db_name
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._writer = self._open_connection(read_only=False)
+
+        self._readers = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(self._open_connection(read_only=True))
+
+    def _open_connection(self, read_only: bool) -> sqlite3.Connection:
+        if read_only:
+            conn = sqlite3.connect(f'file:{self.db_name}?mode=ro', uri=True, check_same_thread=False,
+                                   cached_statements=CACHED_STATEMENTS)
+        else:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+
+        for statement in build_pragma_statements(SQLITE_PROFILE, with_journal_mode=not read_only):
+            conn.execute(statement).close()
+        return conn
+
+    @contextmanager
+    def writer(self, immediate: bool = False):
+        """
+            Единственное пишущее соединение. Доступ сериализуется блокировкой,
+            по выходу из блока изменения фиксируются, при ошибке – откатываются.
+            Вложенный блок (ex. мутация внутри групповой транзакции) оформляется SAVEPOINT:
+            его ошибка откатывает только его изменения, а фиксирует всё внешний блок.
+            :param immediate: начать транзакцию с BEGIN IMMEDIATE (сразу взять блокировку записи)
+        """
+        with self._write_lock:
+            if self._write_depth:
+                yield from self.__savepoint()
+                return
+
+            self._write_depth += 1
+            try:
+                self._writer.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+            finally:
+                self._write_depth -= 1
+
+    def __savepoint(self):
+        savepoint = f'sp_{self._write_depth}'
+        self._write_depth += 1
+        try:
+            self._writer.execute(f'SAVEPOINT {savepoint}')
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer.execute(f'ROLLBACK TO {savepoint}')
+                raise
+            finally:
+                self._writer.execute(f'RELEASE {savepoint}')
+        finally:
+            self._write_depth -= 1
+
+    @contextmanager
+    def reader(self):
+        """ Одолжить read-only соединение из пула и вернуть его обратно после использования """
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def get_pragma_values(self) -> dict:
+        """ Фактически действующие значения профиля: для писателя и для читателя """
+        values = {}
+        with self.reader() as reader_conn, self._write_lock:
+            for pragma in SQLITE_PROFILE_PRAGMAS:
+                values[pragma] = (
+                    self._writer.execute(f'PRAGMA {pragma}').fetchone()[0],
+                    reader_conn.execute(f'PRAGMA {pragma}').fetchone()[0]
+                )
+        return values
+
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+
+def get_connection_pool(db_name: str) -> ConnectionPool:
+    """ Пул создаётся один раз на файл БД и разделяется всеми менеджерами """
+    with _connection_pools_lock:
+        if db_name not in _connection_pools:
+            _connection_pools[db_name] = ConnectionPool(db_name)
+        return _connection_pools[db_name]
+
+
+QUERY_OPERATORS = frozenset({'=', '!=', '<', '<=', '>', '>=', 'IN', 'NOT IN', 'IS', 'IS NOT', 'LIKE'})
+
+
+@functools.lru_cache(maxsize=256)
+def _build_select_sql(table: str, columns: tuple, condition_shape: tuple, group_by: tuple,
+                      order_by: tuple, with_limit: bool) -> str:
+    """
+        Текст SELECT по форме запроса. Форма не содержит значений, поэтому один и тот же
+        текст переиспользуется для всех значений параметров (ex. любого user_id)
+    """
+    sql_query = f'SELECT {", ".join(columns)} FROM {table}'
+
+    conditions = []
+    for column, operator, values_count in condition_shape:
+        if operator in ('IN', 'NOT IN'):
+            conditions.append(f'{column} {operator} ({", ".join("?" * values_count)})')
+        else:
+            conditions.append(f'{column} {operator} ?')
+    if conditions:
+        sql_query += f' WHERE {" AND ".join(conditions)}'
+
+    if group_by:
+        sql_query += f' GROUP BY {", ".join(group_by)}'
+    if order_by:
+        sql_query += f' ORDER BY {", ".join(order_by)}'
+    if with_limit:
+        sql_query += ' LIMIT ?'
+
+    return sql_query
+
+
+class Query:
+    """
+        Построитель параметризованных SELECT-запросов.
+        Значения всегда уходят параметрами, а текст SQL кэшируется по форме запроса
+        (таблица, колонки, условия, сортировка, наличие лимита) – одинаковые по форме
+        запросы дают один и тот же текст и попадают в кэш подготовленных выражений sqlite3.
+        ex. Query(USERS_TABLE_NAME, ['phone']).where(user_id=user_id).limit(1)
+    """
+    def __init__(self, table: str, columns: list = None):
+        self.table = table
+        self.columns = tuple(columns) if columns else ('*',)
+        self._conditions = []
+        self._group_by = ()
+        self._order_by = ()
+        self._limit = None
+
+    def where(self, **conditions):
+        """ Условия равенства, объединяются через AND. ex. .where(user_id=1, status='WORK') """
+        for column, value in conditions.items():
+            self.where_op(column, '=', value)
+        return self
+
+    def where_op(self, column: str, operator: str, value):
+        """ Условие с оператором из QUERY_OPERATORS. ex. .where_op('id', '<', 100) """
+        operator = operator.upper()
+        if operator not in QUERY_OPERATORS:
+            raise ValueError(f"unsupported operator: {operator}")
+        if operator in ('IN', 'NOT IN'):
+            value = tuple(value)
+        self._conditions.append((column, operator, value))
+        return self
+
+    def group_by(self, *columns):
+        self._group_by = columns
+        return self
+
+    def order_by(self, *columns):
+        """ ex. .order_by('date_register DESC', 'id DESC') """
+        self._order_by = columns
+        return self
+
+    def limit(self, limit: int):
+        self._limit = int(limit)
+        return self
+
+    def build(self) -> tuple:
+        """ :return: (текст SQL, параметры) """
+        condition_shape = []
+        params = []
+        for column, operator, value in self._conditions:
+            if operator in ('IN', 'NOT IN'):
+                condition_shape.append((column, operator, len(value)))
+                params.extend(value)
+            else:
+                condition_shape.append((column, operator, 1))
+                params.append(value)
+        if self._limit is not None:
+            params.append(self._limit)
+
+        sql_query = _build_select_sql(self.table, self.columns, tuple(condition_shape),
+                                      self._group_by, self._order_by, self._limit is not None)
+        return sql_query, tuple(params)
+
+
+# Выделенные потоки БД: по одному на каждое соединение пула (писатель + читатели)
+_db_executor = ThreadPoolExecutor(max_workers=READERS_IN_POOL + 1, thread_name_prefix='inspira-db')
+
+
+class GroupCommitQueue:
+    """
+        Write-behind очередь с групповой фиксацией.
+        Мутации, пришедшие в пределах окна window_ms, выполняются одной транзакцией
+        (каждая – в своём SAVEPOINT), и future каждого вызывающего разрешается
+        только после COMMIT всей пачки: захват писателя и запись WAL – одни на пачку.
+        Разрешённый future означает COMMIT, а не сохранность на диске: при synchronous=NORMAL
+        пачка переживает падение процесса, но может потеряться при отключении питания до checkpoint.
+    """
+    def __init__(self, pool: ConnectionPool, window_ms: float, max_batch: int):
+        self.pool = pool
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = asyncio.Queue()
+        self._loop = None
+        self._worker = None
+
+    async def submit(self, func, *args, **kwargs):
+        # воркер перезапускается на той же очереди: поставленные ранее вызовы не теряются
+        if self._worker is None or self._worker.done():
+            loop = asyncio.get_running_loop()
+            if self._loop is not loop and self._queue.empty():
+                # очередь asyncio привязана к циклу событий, а остановленный воркер уже завершил её вызовы
+                self._queue = asyncio.Queue()
+            self._loop = loop
+            self._worker = asyncio.create_task(self.__run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((functools.partial(func, *args, **kwargs), future))
+        return await future
+
+    async def __collect_batch(self, batch: list):
+        loop = asyncio.get_running_loop()
+        batch.append(await self._queue.get())
+        deadline = loop.time() + self.window
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def __run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = []
+                await self.__collect_batch(batch)
+                results = await loop.run_in_executor(_db_executor, self.__commit_batch, [call for call, _ in batch])
+
+                for (_, future), (success, value) in zip(batch, results):
+                    if future.done():
+                        continue
+                    if success:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+        finally:
+            # воркер остановлен (отмена при завершении бота или ошибка): вызывающие не должны ждать вечно
+            self.__fail_pending(batch)
+
+    def __fail_pending(self, batch: list):
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(RuntimeError("group commit worker is stopped, mutation result is unknown"))
+
+    def __commit_batch(self, calls: list) -> list:
+        results = []
+        try:
+            with self.pool.writer():
+                for call in calls:
+                    try:
+                        with self.pool.writer():
+                            results.append((True, call()))
+                    except Exception as mutation_error:
+                        results.append((False, mutation_error))
+        except Exception as commit_error:
+            tracer_l.tracer_charge(
+                "ERROR", 0,
+                f"{__name__} -> GroupCommitQueue",
+                f"batch of {len(calls)} mutations is not committed", f"{commit_error}")
+            return [(False, commit_error)] * len(calls)
+
+        if DEBUG and len(calls) > 1:
+            print(f"GroupCommitQueue -> {len(calls)} mutations in one transaction")
+        return results
+
+
+_group_commit_queues = {}
+
+
+def get_group_commit_queue(pool: ConnectionPool) -> GroupCommitQueue:
+    if pool.db_name not in _group_commit_queues:
+        _group_commit_queues[pool.db_name] = GroupCommitQueue(
+            pool, GROUP_COMMIT['window_ms'], GROUP_COMMIT['max_batch'])
+    return _group_commit_queues[pool.db_name]
+
+
+class AsyncManagerProxy:
+    """
+        Awaitable-версия любого менеджера. Каждый метод выполняется в выделенных потоках БД,
+        поэтому обращение к SQLite не блокирует event loop aiogram.
+        Методы из GROUP_COMMIT_METHODS менеджера при включенном GROUP_COMMIT
+        проходят через очередь групповой фиксации.
+        ex. await UserManager(INSPIRA_DB).aio.get_phone(user_id)
+    """
+    def __init__(self, manager):
+        self._manager = manager
+
+    def __getattr__(self, name):
+        method = getattr(self._manager, name)
+        if not callable(method):
+            raise AttributeError(f"'{type(self._manager).__name__}.{name}' is not callable")
+
+        if GROUP_COMMIT['enabled'] and name in self._manager.GROUP_COMMIT_METHODS:
+            async def call(*args, **kwargs):
+                return await get_group_commit_queue(self._manager.pool).submit(method, *args, **kwargs)
+
+            call.__name__ = name
+            return call
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_db_executor, functools.partial(method, *args, **kwargs))
+
+        call.__name__ = name
+        return call
+
+
 class DataBaseManager:
+    # Мутации, которые можно отложить в очередь групповой фиксации (см. GroupCommitQueue)
+    GROUP_COMMIT_METHODS = frozenset({'add_record'})
+
     def __init__(self, db_name):
         self.db_name = db_name
+        self.pool = get_connection_pool(db_name)
+
+    @property
+    def aio(self) -> AsyncManagerProxy:
+        """ Awaitable-версии всех методов менеджера """
+        return AsyncManagerProxy(self)
+
+    @asynccontextmanager
+    async def _connect_async(self):
+        """ Отдельное aiosqlite-соединение с тем же профилем PRAGMA, что и у пула """
+        async with aiosqlite.connect(self.db_name) as conn:
+            for statement in build_pragma_statements(SQLITE_PROFILE, with_journal_mode=False):
+                await conn.execute(statement)
+            yield conn
+
+    def get_sqlite_profile_report(self) -> str:
+        """ Действующие PRAGMA соединений пула для отображения администратору """
+        report = f"SQLite {sqlite3.sqlite_version} ({self.db_name})\n"
+        for pragma, (writer_value, reader_value) in self.pool.get_pragma_values().items():
+            if writer_value == reader_value:
+                report += f"{pragma} = {writer_value}\n"
+            else:
+                report += f"{pragma} = {writer_value} (ro: {reader_value})\n"
+        return report
+
+    def _fetch_one(self, query, params: tuple = ()):
+        """ :param query: текст SQL или Query """
+        if isinstance(query, Query):
+            query, params = query.build()
+        with self.pool.reader() as conn:
+            cursor = conn.execute(query, params)
+            try:
+                return cursor.fetchone()
+            finally:
+                cursor.close()
+
+    def _fetch_all(self, query, params: tuple = ()) -> list:
+        """ :param query: текст SQL или Query """
+        if isinstance(query, Query):
+            query, params = query.build()
+        with self.pool.reader() as conn:
+            cursor = conn.execute(query, params)
+            try:
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+    def _execute(self, query: str, params: tuple = ()) -> int:
+        """ Выполнение изменяющего запроса на пишущем соединении. Возвращает число затронутых строк """
+        with self.pool.writer() as conn:
+            cursor = conn.execute(query, params)
+            try:
+                return cursor.rowcount
+            finally:
+                cursor.close()
 
     @staticmethod
     def _sql_query_response_to_list(list_to_convert) -> list:
@@ -148,48 +1023,54 @@ class DataBaseManager:
         return result
 
     def __check_table_for_exists(self, table_name) -> bool:
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-        result = cursor.fetchone()
-        conn.close()
+        result = self._fetch_one(Query('sqlite_master', ['name']).where(type='table', name=table_name))
 
         return result is not None
 
-    def create_table(self, table_name: str, fields: list):
+    def __get_existing_indexes(self, table_name) -> set:
+        query = Query('sqlite_master', ['name']).where(type='index', tbl_name=table_name)
+        return set(self._sql_query_response_to_list(self._fetch_all(query)))
+
+    def create_indexes(self, table_name: str, indexes: list):
+        """
+            Создание недостающих индексов таблицы.
+            :param table_name: Название таблицы
+            :param indexes: Список описаний индексов, ex. INDEXES_FOR_USERS
+        """
+        existing_indexes = self.__get_existing_indexes(table_name)
+
+        for index in indexes:
+            if index['name'] in existing_indexes:
+                continue
+
+            with self.pool.writer() as conn:
+                create_index_on_connection(conn, table_name, index)
+
+            print(f"---- INDEX ({index['name']}) on TABLE ({table_name}) [ CREATE ] ----")
+
+    def create_table(self, table_name: str, fields: list, indexes: list = None):
+        self._create_table(table_name, fields)
+        if indexes:
+            self.create_indexes(table_name, indexes)
+
+    def _create_table(self, table_name: str, fields: list):
         if self.__check_table_for_exists(table_name):
             print(f"---- TABLE ({table_name}) in DATABASE ({self.db_name}) [ OK ] ----")
         else:
             print("=*=*=*=*=*=* WARNING =*=*=*=*=*=*")
             print(f"---- CREATE TABLE ({table_name}) in DATABASE ({self.db_name}) [ CREATE ] ----")
             try:
-                __conn = sqlite3.connect(self.db_name)
-                cur = __conn.cursor()
-
-                field_definitions = []
-                for field in fields:
-                    field_name = field['name']
-                    field_type = field['type']
-                    field_definitions.append(f'{field_name} {field_type}')
-
-                field_definitions_str = ', '.join(field_definitions)
-                sql_query = f'CREATE TABLE IF NOT EXISTS {table_name} ({field_definitions_str})'
-
-                cur.execute(sql_query)
-                __conn.commit()
-                __conn.close()
+                self._execute(build_create_table_sql(table_name, fields))
 
                 print("----------- SUCCESS -----------")
                 tracer_l.tracer_charge(
                     "DB", 0,
-                    f"{self.__module__} -> {self.create_table.__name__}",
+                    f"{self.__module__} -> {self._create_table.__name__}",
                     f"success create table – {table_name}")
-                sleep(.25)
             except Exception as db_error:
                 tracer_l.tracer_charge(
                     "DB", 0,
-                    f"{self.__module__} -> {self.create_table.__name__}",
+                    f"{self.__module__} -> {self._create_table.__name__}",
                     "error while trying create table", f"{db_error}")
 
     @templates_status_events.event_handler
@@ -199,23 +1080,20 @@ class DataBaseManager:
             :param table_name: Название таблицы, в которую будет добавлена запись.
             :param data: Словарь. Ключи - имена столбцов, значения - данные для вставки.
         """
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join('?' * len(data))
-        values = tuple(data.values())
-
         if 'date_register' in data and data['date_register'] is None and data['user_status_date_upd'] is None:
             now = datetime.datetime.now()
             date_format = "%d-%m-%Y %H:%M:%S"
             data['date_register'] = now.strftime(date_format)
             data['user_status_date_upd'] = now.strftime(date_format)
 
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        data = with_timestamps(table_name, data)
+
+        columns = ', '.join(data.keys())
+        placeholders = ', '.join('?' * len(data))
+        values = tuple(data.values())
 
         query = f'INSERT INTO {table_name} ({columns}) VALUES ({placeholders})'
-        cursor.execute(query, values)
-        conn.commit()
-        conn.close()
+        self._execute(query, values)
 
         if DEBUG:
             print(f"\nDataBaseManager -> add_record to table '{table_name}'")
@@ -223,33 +1101,363 @@ class DataBaseManager:
             print(f"values: {values}")
 
     @templates_status_events.event_handler
-    def find_by_condition(self, table_name: str, condition: str = None):
+    def find_by_condition(self, table_name: str, conditions: dict = None):
         """
         Метод поиска записей по условию в указанной таблице.
         :param table_name: Название таблицы, в которой будет происходить поиск.
-        :param condition: Условие поиска (строка SQL). Например, "user_id = 123"
+        :param conditions: Условия равенства (значения передаются параметрами). Например, {"user_id": 123}
         :return: Список найденных записей (список кортежей).
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        query = Query(table_name).where(**(conditions or {}))
 
-        query = f'SELECT * FROM {table_name}'
-        if condition:
-            query += f' WHERE {condition}'
-
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.close()
+        results = self._fetch_all(query)
 
         if DEBUG:
             print(f"\nDatabaseManager -> find_by_condition in table '{table_name}'")
-            print(f"query: {query}")
+            print(f"query: {query.build()}")
             print(f"results: {results}")
 
         return results
 
 
+SCHEMA_VERSION_TABLE_NAME = 'schema_version'
+
+# Версионные миграции схемы. Каждая версия применяется ровно один раз и в порядке возрастания.
+# Изменения схемы добавляются только новой версией в конец списка, уже выпущенные версии не редактируются.
+# FIELDS_FOR_*/INDEXES_FOR_* описывают текущую схему и меняются вместе с ней: версия, таблицу которой
+# позднее изменили (add_column, create_indexes), хранит литеральную копию схемы на момент своего выпуска.
+# Операции:
+#   ('create_table', table_name, fields)    – создать таблицу, если её нет
+#   ('create_indexes', table_name, indexes) – создать недостающие индексы
+#   ('add_column', table_name, field)       – добавить колонку, если её нет
+#   ('sql', query)                          – произвольный SQL
+#   ('python', func)                        – func(conn), ex. заполнение новых колонок
+MIGRATIONS = [
+    {
+        'version': 1,
+        'description': 'base tables and indexes',
+        'operations': [
+            ('create_table', USERS_TABLE_NAME, [
+                {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+                {'name': 'user_id', 'type': 'INTEGER'},
+                {'name': 'fullname', 'type': 'TEXT'},
+                {'name': 'phone', 'type': 'TEXT'},
+                {'name': 'username', 'type': 'TEXT'},
+                {'name': 'date_register', 'type': 'TEXT'},
+                {'name': 'user_status', 'type': 'BOOL'},
+                {'name': 'user_status_date_upd', 'type': 'TEXT'}
+            ]),
+            ('create_table', PRODUCTS_TABLE_NAME, [
+                {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+                {'name': 'product_id', 'type': 'TEXT'},
+                {'name': 'status', 'type': 'TEXT'},
+                {'name': 'user_id', 'type': 'INTEGER'},
+                {'name': 'group_number', 'type': 'TEXT'},
+                {'name': 'status_update_date', 'type': 'TEXT'}
+            ]),
+            ('create_table', REFERRALS_TABLE_NAME, [
+                {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+                {'name': 'user_id', 'type': 'TEXT'},
+                {'name': 'arrival_id', 'type': 'TEXT'},
+                {'name': 'date_arrival', 'type': 'TEXT'}
+            ]),
+            ('create_table', LIMITED_USERS_TABLE_NAME, [
+                {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+                {'name': 'user_id', 'type': 'INTEGER'},
+                {'name': 'date', 'type': 'TEXT'}
+            ]),
+            ('create_table', ADMINS_TABLE_NAME, [
+                {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+                {'name': 'user_id', 'type': 'INTEGER'},
+                {'name': 'security_clearance', 'type': 'INTEGER'},
+                {'name': 'admin_status', 'type': 'BOOL'}
+            ]),
+            ('create_table', APPOINTMENTS_TABLE_NAME, [
+                {'name': 'appointment_id', 'type': 'INTEGER PRIMARY KEY'},
+                {'name': 'user_id', 'type': 'INTEGER'},
+                {'name': 'service_name', 'type': 'TEXT'},
+                {'name': 'status', 'type': 'BOOL'},
+                {'name': 'date_lesson', 'type': 'TEXT'},
+                {'name': 'time_lesson', 'type': 'TEXT'},
+                {'name': 'date_update', 'type': 'TEXT'}
+            ]),
+            ('create_indexes', USERS_TABLE_NAME, [
+                {'name': 'idx_users_user_id', 'columns': ['user_id'], 'unique': True}
+            ]),
+            ('create_indexes', PRODUCTS_TABLE_NAME, [
+                {'name': 'idx_products_user_id', 'columns': ['user_id'], 'unique': True},
+                {'name': 'idx_products_group_number', 'columns': ['group_number']}
+            ]),
+            ('create_indexes', REFERRALS_TABLE_NAME, [
+                {'name': 'idx_referrals_user_id', 'columns': ['user_id']}
+            ]),
+            ('create_indexes', ADMINS_TABLE_NAME, [
+                {'name': 'idx_admins_user_id', 'columns': ['user_id'], 'unique': True}
+            ]),
+            ('create_indexes', APPOINTMENTS_TABLE_NAME, [
+                {'name': 'idx_appointments_user_id', 'columns': ['user_id']},
+                {'name': 'idx_appointments_lesson', 'columns': ['date_lesson', 'time_lesson']}
+            ]),
+        ]
+    },
+    {
+        'version': 2,
+        'description': 'lesson_slots rollup',
+        'operations': [
+            ('create_table', LESSON_SLOTS_TABLE_NAME, [
+                {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+                {'name': 'date_lesson', 'type': 'TEXT NOT NULL'},
+                {'name': 'time_lesson', 'type': 'TEXT NOT NULL'},
+                {'name': 'service_name', 'type': 'TEXT NOT NULL'},
+                {'name': 'headcount', 'type': 'INTEGER NOT NULL DEFAULT 0'}
+            ]),
+            ('create_indexes', LESSON_SLOTS_TABLE_NAME, [
+                {'name': 'idx_lesson_slots_slot', 'columns': ['date_lesson', 'time_lesson', 'service_name'],
+                 'unique': True}
+            ]),
+            ('sql', f'''
+                INSERT INTO {LESSON_SLOTS_TABLE_NAME} (date_lesson, time_lesson, service_name, headcount)
+                SELECT date_lesson, time_lesson, service_name, COUNT(*) FROM {APPOINTMENTS_TABLE_NAME}
+                WHERE date_lesson IS NOT NULL AND time_lesson IS NOT NULL AND service_name IS NOT NULL
+                GROUP BY date_lesson, time_lesson, service_name
+            '''),
+        ]
+    },
+    {
+        'version': 3,
+        'description': 'products (group_number, status) covering index',
+        'operations': [
+            ('sql', 'DROP INDEX IF EXISTS idx_products_group_number'),
+            ('create_indexes', PRODUCTS_TABLE_NAME, [
+                {'name': 'idx_products_group_status', 'columns': ['group_number', 'status']}
+            ]),
+        ]
+    },
+    {
+        'version': 4,
+        'description': 'users.date_register_ts for the latest users feed',
+        'operations': [
+            ('add_column', USERS_TABLE_NAME, {'name': 'date_register_ts', 'type': 'INTEGER NOT NULL DEFAULT 0'}),
+            ('python', _backfill_date_register_ts),
+            ('create_indexes', USERS_TABLE_NAME, INDEXES_FOR_USERS_REGISTRATION),
+        ]
+    },
+    {
+        'version': 5,
+        'description': 'sortable <date>_ts companions for all date columns',
+        'operations': build_timestamps_migration_operations({
+            USERS_TABLE_NAME: ['date_register', 'user_status_date_upd'],
+            PRODUCTS_TABLE_NAME: ['status_update_date'],
+            REFERRALS_TABLE_NAME: ['date_arrival'],
+            APPOINTMENTS_TABLE_NAME: ['date_lesson', 'date_update'],
+            LIMITED_USERS_TABLE_NAME: ['date'],
+            LESSON_SLOTS_TABLE_NAME: ['date_lesson']
+        })
+    },
+    {
+        'version': 6,
+        'description': 'referrals: legacy table moved, first-touch unique user_id',
+        'operations': [
+            # индекс снимается до переноса: в старых данных у гостя может быть несколько записей
+            ('sql', 'DROP INDEX IF EXISTS idx_referrals_user_id'),
+            ('python', _move_legacy_referrals),
+            ('sql', f'''
+                DELETE FROM {REFERRALS_TABLE_NAME}
+                WHERE id NOT IN (SELECT MIN(id) FROM {REFERRALS_TABLE_NAME} GROUP BY user_id)
+            '''),
+            ('create_indexes', REFERRALS_TABLE_NAME, INDEXES_FOR_REFERRALS),
+        ]
+    },
+    {
+        'version': 7,
+        'description': 'referral_stats daily rollup per source',
+        'operations': [
+            ('create_table', REFERRAL_STATS_TABLE_NAME, FIELDS_FOR_REFERRAL_STATS),
+            ('create_indexes', REFERRAL_STATS_TABLE_NAME, INDEXES_FOR_REFERRAL_STATS),
+            # время подтверждения телефона не хранилось – учитывается на день регистрации гостя
+            ('sql', _backfill_referral_stats_sql(
+                'arrivals', f'SELECT user_id, date_arrival_ts AS ts FROM {REFERRALS_TABLE_NAME}')),
+            ('sql', _backfill_referral_stats_sql(
+                'phone_confirmations',
+                f"SELECT user_id, date_register_ts AS ts FROM {USERS_TABLE_NAME} WHERE phone IS NOT NULL AND phone != ''")),
+            ('sql', _backfill_referral_stats_sql(
+                'lesson_signups', f'SELECT user_id, date_update_ts AS ts FROM {APPOINTMENTS_TABLE_NAME}')),
+            ('sql', _backfill_referral_stats_sql(
+                'products_received',
+                f"SELECT user_id, status_update_date_ts AS ts FROM {PRODUCTS_TABLE_NAME} WHERE status = 'RECEIVED'")),
+        ]
+    },
+    {
+        'version': 8,
+        'description': 'persisted broadcast jobs and recipients',
+        'operations': [
+            ('create_table', BROADCAST_JOBS_TABLE_NAME, FIELDS_FOR_BROADCAST_JOBS),
+            ('create_table', BROADCAST_RECIPIENTS_TABLE_NAME, [
+                {'name': 'id', 'type': 'INTEGER PRIMARY KEY'},
+                {'name': 'job_id', 'type': 'INTEGER NOT NULL'},
+                {'name': 'user_id', 'type': 'INTEGER NOT NULL'},
+                {'name': 'status', 'type': 'TEXT NOT NULL'},
+                {'name': 'updated_ts', 'type': 'INTEGER'}
+            ]),
+            ('create_indexes', BROADCAST_JOBS_TABLE_NAME, INDEXES_FOR_BROADCAST_JOBS),
+            ('create_indexes', BROADCAST_RECIPIENTS_TABLE_NAME, INDEXES_FOR_BROADCAST_RECIPIENTS),
+        ]
+    },
+    {
+        'version': 9,
+        'description': 'unreachable users and broadcast failure reasons',
+        'operations': [
+            ('create_table', UNREACHABLE_USERS_TABLE_NAME, FIELDS_FOR_UNREACHABLE_USERS),
+            ('add_column', BROADCAST_RECIPIENTS_TABLE_NAME, {'name': 'failure_reason', 'type': 'TEXT'}),
+        ]
+    },
+    {
+        'version': 10,
+        'description': 'persistent outbound message queue',
+        'operations': [
+            ('create_table', OUTBOX_TABLE_NAME, FIELDS_FOR_OUTBOX),
+            ('create_indexes', OUTBOX_TABLE_NAME, INDEXES_FOR_OUTBOX),
+        ]
+    },
+    {
+        'version': 11,
+        'description': 'scheduled jobs run history',
+        'operations': [
+            ('create_table', SCHEDULED_JOBS_TABLE_NAME, FIELDS_FOR_SCHEDULED_JOBS),
+            ('create_indexes', SCHEDULED_JOBS_TABLE_NAME, INDEXES_FOR_SCHEDULED_JOBS),
+        ]
+    },
+    {
+        'version': 12,
+        'description': 'daily stats counters',
+        'operations': [
+            ('create_table', DAILY_STATS_TABLE_NAME, FIELDS_FOR_DAILY_STATS),
+            ('create_indexes', DAILY_STATS_TABLE_NAME, INDEXES_FOR_DAILY_STATS),
+            # история переходов статусов и отмен не хранилась: изделия учитываются по текущему статусу,
+            # телефоны – на день регистрации гостя, отмены начинают считаться с этой версии
+            ('sql', _backfill_daily_stats_sql('new_users', f'SELECT date_register_ts AS ts FROM {USERS_TABLE_NAME}')),
+            ('sql', _backfill_daily_stats_sql(
+                'phone_confirmations',
+                f"SELECT date_register_ts AS ts FROM {USERS_TABLE_NAME} WHERE phone IS NOT NULL AND phone != ''")),
+            ('sql', _backfill_daily_stats_sql(
+                'lesson_signups', f'SELECT date_update_ts AS ts FROM {APPOINTMENTS_TABLE_NAME}')),
+            *(('sql', _backfill_daily_stats_sql(
+                counter, f"SELECT status_update_date_ts AS ts FROM {PRODUCTS_TABLE_NAME} WHERE status = '{status}'"))
+              for status, counter in PRODUCT_STATUS_COUNTERS.items()),
+            ('sql', _backfill_daily_stats_sql('bans', f'SELECT date_ts AS ts FROM {LIMITED_USERS_TABLE_NAME}')),
+        ]
+    },
+    {
+        'version': 13,
+        'description': 'lesson_slots recount: guests removed from a lesson stay in the slot',
+        'operations': [
+            # v2 пропускал записи со service_name = NULL, а снятие с занятия уменьшало счётчик,
+            # хотя строка appointments остаётся: свёртка пересчитывается по строкам appointments
+            ('sql', f'DELETE FROM {LESSON_SLOTS_TABLE_NAME}'),
+            ('sql', f'''
+                INSERT INTO {LESSON_SLOTS_TABLE_NAME} (date_lesson, time_lesson, service_name, headcount, date_lesson_ts)
+                SELECT date_lesson, time_lesson, COALESCE(service_name, ''), COUNT(*), MAX(date_lesson_ts)
+                FROM {APPOINTMENTS_TABLE_NAME}
+                WHERE date_lesson IS NOT NULL AND time_lesson IS NOT NULL
+                GROUP BY date_lesson, time_lesson, COALESCE(service_name, '')
+            '''),
+        ]
+    },
+]
+
+
+class SchemaMigrator(DataBaseManager):
+    """
+        Применение версионных миграций схемы.
+        Текущая версия хранится в таблице schema_version. Проверка и все ожидающие шаги
+        выполняются в одной транзакции на пишущем соединении пула: при ошибке схема
+        остаётся на прежней версии целиком.
+    """
+    @staticmethod
+    def __column_exists(conn: sqlite3.Connection, table_name: str, column_name: str) -> bool:
+        columns = conn.execute(f'PRAGMA table_info({table_name})').fetchall()
+        return any(column[1] == column_name for column in columns)
+
+    def __apply_operation(self, conn: sqlite3.Connection, operation: tuple):
+        kind = operation[0]
+
+        if kind == 'create_table':
+            conn.execute(build_create_table_sql(operation[1], operation[2]))
+        elif kind == 'create_indexes':
+            for index in operation[2]:
+                create_index_on_connection(conn, operation[1], index)
+        elif kind == 'add_column':
+            table_name, field = operation[1], operation[2]
+            if not self.__column_exists(conn, table_name, field['name']):
+                conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {field['name']} {field['type']}")
+        elif kind == 'sql':
+            conn.execute(operation[1])
+        elif kind == 'python':
+            operation[1](conn)
+        else:
+            raise ValueError(f"unknown migration operation: {kind}")
+
+    def get_schema_version(self) -> int:
+        if self._fetch_one(Query('sqlite_master', ['name']).where(type='table', name=SCHEMA_VERSION_TABLE_NAME)) is None:
+            return 0
+        return self._fetch_one(Query(SCHEMA_VERSION_TABLE_NAME, ['COALESCE(MAX(version), 0)']))[0]
+
+    def migrate(self, migrations: list = None) -> int:
+        """
+            Приведение схемы к последней версии.
+            :param migrations: список миграций, по умолчанию MIGRATIONS
+            :return: версия схемы после применения
+        """
+        migrations = sorted(MIGRATIONS if migrations is None else migrations, key=lambda m: m['version'])
+
+        try:
+            with self.pool.writer(immediate=True) as conn:
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE_NAME} '
+                             f'(version INTEGER PRIMARY KEY, description TEXT, applied_date TEXT)')
+                current_version = conn.execute(
+                    f'SELECT COALESCE(MAX(version), 0) FROM {SCHEMA_VERSION_TABLE_NAME}').fetchone()[0]
+
+                pending = [migration for migration in migrations if migration['version'] > current_version]
+                for migration in pending:
+                    for operation in migration['operations']:
+                        self.__apply_operation(conn, operation)
+                    conn.execute(
+                        f'INSERT INTO {SCHEMA_VERSION_TABLE_NAME} (version, description, applied_date) VALUES (?, ?, ?)',
+                        (migration['version'], migration['description'], get_format_date()))
+                    print(f"---- MIGRATION v{migration['version']} ({migration['description']}) [ APPLY ] ----")
+        except Exception as db_error:
+            tracer_l.tracer_charge(
+                "CRITICAL", 0,
+                f"{self.__module__} -> {self.migrate.__name__}",
+                "error while applying schema migrations", f"{db_error}")
+            raise
+
+        schema_version = pending[-1]['version'] if pending else current_version
+        print(f"---- SCHEMA of DATABASE ({self.db_name}) v{schema_version} [ OK ] ----")
+        if pending:
+            tracer_l.tracer_charge(
+                "DB", 0,
+                f"{self.__module__} -> {self.migrate.__name__}",
+                f"schema migrated from v{current_version} to v{schema_version}")
+
+        return schema_version
+
+
 class ProductManager(DataBaseManager):
+    GROUP_COMMIT_METHODS = DataBaseManager.GROUP_COMMIT_METHODS | {
+        'update_user_group', 'update_product_id', 'update_product_status'}
+
+    @staticmethod
+    def __get_status_on_connection(conn: sqlite3.Connection, user_id: int):
+        """ :return: (status,) изделия гостя или None, если у гостя нет изделия """
+        return conn.execute(*Query(PRODUCTS_TABLE_NAME, ['status']).where(user_id=user_id).build()).fetchone()
+
+    @staticmethod
+    def __count_status_transition(conn: sqlite3.Connection, previous_status, new_status: str):
+        """ Счётчик дня учитывает только смену статуса существующего изделия """
+        if previous_status and previous_status[0] != new_status and new_status in PRODUCT_STATUS_COUNTERS:
+            increment_daily_stats(conn, PRODUCT_STATUS_COUNTERS[new_status])
+
     @templates_status_events.event_handler
     def update_user_group(self, user_id: int, group_number: str, initial_status: str):
         """
@@ -258,22 +1466,19 @@ class ProductManager(DataBaseManager):
         :param group_number: Новый номер группы, который нужно установить.
         :param initial_status: Начальный статус пользователя, по умолчанию "в процессе".
         """
-        print(f"Connecting to database: {self.db_name}")
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-
             now = datetime.datetime.now()
             status_update_date = now.strftime("%d-%m-%Y %H:%M:%S")
 
             query = '''
                 UPDATE products
-                SET group_number = ?, status = ?, status_update_date = ?
+                SET group_number = ?, status = ?, status_update_date = ?, status_update_date_ts = ?
                 WHERE user_id = ?
             '''
-            cursor.execute(query, (group_number, initial_status, status_update_date, user_id))
-            conn.commit()
-            conn.close()
+            with self.pool.writer() as conn:
+                previous_status = self.__get_status_on_connection(conn, user_id)
+                conn.execute(query, (group_number, initial_status, status_update_date, to_timestamp(status_update_date), user_id))
+                self.__count_status_transition(conn, previous_status, initial_status)
 
             if DEBUG:
                 print(f"User {user_id} group updated to '{group_number}' and status set to '{initial_status}' "
@@ -290,22 +1495,16 @@ class ProductManager(DataBaseManager):
             :param user_id: ID пользователя, чье изделие нужно обновить.
             :param product_id: Уникальный номер изделия.
         """
-        print(f"Connecting to database: {self.db_name}")
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-
             now = datetime.datetime.now()
             status_update_date = now.strftime("%d-%m-%Y %H:%M:%S")
 
             query = '''
                 UPDATE products
-                SET product_id = ?, status_update_date = ?
+                SET product_id = ?, status_update_date = ?, status_update_date_ts = ?
                 WHERE user_id = ?
             '''
-            cursor.execute(query, (product_id, status_update_date, user_id))
-            conn.commit()
-            conn.close()
+            self._execute(query, (product_id, status_update_date, to_timestamp(status_update_date), user_id))
 
             if DEBUG:
                 print(f"SET product_id {product_id}  for {user_id}: OK")
@@ -322,20 +1521,21 @@ class ProductManager(DataBaseManager):
         :param new_status: Новый статус, который нужно установить.
         """
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-
             now = datetime.datetime.now()
             status_update_date = now.strftime("%d-%m-%Y %H:%M:%S")
 
             query = '''
                     UPDATE products
-                    SET status = ?, status_update_date = ?
+                    SET status = ?, status_update_date = ?, status_update_date_ts = ?
                     WHERE user_id = ?
                 '''
-            cursor.execute(query, (new_status, status_update_date, user_id))
-            conn.commit()
-            conn.close()
+            with self.pool.writer() as conn:
+                previous_status = self.__get_status_on_connection(conn, user_id)
+                conn.execute(query, (new_status, status_update_date, to_timestamp(status_update_date), user_id))
+                self.__count_status_transition(conn, previous_status, new_status)
+
+                if new_status == 'RECEIVED' and previous_status and previous_status[0] != 'RECEIVED':
+                    increment_referral_stats(conn, user_id, 'products_received')
 
             print(f"User {user_id} status updated to '{new_status}' at {status_update_date}")
             return True
@@ -352,15 +1552,8 @@ class ProductManager(DataBaseManager):
             :param user_id: уникальный идентификатор пользователя
             :return: статус изделия – НЕ НАЧАТ, В ПРОЦЕССЕ, ГОТОВО, ПОЛУЧЕНО
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        query = f'SELECT status FROM {PRODUCTS_TABLE_NAME}'
-        query += f' WHERE user_id = {user_id}'
-
-        cursor.execute(query)
-        status = cursor.fetchone()[0]
-        conn.close()
+        query = Query(PRODUCTS_TABLE_NAME, ['status']).where(user_id=user_id)
+        status = self._fetch_one(query)[0]
 
         return status
 
@@ -370,20 +1563,60 @@ class ProductManager(DataBaseManager):
             Получение списка всех уникальных групп из БД.
             :return: список всех уникальных сохраненных групп.
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        query = Query(PRODUCTS_TABLE_NAME, ['group_number']).where_op('group_number', 'IS NOT', None)
+        all_groups = self._fetch_all(query.group_by('group_number').order_by('group_number'))
+
+        return self._sql_query_response_to_list(all_groups)
+
+    @templates_status_events.event_handler
+    def get_groups_page(self, after: str = None, before: str = None, limit: int = 20) -> tuple:
+        """
+            Страница списка групп по ключу (keyset): читаются только группы этой страницы.
+            Группы упорядочены по номеру, курсор – номер крайней группы соседней страницы.
+            :param after: номер последней группы предыдущей страницы (листаем вперёд)
+            :param before: номер первой группы следующей страницы (листаем назад)
+            :param limit: количество групп на странице
+            :return: (список групп, есть ли ещё группы в направлении листания);
+                группа – {'group_number', 'members', 'statuses': {статус изделия: количество}}
+        """
+        if before is not None:
+            page_condition, page_order, cursor = 'group_number < ?', 'DESC', before
+        else:
+            page_condition, page_order, cursor = 'group_number > ?', 'ASC', after
 
-        query = f'SELECT * FROM {PRODUCTS_TABLE_NAME}'
-        all_groups = cursor.execute(query).fetchall()
-        conn.close()
+        if cursor is None:
+            page_condition = 'group_number IS NOT NULL'
 
-        unique_groups = set()
+        query = f'''
+            WITH page AS (
+                SELECT group_number FROM {PRODUCTS_TABLE_NAME}
+                WHERE {page_condition}
+                GROUP BY group_number
+                ORDER BY group_number {page_order}
+                LIMIT ?
+            )
+            SELECT p.group_number, p.status, COUNT(*)
+            FROM {PRODUCTS_TABLE_NAME} AS p
+            JOIN page ON page.group_number = p.group_number
+            GROUP BY p.group_number, p.status
+            ORDER BY p.group_number
+        '''
+        params = (limit + 1,) if cursor is None else (cursor, limit + 1)
 
-        for group in all_groups:
-            if group[4] is not None:
-                unique_groups.add(group[4])
+        groups = {}
+        for group_number, status, members in self._fetch_all(query, params):
+            group = groups.setdefault(group_number, {'group_number': group_number, 'members': 0, 'statuses': {}})
+            group['members'] += members
+            group['statuses'][status] = members
 
-        return list(unique_groups)
+        groups_page = list(groups.values())
+        has_more = len(groups_page) > limit
+
+        if has_more:
+            # лишняя (limit + 1) группа лежит за краем страницы в направлении листания
+            groups_page = groups_page[1:] if before is not None else groups_page[:limit]
+
+        return groups_page, has_more
 
     @templates_status_events.event_handler
     def get_group(self, user_id: int):
@@ -392,14 +1625,8 @@ class ProductManager(DataBaseManager):
             :param user_id: уникальный идентификатор пользователя
             :return: номер группы
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        query = f'SELECT group_number FROM {PRODUCTS_TABLE_NAME} WHERE user_id = ?'
-        cursor.execute(query, (user_id,))
-
-        group_number = cursor.fetchone()[0]
-        conn.close()
+        query = Query(PRODUCTS_TABLE_NAME, ['group_number']).where(user_id=user_id)
+        group_number = self._fetch_one(query)[0]
 
         return group_number
 
@@ -410,19 +1637,30 @@ class ProductManager(DataBaseManager):
             :param group_number: номер группы
             :return: список всех пользователей одной группы
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        query = f'SELECT user_id FROM {PRODUCTS_TABLE_NAME} WHERE group_number = ?'
-        cursor.execute(query, (group_number,))
+        query = Query(PRODUCTS_TABLE_NAME, ['user_id']).where(group_number=group_number)
+        list_users_data = self._fetch_all(query)
 
-        list_users_data = cursor.fetchall()
-
-        conn.close()
         list_users_data = [item[0] for item in list_users_data]
 
         return list_users_data
 
+    @templates_status_events.event_handler
+    def get_group_members(self, group_number: str) -> list:
+        """
+            Все гости группы вместе с контактами – одним запросом (JOIN users).
+            :param group_number: номер группы
+            :return: список (user_id, контакт гостя), ex. [(123, 'Анна – +79998887766')]
+        """
+        query = f'''
+            SELECT p.user_id, u.fullname, u.phone
+            FROM {PRODUCTS_TABLE_NAME} AS p
+            LEFT JOIN {USERS_TABLE_NAME} AS u ON u.user_id = p.user_id
+            WHERE p.group_number = ?
+            ORDER BY p.id
+        '''
+        return [(user_id, format_contact_info(fullname, phone))
+                for user_id, fullname, phone in self._fetch_all(query, (group_number,))]
+
     @templates_status_events.event_handler
     def get_user_product_card(self, user_id: int) -> dict:
         """
@@ -434,14 +1672,8 @@ class ProductManager(DataBaseManager):
         :param user_id: уникальный идентификатор пользователя
         :return: словарь вышеперечисленных данных
         """
-        # Используем контекстный менеджер для автоматического закрытия соединения
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-
-            query = f'SELECT product_id, status, group_number, status_update_date FROM {PRODUCTS_TABLE_NAME} WHERE user_id = ?'
-            cursor.execute(query, (user_id,))
-
-            list_users_data = cursor.fetchone()
+        query = Query(PRODUCTS_TABLE_NAME, ['product_id', 'status', 'group_number', 'status_update_date'])
+        list_users_data = self._fetch_one(query.where(user_id=user_id))
 
         if list_users_data is None:
             return {
@@ -479,19 +1711,141 @@ class ProductManager(DataBaseManager):
             :param user_id: уникальный идентификатор пользователя
             :return: номер изделия
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        query = Query(PRODUCTS_TABLE_NAME, ['product_id']).where(user_id=user_id)
+        user_product_id = str(self._fetch_one(query))
 
-        query = f'SELECT product_id FROM {PRODUCTS_TABLE_NAME} WHERE user_id = ?'
-        cursor.execute(query, (user_id,))
+        return user_product_id[0]
 
-        user_product_id = str(cursor.fetchone())
-        conn.close()
 
-        return user_product_id[0]
+class GuestDossier:
+    """
+        Всё, что админ видит в карточке гостя: профиль, изделие, последняя запись на занятие
+        и отметка о блокировке. Собирается одним запросом UserManager.get_guest_dossier
+    """
+    __slots__ = (
+        'user_id', 'fullname', 'phone', 'username', 'date_register', 'user_status', 'user_status_date_upd',
+        'product_id', 'product_status', 'group_number', 'status_update_date',
+        'service_name', 'date_lesson', 'time_lesson', 'lesson_status',
+        'blocked_date'
+    )
+
+    def __init__(self, row):
+        for field, value in zip(self.__slots__, row):
+            setattr(self, field, value)
+
+    @property
+    def contact_info(self) -> str:
+        return format_contact_info(self.fullname, self.phone)
+
+    @property
+    def is_blocked(self) -> bool:
+        return self.blocked_date is not None
+
+    @property
+    def product_card(self) -> dict:
+        """ Карточка изделия в формате ProductManager.get_user_product_card """
+        if self.product_status is None and self.product_id is None and self.group_number is None:
+            return {
+                'product_id': 'пусто',
+                'product_status': 'пусто',
+                'group_id': 'пусто',
+                'status_update_date': 'пусто'
+            }
+
+        return {
+            'product_id': self.product_id,
+            'product_status': self.product_status,
+            'group_id': self.group_number,
+            'status_update_date': self.status_update_date
+        }
 
 
 class UserManager(DataBaseManager):
+    GROUP_COMMIT_METHODS = DataBaseManager.GROUP_COMMIT_METHODS | {'update_contact_info'}
+
+    # Закэшированное количество пользователей: {имя БД: (количество, момент истечения)}
+    _users_count_cache = {}
+
+    def add_record(self, table_name: str, data: dict):
+        with self.pool.writer() as conn:
+            super().add_record(table_name, data)
+            if table_name == USERS_TABLE_NAME:
+                increment_daily_stats(conn, 'new_users')
+
+        if table_name == USERS_TABLE_NAME:
+            self._users_count_cache.pop(self.db_name, None)
+
+    @templates_status_events.event_handler
+    def get_users_count(self) -> int:
+        """ Количество пользователей. Кэшируется на USERS_COUNT_TTL, сбрасывается при добавлении и удалении """
+        cached = self._users_count_cache.get(self.db_name)
+        if cached and cached[1] > time():
+            return cached[0]
+
+        users_count = self._fetch_one(Query(USERS_TABLE_NAME, ['COUNT(*)']))[0]
+        self._users_count_cache[self.db_name] = (users_count, time() + USERS_COUNT_TTL)
+
+        return users_count
+
+    @templates_status_events.event_handler
+    def get_latest_users(self, limit: int = 20, after: tuple = None, before: tuple = None) -> dict:
+        """
+            Лента последних регистраций по индексу date_register_ts, от новых к старым.
+            Курсор – (date_register_ts, id) крайнего пользователя соседней страницы.
+            :param limit: количество пользователей на странице
+            :param after: курсор последнего пользователя предыдущей страницы (листаем к старым)
+            :param before: курсор первого пользователя следующей страницы (листаем к новым)
+            :return: {'users': [(id, user_id, fullname, username, date_register)],
+                'next': курсор или None, 'prev': курсор или None, 'total': количество пользователей}
+        """
+        columns = 'id, user_id, fullname, username, date_register, date_register_ts'
+        if before is not None:
+            query = f'''
+                SELECT {columns} FROM {USERS_TABLE_NAME}
+                WHERE (date_register_ts, id) > (?, ?)
+                ORDER BY date_register_ts, id
+                LIMIT ?
+            '''
+            rows = self._fetch_all(query, (*before, limit + 1))
+            has_more = len(rows) > limit
+            rows = list(reversed(rows[:limit]))
+            has_newer, has_older = has_more, True
+        else:
+            cursor_condition = 'WHERE (date_register_ts, id) < (?, ?)' if after is not None else ''
+            query = f'''
+                SELECT {columns} FROM {USERS_TABLE_NAME}
+                {cursor_condition}
+                ORDER BY date_register_ts DESC, id DESC
+                LIMIT ?
+            '''
+            rows = self._fetch_all(query, (*(after or ()), limit + 1))
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            has_newer, has_older = after is not None, has_more
+
+        return {
+            'users': [row[:5] for row in rows],
+            'next': (rows[-1][5], rows[-1][0]) if rows and has_older else None,
+            'prev': (rows[0][5], rows[0][0]) if rows and has_newer else None,
+            'total': self.get_users_count()
+        }
+
+    @templates_status_events.event_handler
+    def mark_user_unreachable(self, user_id: int, reason: str):
+        with self.pool.writer() as conn:
+            record_unreachable_user(conn, user_id, reason)
+
+    @templates_status_events.event_handler
+    def mark_user_reachable(self, user_id: int):
+        """ Гость снова написал боту – доставка ему возможна """
+        self._execute(f'DELETE FROM {UNREACHABLE_USERS_TABLE_NAME} WHERE user_id = ?', (user_id,))
+
+    @templates_status_events.event_handler
+    def get_first_registered_user_id(self):
+        query = Query(USERS_TABLE_NAME, ['user_id']).order_by('date_register_ts', 'id').limit(1)
+        first_user = self._fetch_one(query)
+
+        return first_user[0] if first_user else None
 
     @templates_status_events.event_handler
     def check_user_in_database(self, user_id: int):
@@ -500,14 +1854,7 @@ class UserManager(DataBaseManager):
         :param user_id: идентификатор пользователя
         :return:
         """
-        __connect = sqlite3.connect(self.db_name)
-        __cursor = __connect.cursor()
-
-        __cursor.execute(f"SELECT * FROM {USERS_TABLE_NAME} WHERE user_id = ?", (user_id,))
-        result = __cursor.fetchone()
-
-        __cursor.close()
-        __connect.close()
+        result = self._fetch_one(Query(USERS_TABLE_NAME, ['id']).where(user_id=user_id))
 
         if result:
             return True
@@ -525,10 +1872,7 @@ class UserManager(DataBaseManager):
 
     @templates_status_events.event_handler
     def get_user_data(self, user_id: int):
-        __cursor = sqlite3.connect(self.db_name).cursor()
-        __cursor.execute(f"SELECT * FROM {USERS_TABLE_NAME} WHERE user_id = ?", (user_id,))
-
-        find_user = __cursor.fetchone()
+        find_user = self._fetch_one(Query(USERS_TABLE_NAME).where(user_id=user_id))
         print(find_user)
 
         return find_user
@@ -561,36 +1905,63 @@ class UserManager(DataBaseManager):
 
             return result
 
+    @templates_status_events.event_handler
+    def get_guest_dossier(self, user_id: int):
+        """
+            Досье гостя одним запросом: users + products + appointments + limited_users.
+            :param user_id: идентификатор пользователя
+            :return: GuestDossier или None, если гость не зарегистрирован
+        """
+        query = f'''
+            SELECT u.user_id, u.fullname, u.phone, u.username, u.date_register, u.user_status, u.user_status_date_upd,
+                   p.product_id, p.status, p.group_number, p.status_update_date,
+                   a.service_name, a.date_lesson, a.time_lesson, a.status,
+                   l.date
+            FROM {USERS_TABLE_NAME} AS u
+            LEFT JOIN {PRODUCTS_TABLE_NAME} AS p
+                ON p.id = (SELECT MIN(id) FROM {PRODUCTS_TABLE_NAME} WHERE user_id = u.user_id)
+            LEFT JOIN {APPOINTMENTS_TABLE_NAME} AS a
+                ON a.appointment_id = (SELECT MAX(appointment_id) FROM {APPOINTMENTS_TABLE_NAME} WHERE user_id = u.user_id)
+            LEFT JOIN {LIMITED_USERS_TABLE_NAME} AS l ON l.id = u.user_id
+            WHERE u.user_id = ?
+            LIMIT 1
+        '''
+        row = self._fetch_one(query, (user_id,))
+
+        return GuestDossier(row) if row else None
+
+    @staticmethod
+    def get_guest_dossier_for_display(dossier: GuestDossier) -> str:
+        """ Текст карточки гостя для команды /i, в формате get_user_card(user_type='user') """
+        user_status = 'Активен' if dossier.user_status else 'Не активен'
+
+        result = f"Имя: {dossier.fullname}\n"
+        result += f"Телефон: {UserManager.__format_phone(dossier.phone)}\n"
+        result += f"Статус: {user_status}\n\n"
+        result += f"<i>Обновлён {dossier.user_status_date_upd}</i>\n"
+        result += f"Дата регистрации: {dossier.date_register}\n"
+
+        if dossier.date_lesson:
+            result += f"Занятие: {dossier.service_name} {dossier.date_lesson} {dossier.time_lesson}\n"
+
+        return result
+
     @templates_status_events.event_handler
     def read_users_from_db(self):
         """
             Return all data about users from DB.
             return: list()
         """
-        connect = sqlite3.connect(self.db_name)
-        cursor = connect.cursor()
-
-        cursor.execute("SELECT * FROM users")
-        all_users = cursor.fetchall()
-
-        cursor.close()
-        connect.close()
+        all_users = self._fetch_all(Query(USERS_TABLE_NAME))
 
         return all_users
 
     @templates_status_events.event_handler
     def drop_user_from_db(self, _user_id):
-        __connect = sqlite3.connect(self.db_name)
-        __cursor = __connect.cursor()
-
-        __cursor.execute(f"DELETE FROM {USERS_TABLE_NAME} WHERE user_id = ?", (_user_id,))
-        __connect.commit()
-
-        __cursor.execute(f"DELETE FROM {PRODUCTS_TABLE_NAME} WHERE user_id = ?", (_user_id,))
-        __connect.commit()
-
-        __cursor.close()
-        __connect.close()
+        with self.pool.writer() as conn:
+            conn.execute(f"DELETE FROM {USERS_TABLE_NAME} WHERE user_id = ?", (_user_id,))
+            conn.execute(f"DELETE FROM {PRODUCTS_TABLE_NAME} WHERE user_id = ?", (_user_id,))
+        self._users_count_cache.pop(self.db_name, None)
 
     @templates_status_events.event_handler
     def update_user_status(self, user_id: int, new_status: str):
@@ -599,9 +1970,6 @@ class UserManager(DataBaseManager):
         :param user_id: ID пользователя, чей статус нужно обновить.
         :param new_status: Новый статус, который нужно установить.
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
         now = datetime.datetime.now()
         status_update_date = now.strftime("%d-%m-%Y %H:%M:%S")
 
@@ -610,121 +1978,120 @@ class UserManager(DataBaseManager):
             SET status = ?, status_update_date = ?
             WHERE user_id = ?
         '''
-        cursor.execute(query, (new_status, status_update_date, user_id))
-        conn.commit()
-        conn.close()
+        self._execute(query, (new_status, status_update_date, user_id))
 
         print(f"User {user_id} status updated to '{new_status}' at {status_update_date}")
 
     @templates_status_events.event_handler
     def update_contact_info(self, user_id: int, phone: str):
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
         query = '''
             UPDATE users
             SET phone = ?
             WHERE user_id = ?
             '''
 
-        cursor.execute(query, (phone, user_id))
-        conn.commit()
-        conn.close()
+        with self.pool.writer() as conn:
+            phone_query = Query(USERS_TABLE_NAME, ['phone']).where(user_id=user_id)
+            previous_phone = conn.execute(*phone_query.build()).fetchone()
+            conn.execute(query, (phone, user_id))
+
+            # Подтверждением считается первый сохранённый телефон
+            if previous_phone and not previous_phone[0] and phone:
+                increment_referral_stats(conn, user_id, 'phone_confirmations')
+                increment_daily_stats(conn, 'phone_confirmations')
 
         print(f"User {user_id} contact success updated")
 
     @templates_status_events.event_handler
     def get_phone(self, user_id: int):
-        _connect = sqlite3.connect(self.db_name)
-        _cursor = _connect.cursor()
-
-        query = f'SELECT phone FROM {USERS_TABLE_NAME} WHERE user_id = ?'
-        find_phone = _cursor.execute(query, (user_id,)).fetchone()[0]
+        query = Query(USERS_TABLE_NAME, ['phone']).where(user_id=user_id)
+        find_phone = self._fetch_one(query)[0]
 
         if find_phone:
             phone_from_user = self._sql_query_response_to_list(find_phone)
-            _cursor.close()
-            _connect.close()
 
             return phone_from_user
 
     @templates_status_events.event_handler
     def get_user_contact_info(self, user_id: int):
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        query = f'SELECT * FROM {USERS_TABLE_NAME} WHERE user_id = ?'
-        cursor.execute(query, (user_id,))
-
-        user_contact_info = cursor.fetchone()
-        conn.close()
+        query = Query(USERS_TABLE_NAME).where(user_id=user_id)
+        user_contact_info = self._fetch_one(query)
 
-        if user_contact_info[3] is None:
-            phone_from_user = '-'
-        else:
-            phone_from_user = user_contact_info[3]
-
-        user_contact_info_str = f"{user_contact_info[2]} – {phone_from_user}"
+        user_contact_info_str = format_contact_info(user_contact_info[2], user_contact_info[3])
 
         return user_contact_info_str
 
 
 class ReferralArrival(DataBaseManager):
+    GROUP_COMMIT_METHODS = DataBaseManager.GROUP_COMMIT_METHODS | {'check_user_ref'}
+
     @timing_decorator
-    def check_user_ref(self, user_id, id_arrival):
-        __connect = sqlite3.connect(self.db_name)
-        __cursor = __connect.cursor()
-
-        users_in_ref = self.load_user_ref()
-        flag_user_in_ref = False
-        for user_row in users_in_ref:
-            if user_id in user_row:
-                flag_user_in_ref = True
-                break
+    def check_user_ref(self, user_id, id_arrival) -> bool:
+        """
+            Фиксация первого источника перехода гостя. Повторные переходы игнорируются
+            уникальным индексом по user_id – одна индексированная вставка вместо чтения всей таблицы.
+            :return: True, если источник записан впервые
+        """
+        date_arrival = get_format_date()
+        with self.pool.writer() as conn:
+            inserted = conn.execute(
+                f'''
+                    INSERT OR IGNORE INTO {REFERRALS_TABLE_NAME} (user_id, arrival_id, date_arrival, date_arrival_ts)
+                    VALUES (?, ?, ?, ?)
+                ''',
+                (user_id, id_arrival, date_arrival, to_timestamp(date_arrival))).rowcount
 
-        if flag_user_in_ref is False:
-            __cursor.execute(f'INSERT INTO referral (user_id, id_arrival, date) VALUES (?, ?, ?)',
-                             (user_id, id_arrival, get_format_date()))
+            if inserted:
+                increment_referral_stats(conn, user_id, 'arrivals')
 
-        __connect.commit()
-        __connect.close()
+        return inserted > 0
 
     def load_user_ref(self):
-        __connect = sqlite3.connect(self.db_name)
-        __cursor = __connect.cursor()
+        all_referral = self._fetch_all(Query(REFERRALS_TABLE_NAME))
 
-        __cursor.execute("SELECT * FROM referral")
-        all_referral = __cursor.fetchall()
+        return all_referral
 
-        __connect.commit()
-        __connect.close()
+    @templates_status_events.event_handler
+    def get_latest_referrals_records(self, count_refs: int) -> list:
+        """
+            Последние переходы, от новых к старым: читается только count_refs строк индекса date_arrival_ts
+            :return: список (user_id, arrival_id, date_arrival)
+        """
+        query = Query(REFERRALS_TABLE_NAME, ['user_id', 'arrival_id', 'date_arrival'])
+        query.order_by('date_arrival_ts DESC', 'id DESC').limit(count_refs)
 
-        return all_referral
+        return self._fetch_all(query)
 
-    def get_latest_referrals_records(self) -> list:
+    @templates_status_events.event_handler
+    def get_referral_stats(self, days: int) -> list:
         """
-            Выгрузка данных о рефералах
+            Показатели источников за последние days дней (включая сегодня) из свёртки referral_stats.
+            :return: список (arrival_id, переходы, телефоны, записи на занятия, полученные изделия)
         """
-        last_referrals = self.load_user_ref()
-        sorted_refs = sorted(
-            last_referrals,
-            key=lambda x: datetime.datetime.strptime(x[3], "%d.%m.%Y-%H:%M:%S")
-        )
-        return sorted_refs
+        columns = ['arrival_id'] + [f'SUM({counter})' for counter in REFERRAL_STATS_COUNTERS]
+        query = Query(REFERRAL_STATS_TABLE_NAME, columns)
+        query.where_op('day_ts', '>=', start_of_day_timestamp(1 - days))
+        query.group_by('arrival_id').order_by('SUM(arrivals) DESC')
+
+        return self._fetch_all(query)
+
+    def get_referral_stats_formats(self, days: int) -> str:
+        stats = ''
+        for arrival_id, arrivals, phones, signups, received in self.get_referral_stats(days):
+            resource = RESOURCE_DICT.get(arrival_id, f'неизвестный источник {arrival_id}')
+            stats += (f'{resource}\n'
+                      f'переходы {arrivals} • телефоны {phones} • записи {signups} • изделия {received}\n\n')
+
+        return stats
 
     def get_latest_referrals_records_formats(self, count_refs: int) -> str:
         """
             Форматированная выгрузка данных о рефералах
         """
-        referrals = self.get_latest_referrals_records().__reversed__()
-
-        cnt = 0
         refs = ''
-        for ref in referrals:
-            cnt += 1
-            refs += f'{ref[1]} --- {RESOURCE_DICT[ref[2]]} --- {ref[3]}\n'
-            if cnt >= count_refs:
-                break
+        for user_id, arrival_id, date_arrival in self.get_latest_referrals_records(count_refs):
+            resource = RESOURCE_DICT.get(arrival_id, f'неизвестный источник {arrival_id}')
+            refs += f'{user_id} --- {resource} --- {date_arrival}\n'
 
         return refs
 
@@ -734,13 +2101,14 @@ class LimitedUsersManager(DataBaseManager):
     async def block_user(self, command):
         user_block_id = command.split(' ')[1]
 
-        async with aiosqlite.connect(self.db_name) as __conn:
+        async with self._connect_async() as __conn:
             now = datetime.datetime.now()
             formatted_date = now.strftime("%d-%m-%Y")
 
             try:
-                await __conn.execute(f'INSERT INTO {LIMITED_USERS_TABLE_NAME} (id, date) VALUES (?, ?)',
-                                     (user_block_id, formatted_date))
+                await __conn.execute(f'INSERT INTO {LIMITED_USERS_TABLE_NAME} (id, date, date_ts) VALUES (?, ?, ?)',
+                                     (user_block_id, formatted_date, to_timestamp(formatted_date)))
+                await __conn.execute(*build_daily_stats_increment('bans'))
                 await __conn.commit()
             except sqlite3.IntegrityError as e:
                 print("block_user:", e)
@@ -751,8 +2119,8 @@ class LimitedUsersManager(DataBaseManager):
     async def unblock_user(self, command):
         user_unblock_id = command.split(' ')[1]
 
-        async with aiosqlite.connect(self.db_name) as _conn:
-            cursor = await _conn.execute(f"SELECT * FROM {LIMITED_USERS_TABLE_NAME} WHERE id = ?", (user_unblock_id,))
+        async with self._connect_async() as _conn:
+            cursor = await _conn.execute(*Query(LIMITED_USERS_TABLE_NAME).where(id=user_unblock_id).build())
             record = await cursor.fetchone()
 
             if record:
@@ -764,17 +2132,19 @@ class LimitedUsersManager(DataBaseManager):
 
     @timing_decorator
     async def fetch_all_limited_users(self):
-        async with aiosqlite.connect(self.db_name) as _conn:
-            cursor = await _conn.execute(f"SELECT * FROM {LIMITED_USERS_TABLE_NAME}")
+        async with self._connect_async() as _conn:
+            cursor = await _conn.execute(f'''
+                SELECT l.id, u.fullname, u.phone, l.date
+                FROM {LIMITED_USERS_TABLE_NAME} AS l
+                LEFT JOIN {USERS_TABLE_NAME} AS u ON u.user_id = l.id
+            ''')
             records = await cursor.fetchall()
 
-            users_manager = UserManager(INSPIRA_DB)
-
             response = '/// BLACKLIST ///\n\n'
             if records:
-                for record in records:
-                    user_contact = users_manager.get_user_contact_info(record[0])
-                    response += f'{user_contact} от {record[2]}\n'
+                for user_id, fullname, phone, date in records:
+                    user_contact = format_contact_info(fullname, phone)
+                    response += f'{user_contact} от {date}\n'
                 return response
             else:
                 response += "/// EMPTY ///"
@@ -782,8 +2152,8 @@ class LimitedUsersManager(DataBaseManager):
 
     @timing_decorator
     async def check_user_for_block(self, _user_id) -> bool:
-        async with aiosqlite.connect(self.db_name) as _conn:
-            cursor = await _conn.execute(f"SELECT * FROM {LIMITED_USERS_TABLE_NAME} WHERE id = ?", (_user_id,))
+        async with self._connect_async() as _conn:
+            cursor = await _conn.execute(*Query(LIMITED_USERS_TABLE_NAME).where(id=_user_id).build())
             user_in_blacklist = await cursor.fetchone()
             print(user_in_blacklist)
             if user_in_blacklist:
@@ -807,14 +2177,8 @@ class AdminsManager(DataBaseManager):
 
     @templates_status_events.event_handler
     def _get_security_clearance(self, user_id: int):
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        query = f'SELECT security_clearance FROM {ADMINS_TABLE_NAME} WHERE user_id = ?'
-        cursor.execute(query, (user_id,))
-
-        security_clearance = int(cursor.fetchone()[0])
-        conn.close()
+        query = Query(ADMINS_TABLE_NAME, ['security_clearance']).where(user_id=user_id)
+        security_clearance = int(self._fetch_one(query)[0])
 
         return security_clearance
 
@@ -830,49 +2194,331 @@ class AdminsManager(DataBaseManager):
 
     @templates_status_events.event_handler
     def get_administrators_from_db(self):
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        query = f'SELECT user_id FROM {ADMINS_TABLE_NAME} '
-        cursor.execute(query)
-
-        admin_list = self._sql_query_response_to_list(cursor.fetchall())
-        conn.close()
+        admin_list = self._sql_query_response_to_list(self._fetch_all(Query(ADMINS_TABLE_NAME, ['user_id'])))
 
         return admin_list
 
     @templates_status_events.event_handler
-    def get_admin_status(self, admin_id: int):
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+    def get_reachable_administrators(self) -> list:
+        """ Администраторы для рассылки уведомлений: без тех, до кого бот не может достучаться """
+        query = f'''
+            SELECT a.user_id
+            FROM {ADMINS_TABLE_NAME} AS a
+            LEFT JOIN {UNREACHABLE_USERS_TABLE_NAME} AS un ON un.user_id = a.user_id
+            WHERE un.user_id IS NULL
+        '''
+        return self._sql_query_response_to_list(self._fetch_all(query))
 
-        query = f'SELECT admin_status FROM {ADMINS_TABLE_NAME} WHERE user_id = ?'
-        cursor.execute(query, (admin_id,))
+    @templates_status_events.event_handler
+    def get_administrators_with_contacts(self) -> list:
+        """
+            Администраторы вместе с именем и телефоном – одним запросом (JOIN users).
+            :return: список (user_id, имя, телефон); '-' если администратор не найден среди гостей
+        """
+        query = f'''
+            SELECT a.user_id, COALESCE(u.fullname, '-'), COALESCE(u.phone, '-')
+            FROM {ADMINS_TABLE_NAME} AS a
+            LEFT JOIN {USERS_TABLE_NAME} AS u ON u.user_id = a.user_id
+            ORDER BY a.id
+        '''
+        return self._fetch_all(query)
 
-        admin_status = self._sql_query_response_to_list(cursor.fetchone())
+    @templates_status_events.event_handler
+    def get_admin_status(self, admin_id: int):
+        query = Query(ADMINS_TABLE_NAME, ['admin_status']).where(user_id=admin_id)
+        admin_status = self._sql_query_response_to_list(self._fetch_one(query))
         print(admin_status)
-        cursor.close()
-        conn.close()
 
         return admin_status
 
     @templates_status_events.event_handler
     def drop_admin_from_db(self, admin_id: int):
-        __connect = sqlite3.connect(self.db_name)
-        __cursor = __connect.cursor()
+        self._execute(f"DELETE FROM {ADMINS_TABLE_NAME} WHERE user_id = ?", (admin_id,))
+
+
+class BroadcastManager(DataBaseManager):
+    """
+        Задания рассылки. Каждая доставка отмечается отдельно (группируясь в общие транзакции),
+        поэтому после перезапуска рассылка продолжается только по ещё не обработанным получателям.
+    """
+    GROUP_COMMIT_METHODS = DataBaseManager.GROUP_COMMIT_METHODS | {'mark_recipient_delivery'}
+
+    @templates_status_events.event_handler
+    def create_broadcast_job(self, admin_id: int, text: str, parse_mode: str = 'HTML',
+                             include_unreachable: bool = False) -> int:
+        """
+            Новое задание рассылки: получатели – все гости, кроме заблокированных, фиксируются сразу.
+            :param include_unreachable: отправлять и гостям, до которых бот ранее не достучался
+            :return: идентификатор задания
+        """
+        created_date = get_format_date()
+        with self.pool.writer() as conn:
+            job_id = conn.execute(
+                f'''
+                    INSERT INTO {BROADCAST_JOBS_TABLE_NAME} (admin_id, text, parse_mode, status, created_date, created_date_ts)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''',
+                (admin_id, text, parse_mode, BROADCAST_RUNNING, created_date, to_timestamp(created_date))).lastrowid
+
+            total = conn.execute(
+                f'''
+                    INSERT OR IGNORE INTO {BROADCAST_RECIPIENTS_TABLE_NAME} (job_id, user_id, status)
+                    SELECT ?, u.user_id, ?
+                    FROM {USERS_TABLE_NAME} AS u
+                    LEFT JOIN {LIMITED_USERS_TABLE_NAME} AS l ON l.id = u.user_id
+                    LEFT JOIN {UNREACHABLE_USERS_TABLE_NAME} AS un ON un.user_id = u.user_id
+                    WHERE l.id IS NULL AND u.user_id IS NOT NULL AND (? OR un.user_id IS NULL)
+                    ORDER BY u.id
+                ''',
+                (job_id, RECIPIENT_PENDING, include_unreachable)).rowcount
+
+            conn.execute(f'UPDATE {BROADCAST_JOBS_TABLE_NAME} SET total = ? WHERE id = ?', (total, job_id))
+
+        return job_id
+
+    @templates_status_events.event_handler
+    def get_pending_recipients(self, job_id: int) -> list:
+        query = Query(BROADCAST_RECIPIENTS_TABLE_NAME, ['user_id']).where(job_id=job_id, status=RECIPIENT_PENDING)
+        return self._sql_query_response_to_list(self._fetch_all(query.order_by('id')))
+
+    @templates_status_events.event_handler
+    def mark_recipient_delivery(self, job_id: int, user_id: int, failure_reason: str = None):
+        """
+            Отметка доставки получателю и счётчик задания – точка продолжения рассылки.
+            :param failure_reason: None – доставлено, иначе причина недоставки (ex. 'blocked')
+        """
+        status, counter = (RECIPIENT_SENT, 'sent') if failure_reason is None else (RECIPIENT_FAILED, 'failed')
+
+        with self.pool.writer() as conn:
+            updated = conn.execute(
+                f'''
+                    UPDATE {BROADCAST_RECIPIENTS_TABLE_NAME} SET status = ?, updated_ts = ?, failure_reason = ?
+                    WHERE job_id = ? AND user_id = ? AND status = ?
+                ''',
+                (status, int(time()), failure_reason, job_id, user_id, RECIPIENT_PENDING)).rowcount
+            if updated:
+                conn.execute(f'UPDATE {BROADCAST_JOBS_TABLE_NAME} SET {counter} = {counter} + 1 WHERE id = ?', (job_id,))
+            if failure_reason is not None:
+                record_unreachable_user(conn, user_id, failure_reason)
+
+    @templates_status_events.event_handler
+    def finish_broadcast_job(self, job_id: int):
+        query = f'UPDATE {BROADCAST_JOBS_TABLE_NAME} SET status = ?, finished_date_ts = ? WHERE id = ?'
+        self._execute(query, (BROADCAST_DONE, int(time()), job_id))
 
-        __cursor.execute(f"DELETE FROM {ADMINS_TABLE_NAME} WHERE user_id = ?", (admin_id,))
-        __connect.commit()
+    @templates_status_events.event_handler
+    def get_unfinished_broadcast_jobs(self) -> list:
+        """ :return: список (id, admin_id, text, parse_mode) прерванных заданий """
+        query = Query(BROADCAST_JOBS_TABLE_NAME, ['id', 'admin_id', 'text', 'parse_mode'])
+        return self._fetch_all(query.where(status=BROADCAST_RUNNING).order_by('id'))
+
+    @templates_status_events.event_handler
+    def get_broadcast_failures(self, job_ids: list) -> dict:
+        """ :return: {id задания: {причина недоставки: количество}} для заданий job_ids """
+        query = Query(BROADCAST_RECIPIENTS_TABLE_NAME, ['job_id', 'failure_reason', 'COUNT(*)'])
+        query.where_op('job_id', 'IN', job_ids).where(status=RECIPIENT_FAILED)
+        query.group_by('job_id', 'failure_reason').order_by('job_id', 'COUNT(*) DESC')
+
+        failures = {job_id: {} for job_id in job_ids}
+        for job_id, failure_reason, count in self._fetch_all(query):
+            failures[job_id][failure_reason or 'error'] = count
+
+        return failures
+
+    @templates_status_events.event_handler
+    def get_broadcast_progress(self, limit: int = 5) -> list:
+        """ :return: последние задания (id, status, total, sent, failed, created_date), от новых к старым """
+        query = Query(BROADCAST_JOBS_TABLE_NAME, ['id', 'status', 'total', 'sent', 'failed', 'created_date'])
+        return self._fetch_all(query.order_by('id DESC').limit(limit))
+
+
+class OutboxManager(DataBaseManager):
+    """
+        Исходящая очередь сообщений. Обработчик только записывает сообщение и сразу отвечает,
+        отправляют воркеры outbox.py в порядке приоритета. Состояние каждого сообщения хранится в БД,
+        поэтому неотправленное после перезапуска уходит повторно.
+    """
+    GROUP_COMMIT_METHODS = DataBaseManager.GROUP_COMMIT_METHODS | {
+        'enqueue_message', 'enqueue_for_admins', 'mark_message_sent', 'reschedule_message', 'mark_message_failed'}
+
+    @templates_status_events.event_handler
+    def enqueue_message(self, chat_id: int, text: str, priority: int, parse_mode: str = 'HTML',
+                        reply_markup: str = None, photo: bytes = None, photo_filename: str = None) -> int:
+        """
+            :param reply_markup: JSON клавиатуры, ex. markup.as_json()
+            :param photo: содержимое изображения, text в этом случае – подпись к нему
+            :return: идентификатор сообщения в очереди
+        """
+        created_ts = int(time())
+        query = f'''
+            INSERT INTO {OUTBOX_TABLE_NAME}
+                (chat_id, priority, text, parse_mode, reply_markup, photo, photo_filename, status, next_attempt_ts, created_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+        with self.pool.writer() as conn:
+            return conn.execute(query, (chat_id, priority, text, parse_mode, reply_markup, photo, photo_filename,
+                                        OUTBOX_PENDING, created_ts, created_ts)).lastrowid
+
+    @templates_status_events.event_handler
+    def enqueue_for_admins(self, text: str, parse_mode: str = 'HTML', reply_markup: str = None) -> int:
+        """
+            Сообщение каждому администратору, до которого бот может достучаться, – одним INSERT ... SELECT.
+            :return: количество поставленных в очередь сообщений
+        """
+        created_ts = int(time())
+        query = f'''
+            INSERT INTO {OUTBOX_TABLE_NAME}
+                (chat_id, priority, text, parse_mode, reply_markup, status, next_attempt_ts, created_ts)
+            SELECT a.user_id, ?, ?, ?, ?, ?, ?, ?
+            FROM {ADMINS_TABLE_NAME} AS a
+            LEFT JOIN {UNREACHABLE_USERS_TABLE_NAME} AS un ON un.user_id = a.user_id
+            WHERE un.user_id IS NULL
+            ORDER BY a.id
+        '''
+        return self._execute(query, (OUTBOX_PRIORITY_ADMIN, text, parse_mode, reply_markup,
+                                     OUTBOX_PENDING, created_ts, created_ts))
+
+    @templates_status_events.event_handler
+    def claim_next_message(self):
+        """
+            Следующее сообщение к отправке: самый высокий приоритет, затем порядок постановки.
+            Сообщение переводится в SENDING в той же инструкции, поэтому два воркера его не получат.
+            :return: (id, chat_id, priority, text, parse_mode, reply_markup, photo, photo_filename, attempts) или None
+        """
+        query = f'''
+            UPDATE {OUTBOX_TABLE_NAME} SET status = ?, attempts = attempts + 1
+            WHERE id = (
+                SELECT id FROM {OUTBOX_TABLE_NAME}
+                WHERE status = ? AND next_attempt_ts <= ?
+                ORDER BY priority, id
+                LIMIT 1
+            )
+            RETURNING id, chat_id, priority, text, parse_mode, reply_markup, photo, photo_filename, attempts
+        '''
+        with self.pool.writer() as conn:
+            return conn.execute(query, (OUTBOX_SENDING, OUTBOX_PENDING, int(time()))).fetchone()
+
+    @templates_status_events.event_handler
+    def mark_message_sent(self, message_id: int):
+        query = f'UPDATE {OUTBOX_TABLE_NAME} SET status = ?, sent_ts = ?, last_error = NULL WHERE id = ?'
+        self._execute(query, (OUTBOX_SENT, int(time()), message_id))
+
+    @templates_status_events.event_handler
+    def reschedule_message(self, message_id: int, delay: float, error: str, count_attempt: bool = True):
+        """
+            Возврат в очередь после временной ошибки: следующая попытка не раньше чем через delay секунд
+            :param count_attempt: False – попытка не расходует max_attempts, ex. ожидание flood control
+        """
+        query = f'''
+            UPDATE {OUTBOX_TABLE_NAME} SET status = ?, next_attempt_ts = ?, last_error = ?, attempts = attempts - ?
+            WHERE id = ?
+        '''
+        self._execute(query, (OUTBOX_PENDING, int(time() + delay), error, 0 if count_attempt else 1, message_id))
+
+    @templates_status_events.event_handler
+    def mark_message_failed(self, message_id: int, chat_id: int, reason: str, error: str):
+        """ Окончательная недоставка. Недостижимый получатель отмечается в той же транзакции """
+        with self.pool.writer() as conn:
+            conn.execute(f'UPDATE {OUTBOX_TABLE_NAME} SET status = ?, last_error = ? WHERE id = ?',
+                         (OUTBOX_FAILED, error, message_id))
+            record_unreachable_user(conn, chat_id, reason)
+
+    @templates_status_events.event_handler
+    def recover_outbox(self, keep_days: int) -> int:
+        """
+            Подготовка очереди при старте: сообщения, прерванные перезапуском в SENDING, снова ждут отправки
+            (возможен повтор уже доставленного), обработанные старше keep_days дней удаляются.
+            :return: количество возвращённых в очередь сообщений
+        """
+        with self.pool.writer() as conn:
+            requeued = conn.execute(f'UPDATE {OUTBOX_TABLE_NAME} SET status = ? WHERE status = ?',
+                                    (OUTBOX_PENDING, OUTBOX_SENDING)).rowcount
+            conn.execute(f'DELETE FROM {OUTBOX_TABLE_NAME} WHERE status IN (?, ?) AND created_ts < ?',
+                         (OUTBOX_SENT, OUTBOX_FAILED, int(time()) - keep_days * 86400))
+        return requeued
+
+    @templates_status_events.event_handler
+    def get_outbox_summary(self) -> list:
+        """ :return: список (priority, status, количество) для отображения администратору """
+        query = Query(OUTBOX_TABLE_NAME, ['priority', 'status', 'COUNT(*)']).group_by('priority', 'status')
+        return self._fetch_all(query.order_by('priority', 'status'))
+
+
+class ScheduledJobsManager(DataBaseManager):
+    """
+        История запусков заданий планировщика (scheduler.py): по плановому времени последнего
+        запуска после перезапуска бота определяется пропущенный запуск.
+    """
+    @templates_status_events.event_handler
+    def get_job_states(self) -> dict:
+        """ :return: {имя задания: (last_scheduled_ts, last_run_ts, last_duration, last_status, runs, skipped)} """
+        query = Query(SCHEDULED_JOBS_TABLE_NAME, ['name', 'last_scheduled_ts', 'last_run_ts', 'last_duration',
+                                                  'last_status', 'runs', 'skipped'])
+        return {row[0]: tuple(row[1:]) for row in self._fetch_all(query)}
+
+    @templates_status_events.event_handler
+    def record_job_start(self, name: str, scheduled_ts: int, started_ts: int):
+        """ Запуск фиксируется до выполнения: прерванный перезапуском запуск не повторяется """
+        query = f'''
+            INSERT INTO {SCHEDULED_JOBS_TABLE_NAME} (name, last_scheduled_ts, last_run_ts, last_status, runs)
+            VALUES (?, ?, ?, 'RUNNING', 1)
+            ON CONFLICT (name) DO UPDATE SET last_scheduled_ts = excluded.last_scheduled_ts,
+                last_run_ts = excluded.last_run_ts, last_status = excluded.last_status, runs = runs + 1
+        '''
+        self._execute(query, (name, scheduled_ts, started_ts))
+
+    @templates_status_events.event_handler
+    def record_job_finish(self, name: str, duration: float, status: str, error: str = None):
+        query = f'UPDATE {SCHEDULED_JOBS_TABLE_NAME} SET last_duration = ?, last_status = ?, last_error = ? WHERE name = ?'
+        self._execute(query, (duration, status, error, name))
 
-        __cursor.close()
-        __connect.close()
+    @templates_status_events.event_handler
+    def record_job_skip(self, name: str, scheduled_ts: int):
+        """ Запуск пропущен: предыдущие ещё выполняются (ограничение параллельных запусков задания) """
+        query = f'''
+            INSERT INTO {SCHEDULED_JOBS_TABLE_NAME} (name, last_scheduled_ts, skipped) VALUES (?, ?, 1)
+            ON CONFLICT (name) DO UPDATE SET last_scheduled_ts = excluded.last_scheduled_ts, skipped = skipped + 1
+        '''
+        self._execute(query, (name, scheduled_ts))
 
 
 class StatControl(DataBaseManager):
     """
         Осуществляет общее управление и отображение данных о текущих заказах и гостях.
+        Показатели дня ведутся счётчиками daily_stats в момент событий – отчёт не сканирует таблицы.
     """
-    pass
+    DAILY_STATS_LABELS = {
+        'new_users': 'новые гости',
+        'phone_confirmations': 'подтвердили телефон',
+        'lesson_signups': 'записи на занятия',
+        'lesson_cancellations': 'отмены записей',
+        'products_wait': 'изделия в очереди',
+        'products_work': 'изделия в работе',
+        'products_done': 'изделия готовы',
+        'products_received': 'изделия выданы',
+        'bans': 'блокировки'
+    }
+
+    @templates_status_events.event_handler
+    def get_daily_stats(self, days_offset: int = 0) -> dict:
+        """
+            Счётчики дня – одна строка по уникальному индексу day_ts.
+            :param days_offset: 0 – сегодня, -1 – вчера
+            :return: {счётчик: значение}, нули, если событий в этот день не было
+        """
+        query = Query(DAILY_STATS_TABLE_NAME, list(DAILY_STATS_COUNTERS)).where(day_ts=start_of_day_timestamp(days_offset))
+        row = self._fetch_one(query)
+
+        return dict(zip(DAILY_STATS_COUNTERS, row or (0,) * len(DAILY_STATS_COUNTERS)))
+
+    def get_daily_stats_formats(self, days_offset: int = 0) -> str:
+        day = datetime.date.today() + datetime.timedelta(days=days_offset)
+
+        stats = f'<b>Статистика за {day.strftime(DISPLAY_DATE_FORMAT)}</b>\n\n'
+        for counter, value in self.get_daily_stats(days_offset).items():
+            stats += f'{self.DAILY_STATS_LABELS[counter]}: {value}\n'
+
+        return stats
 
 
 class Schedule(DataBaseManager):
@@ -887,13 +2533,11 @@ class Schedule(DataBaseManager):
             :param lesson_date_str: Дата занятия в формате 'дд.мм.гггг'
             :return: True, если занятие актуально (в пределах трех недель), иначе False
         """
-        date_format = '%d.%m.%Y'
-        lesson_date = datetime.datetime.strptime(lesson_date_str, date_format)
+        lesson_date_ts = to_timestamp(lesson_date_str)
+        if lesson_date_ts is None:
+            return False    # Дата не распознана
 
-        current_date = datetime.datetime.now()
-        three_weeks_later = current_date + datetime.timedelta(weeks=3)
-
-        return current_date <= lesson_date <= three_weeks_later
+        return start_of_day_timestamp() <= lesson_date_ts <= start_of_day_timestamp(UPCOMING_LESSONS_DAYS)
 
     def set_available_services(self):
         pass
@@ -908,6 +2552,13 @@ class Schedule(DataBaseManager):
         pass
 
 
+class ReservationResult(enum.Enum):
+    """ Результат попытки записи гостя на занятие """
+    BOOKED = 'booked'                   # Записан
+    ALREADY_BOOKED = 'already_booked'   # Уже был записан ранее
+    FULL = 'full'                       # Все места заняты
+
+
 class AppointmentManager(Schedule):
     """
         Менеджер записей гостей на занятия
@@ -917,90 +2568,127 @@ class AppointmentManager(Schedule):
         """
             Проверка на запись гостя. Если записан – не дублировать.
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        query = f'SELECT date_update FROM {APPOINTMENTS_TABLE_NAME} WHERE user_id = ?'
-        selected_lesson = cursor.execute(query, (user_id, )).fetchone()
-        conn.close()
+        query = Query(APPOINTMENTS_TABLE_NAME, ['date_update']).where(user_id=user_id)
+        selected_lesson = self._fetch_one(query)
 
         if selected_lesson:
             return True     # Если гость записан
         else:
             return False     # Если гость НЕ записан
 
-    def __get_guest_list_for_lessons(self) -> list:
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        query = f'''
-                    SELECT * FROM {APPOINTMENTS_TABLE_NAME}
-                '''
-        all_lessons = cursor.execute(query).fetchall()
-        cursor.close()
-        conn.close()
-
-        return all_lessons
+    @staticmethod
+    def _shift_slot_headcount(conn: sqlite3.Connection, date_lesson, time_lesson, service_name, delta: int):
+        """
+            Изменение счётчика гостей слота в lesson_slots.
+            Вызывается на том же соединении и в той же транзакции, что и изменение appointments.
+            Сумма headcount по слоту равна числу строк appointments на (date_lesson, time_lesson):
+            гость, снятый с занятия (service_name = NULL), учитывается в строке с пустым service_name.
+        """
+        if date_lesson is None or time_lesson is None:
+            return
 
-    def get_quantity_guests_in_lesson(self, date_lesson, time_lesson):
-        all_lessons = self.__get_guest_list_for_lessons()
+        conn.execute(
+            f'''
+                INSERT INTO {LESSON_SLOTS_TABLE_NAME} (date_lesson, time_lesson, service_name, headcount, date_lesson_ts)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (date_lesson, time_lesson, service_name)
+                DO UPDATE SET headcount = MAX(headcount + ?, 0)
+            ''',
+            (date_lesson, time_lesson, service_name or '', max(delta, 0), to_timestamp(date_lesson), delta))
+
+    def get_quantity_guests_in_lesson(self, date_lesson, time_lesson) -> int:
+        """ Количество гостей на занятии: сумма по строкам lesson_slots этого слота (по одной на занятие) """
+        query = Query(LESSON_SLOTS_TABLE_NAME, ['COALESCE(SUM(headcount), 0)'])
+        return self._fetch_one(query.where(date_lesson=date_lesson, time_lesson=time_lesson))[0]
+
+    def get_occupancy_for_slots(self, dates_lessons: list, times_lessons: list = None) -> dict:
+        """
+            Заполненность всех предложенных слотов одним запросом.
+            :param dates_lessons: даты занятий в формате 'дд.мм.гггг'
+            :param times_lessons: время занятий, по умолчанию LESSON_TIMES
+            :return: {(date_lesson, time_lesson): количество гостей} для каждого слота, включая пустые
+        """
+        times_lessons = LESSON_TIMES if times_lessons is None else times_lessons
 
-        count = 0
+        query = Query(LESSON_SLOTS_TABLE_NAME, ['date_lesson', 'time_lesson', 'SUM(headcount)'])
+        query.where_op('date_lesson', 'IN', dates_lessons).where_op('time_lesson', 'IN', times_lessons)
+        query.group_by('date_lesson', 'time_lesson')
 
-        for lesson in all_lessons:
-            _date = lesson[4]
-            _time = lesson[5]
-            if _date == date_lesson:
-                if _time == time_lesson:
-                    count += 1
+        occupancy = {(date_lesson, time_lesson): 0 for date_lesson in dates_lessons for time_lesson in times_lessons}
+        for date_lesson, time_lesson, quantity_guests in self._fetch_all(query):
+            occupancy[(date_lesson, time_lesson)] = quantity_guests
 
-        return count
+        return occupancy
 
-    def check_quantity_guests_in_lesson(self, date_lesson, time_lesson, limiter=8):
+    def check_quantity_guests_in_lesson(self, date_lesson, time_lesson, limiter=LESSON_GUESTS_LIMIT):
         quantity_guests = self.get_quantity_guests_in_lesson(date_lesson, time_lesson)
-        if quantity_guests > limiter:
+        if quantity_guests >= limiter:
             return False    # Прекращаем запись
         else:
             return True     # Добро
 
     @templates_status_events.event_handler
-    def signup_guest_for_lesson(self, user_id: int, service_name: str, date_lesson: str, time_lesson: str) -> bool:
+    def signup_guest_for_lesson(self, user_id: int, service_name: str, date_lesson: str, time_lesson: str,
+                                limiter: int = LESSON_GUESTS_LIMIT) -> ReservationResult:
         """
-            Добавление нового гостя на занятие
-            :param time_lesson:
-            :param date_lesson: date provide lesson
+            Добавление нового гостя на занятие.
+            Проверка дубля, проверка мест и запись выполняются одной транзакцией BEGIN IMMEDIATE:
+            блокировка записи берётся до проверок, поэтому параллельные записи на один слот
+            не могут превысить ограничитель.
             :param user_id: int
             :param service_name: str
-            :return: None
+            :param date_lesson: дата занятия в формате 'дд.мм.гггг'
+            :param time_lesson: время занятия, ex. '11:00'
+            :param limiter: максимальное количество гостей на занятии
+            :return: ReservationResult – BOOKED, ALREADY_BOOKED или FULL
         """
         now = datetime.datetime.now()
         datetime_now = now.strftime("%d-%m-%Y %H:%M:%S")
 
-        sign_up_data_to_db = {
-            "user_id": user_id,
-            "service_name": service_name,
-            "status": False,
-            "date_lesson": date_lesson,
-            "time_lesson": time_lesson,
-            "date_update": datetime_now
-        }
-
-        if self._check_signup_guest_for_lesson(user_id):
-            return False
-        if self.check_quantity_guests_in_lesson(date_lesson, time_lesson):
-            self.add_record(APPOINTMENTS_TABLE_NAME, sign_up_data_to_db)
-            return True
+        with self.pool.writer(immediate=True) as conn:
+            query = Query(APPOINTMENTS_TABLE_NAME, ['appointment_id']).where(user_id=user_id).limit(1)
+            if conn.execute(*query.build()).fetchone():
+                return ReservationResult.ALREADY_BOOKED
+
+            query = Query(LESSON_SLOTS_TABLE_NAME, ['COALESCE(SUM(headcount), 0)'])
+            query.where(date_lesson=date_lesson, time_lesson=time_lesson)
+            if conn.execute(*query.build()).fetchone()[0] >= limiter:
+                return ReservationResult.FULL
+
+            conn.execute(
+                f'''
+                    INSERT INTO {APPOINTMENTS_TABLE_NAME} (user_id, service_name, status, date_lesson, time_lesson, date_update,
+                                                           date_lesson_ts, date_update_ts)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''',
+                (user_id, service_name, False, date_lesson, time_lesson, datetime_now,
+                 to_timestamp(date_lesson), to_timestamp(datetime_now)))
+            self._shift_slot_headcount(conn, date_lesson, time_lesson, service_name, +1)
+            increment_referral_stats(conn, user_id, 'lesson_signups')
+            increment_daily_stats(conn, 'lesson_signups')
+
+        return ReservationResult.BOOKED
+
+    def __get_user_lessons(self, conn: sqlite3.Connection, user_id: int) -> list:
+        query = Query(APPOINTMENTS_TABLE_NAME, ['date_lesson', 'time_lesson', 'service_name']).where(user_id=user_id)
+        return conn.execute(*query.build()).fetchall()
 
     @templates_status_events.event_handler
     def _update_status(self, new_status, service_name, user_id):
-        """ Обновление статуса: подтверждение, что гость придет """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        """ Обновление статуса: подтверждение, что гость придет. Смена занятия переносит гостя между слотами """
+        query = f'''
+            UPDATE {APPOINTMENTS_TABLE_NAME}
+            SET status = ?, service_name = ?, date_update = ?, date_update_ts = ?
+            WHERE user_id = ?
+        '''
+        datetime_now = self._get_datetime_now()
 
-        query = f'UPDATE {APPOINTMENTS_TABLE_NAME} SET status = ?, service_name = ?, date_update = ? WHERE user_id = ?'
-        cursor.execute(query, (new_status, service_name, self._get_datetime_now(), user_id))
-        conn.commit()
-        conn.close()
+        with self.pool.writer() as conn:
+            for date_lesson, time_lesson, old_service_name in self.__get_user_lessons(conn, user_id):
+                if old_service_name != service_name:
+                    self._shift_slot_headcount(conn, date_lesson, time_lesson, old_service_name, -1)
+                    self._shift_slot_headcount(conn, date_lesson, time_lesson, service_name, +1)
+            conn.execute(query, (new_status, service_name, datetime_now, to_timestamp(datetime_now), user_id))
 
     @templates_status_events.event_handler
     def confirm_signup(self, user_id: int, service_name: str, new_status: str):
@@ -1016,22 +2704,16 @@ class AppointmentManager(Schedule):
 
     @templates_status_events.event_handler
     def cancel_signup(self, user_id: int):
-        __connect = sqlite3.connect(self.db_name)
-        __cursor = __connect.cursor()
-
-        query = f'''
-                    SELECT user_id FROM {APPOINTMENTS_TABLE_NAME} WHERE user_id = ?
-                '''
-        find_user = __cursor.execute(query, (user_id, )).fetchone()[0]
-
-        if user_id == find_user:
-            __cursor.execute(f"DELETE FROM {APPOINTMENTS_TABLE_NAME} WHERE user_id = ?", (user_id,))
-            __connect.commit()
-            __connect.commit()
-            __cursor.close()
+        with self.pool.writer() as conn:
+            user_lessons = self.__get_user_lessons(conn, user_id)
+            if not user_lessons:
+                return False
+
+            for date_lesson, time_lesson, service_name in user_lessons:
+                self._shift_slot_headcount(conn, date_lesson, time_lesson, service_name, -1)
+            conn.execute(f"DELETE FROM {APPOINTMENTS_TABLE_NAME} WHERE user_id = ?", (user_id,))
+            increment_daily_stats(conn, 'lesson_cancellations')
             return True
-        else:
-            return False
 
     @templates_status_events.event_handler
     def remove_from_lesson(self, user_id: int):
@@ -1045,21 +2727,17 @@ class AppointmentManager(Schedule):
 
     @staticmethod
     def _calculate_indicators_upcoming_lessons(lessons: list):
+        """
+            :param lessons: строки (date_lesson, time_lesson, headcount) из lesson_slots в хронологическом порядке
+            :return: {"дд.мм.гггг, чч:мм": количество гостей} в том же порядке
+        """
         lessons_dict = {}
 
-        for entry in lessons:
-            date = entry[4]
-            _time = entry[5]
+        for date, _time, headcount in lessons:
             date_time_key = f"{date}, {_time}"
+            lessons_dict[date_time_key] = lessons_dict.get(date_time_key, 0) + headcount
 
-            if date_time_key in lessons_dict:
-                lessons_dict[date_time_key] += 1
-            else:
-                lessons_dict[date_time_key] = 1
-
-        sorted_lessons_dict = dict(sorted(lessons_dict.items(), key=lambda x: (x[0].split(',')[0], x[0].split(',')[1])))
-
-        return sorted_lessons_dict
+        return lessons_dict
 
     @templates_status_events.event_handler
     def get_upcoming_lessons(self):
@@ -1067,23 +2745,13 @@ class AppointmentManager(Schedule):
             Выгрузка всех предстоящих занятий от текущей даты до 3-х недель вперед
             :return:
         """
-        # Получение текущей даты и даты через 3 недели
-        current_date = datetime.datetime.now()
-        end_date = current_date + datetime.timedelta(weeks=3)
-
-        date_format = '%d.%m.%Y'
-
-        current_date_str = current_date.strftime(date_format)
-        end_date_str = end_date.strftime(date_format)
-        print(f"Текущая дата: {current_date_str}, через 3 недели: {end_date_str}")
+        # Диапазон от начала текущего дня до 3-х недель вперед, фильтрация и сортировка – по индексу date_lesson_ts
+        query = Query(LESSON_SLOTS_TABLE_NAME, ['date_lesson', 'time_lesson', 'headcount'])
+        query.where_op('date_lesson_ts', '>=', start_of_day_timestamp())
+        query.where_op('date_lesson_ts', '<=', start_of_day_timestamp(UPCOMING_LESSONS_DAYS))
+        query.where_op('headcount', '>', 0).order_by('date_lesson_ts', 'time_lesson')
 
-        all_lessons = self.__get_guest_list_for_lessons()
-
-        selected_lessons = []
-        for lesson in all_lessons:
-            date_lesson = datetime.datetime.strptime(lesson[4], date_format)
-            if current_date <= date_lesson <= end_date:
-                selected_lessons.append(lesson)
+        selected_lessons = self._fetch_all(query)
 
         print("Выбранные занятия:", selected_lessons)
 
@@ -1094,27 +2762,30 @@ class AppointmentManager(Schedule):
             print("Нет предстоящих занятий в указанный период.")
             return None
 
+    @templates_status_events.event_handler
+    def get_guests_for_lesson_day(self, days_offset: int = 0) -> list:
+        """
+            Гости, записанные на занятия в указанный день (по индексу date_lesson_ts).
+            :param days_offset: 0 – сегодня, 1 – завтра
+            :return: список (user_id, time_lesson, service_name)
+        """
+        query = Query(APPOINTMENTS_TABLE_NAME, ['user_id', 'time_lesson', 'service_name'])
+        query.where(date_lesson_ts=start_of_day_timestamp(days_offset)).order_by('time_lesson', 'appointment_id')
+        return self._fetch_all(query)
+
     @templates_status_events.event_handler
     def get_lessons_by_time(self):
         """
             Выгрузка количества людей на занятия в 11:00, 13:30 и 15:30 по датам
         :return: Словарь с датами и количеством людей на занятия
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        times_of_interest = ['11:00', '13:30', '15:30']
-
         lessons_summary = {}
 
-        query = f'''
-            SELECT lesson_date, time, people_count 
-            FROM {APPOINTMENTS_TABLE_NAME}
-            WHERE time IN ({','.join(['?'] * len(times_of_interest))})
-            ORDER BY lesson_date, time
-        '''
+        query = Query(LESSON_SLOTS_TABLE_NAME, ['date_lesson', 'time_lesson', 'SUM(headcount)'])
+        query.where_op('time_lesson', 'IN', LESSON_TIMES)
+        query.group_by('date_lesson_ts', 'date_lesson', 'time_lesson').order_by('date_lesson_ts', 'time_lesson')
 
-        selected_lessons = cursor.execute(query, times_of_interest).fetchall()
+        selected_lessons = self._fetch_all(query)
 
         for lesson in selected_lessons:
             lesson_date, time, people_count = lesson
@@ -1124,6 +2795,4 @@ class AppointmentManager(Schedule):
             else:
                 lessons_summary[lesson_date][time] = people_count
 
-        conn.close()
-
         return lessons_summary
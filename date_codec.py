@@ -0,0 +1,63 @@
+import datetime
+import time
+
+
+__version__ = '1.0.0'
+
+
+# Все форматы дат, в которых строки уже лежат в БД
+DATE_FORMATS = (
+    '%d-%m-%Y %H:%M:%S',    # add_record, статусы изделий, записи на занятия
+    '%H:%M %d-%m-%Y',       # регистрация гостя через бот
+    '%d.%m.%Y-%H:%M:%S',    # get_format_date: рефералы, миграции
+    '%d.%m.%Y',             # дата занятия
+    '%d-%m-%Y'              # блокировка гостя
+)
+
+# Строковые форматы только для отображения, храним и сравниваем – секунды Unix (<колонка>_ts)
+DISPLAY_DATETIME_FORMAT = '%d-%m-%Y %H:%M:%S'
+DISPLAY_DATE_FORMAT = '%d.%m.%Y'
+
+# Суффикс колонки-спутника с временем в секундах Unix, ex. date_lesson -> date_lesson_ts
+TIMESTAMP_SUFFIX = '_ts'
+
+
+def timestamp_column(column: str) -> str:
+    return f'{column}{TIMESTAMP_SUFFIX}'
+
+
+def to_timestamp(value):
+    """
+        Строка даты в любом из DATE_FORMATS -> секунды Unix (локальное время).
+        :return: None, если значения нет или формат не распознан
+    """
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    if isinstance(value, datetime.date):
+        return int(datetime.datetime.combine(value, datetime.time()).timestamp())
+    if not value:
+        return None
+
+    for date_format in DATE_FORMATS:
+        try:
+            return int(datetime.datetime.strptime(value, date_format).timestamp())
+        except ValueError:
+            continue
+    return None
+
+
+def now_timestamp() -> int:
+    return int(time.time())
+
+
+def start_of_day_timestamp(days_offset: int = 0) -> int:
+    """ Полночь сегодняшнего дня (со сдвигом days_offset дней) в секундах Unix """
+    day = datetime.date.today() + datetime.timedelta(days=days_offset)
+    return to_timestamp(day)
+
+
+def format_timestamp(timestamp, date_format: str = DISPLAY_DATETIME_FORMAT) -> str:
+    """ Секунды Unix -> строка для отображения, '-' если даты нет """
+    if timestamp is None:
+        return '-'
+    return datetime.datetime.fromtimestamp(timestamp).strftime(date_format)
@@ -26,6 +26,9 @@ from forms import *
 
 from tracer import TracerManager, TRACER_FILE
 from customer_registrations import ManagerCustomerReg
+from broadcast import run_broadcast_job, resume_broadcast_jobs, format_failures
+from outbox import enqueue_message, notify_guest, enqueue_for_admins, start_outbox_workers
+from scheduler import Scheduler
 from painting import process_image
 
 
@@ -49,12 +52,7 @@ dp = Dispatcher(bot, storage=MemoryStorage())
 
 # ================ БАЗА ДАННЫХ И ТАБЛИЦЫ ================
 db_manager = DataBaseManager(INSPIRA_DB)
-db_manager.create_table(USERS_TABLE_NAME, FIELDS_FOR_USERS)
-db_manager.create_table(PRODUCTS_TABLE_NAME, FIELDS_FOR_PRODUCTS)
-db_manager.create_table(REFERRALS_TABLE_NAME, FIELDS_FOR_REFERRALS)
-db_manager.create_table(LIMITED_USERS_TABLE_NAME, FIELDS_FOR_LIMITED_USERS)
-db_manager.create_table(ADMINS_TABLE_NAME, FIELDS_FOR_ADMINS)
-db_manager.create_table(APPOINTMENTS_TABLE_NAME, FIELDS_FOR_APPOINTMENTS)
+SchemaMigrator(INSPIRA_DB).migrate()
 
 # ============== ИНИЦИАЛИЗАЦИЯ ЛОГИРОВАНИЯ ==========================
 tracer_l = TracerManager(TRACER_FILE)
@@ -97,9 +95,12 @@ class Administrators(AdminsManager):
     def __init__(self, db_name):
         super().__init__(db_name)
 
-    async def sending_messages_to_admins(self, message: str, parse_mode='HTML', markup=None):
-        for _admin_user_id in self.get_administrators_from_db():
-            await bot.send_message(_admin_user_id, message, parse_mode=parse_mode, reply_markup=markup)
+    async def notify_admins(self, message: str, parse_mode='HTML', markup=None) -> int:
+        """
+            Уведомление администраторов через исходящую очередь: ответ гостю не ждёт доставку админам.
+            :return: количество администраторов, которым поставлено уведомление
+        """
+        return await enqueue_for_admins(message, parse_mode, markup)
 
     def get_list_of_admins(self) -> list:
         return self.get_administrators_from_db()
@@ -114,9 +115,9 @@ class ControlAccessConfirmedUsers:
         pass
 
     @staticmethod
-    def check_access_user(user_id: int) -> bool:
+    async def check_access_user(user_id: int) -> bool:
         users_manager = UserManager(INSPIRA_DB)
-        contact_user = users_manager.get_phone(user_id)
+        contact_user = await users_manager.aio.get_phone(user_id)
         if contact_user is None:
             return False
         elif contact_user is False:
@@ -154,7 +155,7 @@ async def handle_phone_number(message: types.Message):
     phone_number = message.text
 
     user_manager = UserManager(INSPIRA_DB)
-    user_manager.update_contact_info(user_id=message.from_user.id, phone=phone_number)
+    await user_manager.aio.update_contact_info(user_id=message.from_user.id, phone=phone_number)
 
     await message.answer(f"Вы ввели номер телефона: {phone_number}")
 
@@ -176,7 +177,7 @@ async def check_ban_users(user_id):
 
     if result:
         if user_id not in notify_banned_users:
-            await administrators.sending_messages_to_admins(f"⚠ {user_id} VERSUCHT RAUS ZU KOMMEN\n\n")
+            await administrators.notify_admins(f"⚠ {user_id} VERSUCHT RAUS ZU KOMMEN\n\n")
             await bot.send_message(
                 user_id, f"К сожалению, не можем допустить Вас к использованию бота :(\n\n"
                          f"(T_T)", parse_mode='HTML'
@@ -221,7 +222,7 @@ async def ban_request_restrictions(user_id):
     if len(user_messages[user_id]) >= REQUEST_LIMIT:
         if len(user_messages[user_id]) == TIME_LIMIT:
             await limited_users_manager.block_user(f"/ban {user_id}")
-            await administrators.sending_messages_to_admins(f"ЛИКВИДИРОВАН ❌")
+            await administrators.notify_admins(f"ЛИКВИДИРОВАН ❌")
             tracer_l.tracer_charge(
                 'ADMIN', user_id, ban_request_restrictions.__name__, "user will permanent banned")
 
@@ -237,7 +238,7 @@ async def check_user_data(message):
     last_name = message.chat.last_name
 
     user_manager = UserManager(INSPIRA_DB)
-    result = user_manager.check_user_in_database(user_id)
+    result = await user_manager.aio.check_user_in_database(user_id)
 
     if not result:
         _time_now = datetime.datetime.now().strftime('%H:%M %d-%m-%Y')
@@ -246,7 +247,7 @@ async def check_user_data(message):
             'date_register': _time_now, 'user_status': True,
             'user_status_date_upd': _time_now
         }
-        user_manager.add_record('users', user_data)
+        await user_manager.aio.add_record('users', user_data)
 
         product_user_data = {
             'product_id': None, 'status': None, 'user_id': message.from_user.id, 'group_number': None,
@@ -254,18 +255,21 @@ async def check_user_data(message):
         }
 
         _db_manager = ProductManager(INSPIRA_DB)
-        _db_manager.add_record('products', product_user_data)
+        await _db_manager.aio.add_record('products', product_user_data)
 
         # Кнопка для администратора
         markup = InlineKeyboardMarkup()
         button = InlineKeyboardButton("ДОБАВИТЬ ГОСТЯ В ГРУППУ", callback_data=f"fill_guest_card:{user_id}")
         markup.add(button)
 
-        await administrators.sending_messages_to_admins(
+        await administrators.notify_admins(
             f"⚠ НОВЫЙ ГОСТЬ ⚠\n{first_name} {last_name} ({user_id})", markup=markup)
 
         tracer_l.tracer_charge(
             'ADMIN', message.from_user.id, check_user_data.__name__, "new user")
+    else:
+        # Гость снова написал боту – снова доступен для рассылок
+        await user_manager.aio.mark_user_reachable(user_id)
 
     return result
 
@@ -293,15 +297,15 @@ async def start_message(message: types.Message):
         if len(check_for_ref) > 1:
             check_for_ref = check_for_ref[1]
             ref_manager = ReferralArrival(INSPIRA_DB)
-            ref_manager.check_user_ref(message.from_user.id, check_for_ref)
+            await ref_manager.aio.check_user_ref(message.from_user.id, check_for_ref)
             print("ID ARRIVAL:", check_for_ref, message.from_user.id)
 
         await asyncio.sleep(.5)
 
         product_manager = ProductManager(INSPIRA_DB)
-        product_id_by_user = product_manager.get_product_id(user_id=message.from_user.id)
+        product_id_by_user = await product_manager.aio.get_product_id(user_id=message.from_user.id)
 
-        if message.from_user.id in administrators.get_list_of_admins():
+        if message.from_user.id in await administrators.aio.get_list_of_admins():
             kb = [
                 [
                     types.KeyboardButton(text="/ADMIN/"),
@@ -371,7 +375,7 @@ async def contact_handler(message: types.Message):
 
     try:
         user_manager = UserManager(INSPIRA_DB)
-        user_manager.update_contact_info(user_id=user_id, phone=phone)
+        await user_manager.aio.update_contact_info(user_id=user_id, phone=phone)
         tracer_l.tracer_charge(
             'INFO', message.from_user.id, contact_handler.__name__, "offer to send a contact")
     except Exception as db_error:
@@ -395,20 +399,18 @@ async def product_status(message: types.Message):
     tracer_l.tracer_charge(
         'INFO', message.from_user.id, product_status.__name__, "user check status of product")
 
-    check_phone = control_access_confirmed_users.check_access_user(user_id=message.from_user.id)
+    check_phone = await control_access_confirmed_users.check_access_user(user_id=message.from_user.id)
 
     if check_phone is False:
         await not_success_auth_user(message.from_user.id)
     else:
         _db_manager = ProductManager(INSPIRA_DB)
-        _status_product = _db_manager.get_product_status(message.from_user.id)
+        _status_product = await _db_manager.aio.get_product_status(message.from_user.id)
 
         if _status_product == 'WORK':
-            await bot.send_message(
+            await enqueue_message(
                 message.from_user.id,
-                'В РАБОТЕ ⌛\n\n<i>Вам придет уведомление, как только Ваше изделие будет готово.</i>',
-                parse_mode='HTML'
-            )
+                'В РАБОТЕ ⌛\n\n<i>Вам придет уведомление, как только Ваше изделие будет готово.</i>')
 
         elif _status_product == 'DONE':
             markup = InlineKeyboardMarkup()
@@ -416,30 +418,22 @@ async def product_status(message: types.Message):
                 "ИЗДЕЛИЕ ПОЛУЧИЛ",
                 callback_data=f"product_has_been_received:{message.from_user.id}")
             markup.add(ready_button)
-            await bot.send_message(
-                message.from_user.id, f'<b>ГОТОВО {CONFIRM_SYMBOL}</b>\n\nМожете забрать свое творение!', reply_markup=markup,
-                parse_mode='HTML'
-            )
+            await enqueue_message(
+                message.from_user.id, f'<b>ГОТОВО {CONFIRM_SYMBOL}</b>\n\nМожете забрать свое творение!', reply_markup=markup)
 
         elif _status_product == 'RECEIVED':
-            await bot.send_message(
-                message.from_user.id, '<b>ИЗДЕЛИЕ НА РУКАХ</b>\n\nПриходите к нам ещё!',
-                parse_mode='HTML'
-            )
+            await enqueue_message(
+                message.from_user.id, '<b>ИЗДЕЛИЕ НА РУКАХ</b>\n\nПриходите к нам ещё!')
 
         elif _status_product == 'WAIT':
-            await bot.send_message(
+            await enqueue_message(
                 message.from_user.id,
-                '<b>ИЗДЕЛИЕ В ОЧЕРЕДИ</b>\n\nВам придет уведомление, когда Ваше изделие пойдет в работу.',
-                parse_mode='HTML'
-            )
+                '<b>ИЗДЕЛИЕ В ОЧЕРЕДИ</b>\n\nВам придет уведомление, когда Ваше изделие пойдет в работу.')
 
         else:
-            await bot.send_message(
+            await enqueue_message(
                 message.from_user.id,
-                '<b>Статус не определен</b>\n\nКак только Ваше изделие начнет готовиться, Вам придет уведомление',
-                parse_mode='HTML'
-            )
+                '<b>Статус не определен</b>\n\nКак только Ваше изделие начнет готовиться, Вам придет уведомление')
 
         tracer_l.tracer_charge(
             'INFO', message.from_user.id, product_status.__name__, f"product status: {_status_product}")
@@ -449,7 +443,7 @@ async def product_status(message: types.Message):
 @dp.message_handler(lambda message: message.text == 'Записаться на занятие')
 @dp.message_handler(commands=['registration'])
 async def cmd_start(message: types.Message):
-    check_phone = control_access_confirmed_users.check_access_user(user_id=message.from_user.id)
+    check_phone = await control_access_confirmed_users.check_access_user(user_id=message.from_user.id)
 
     if check_phone is False:
         await not_success_auth_user(message.from_user.id)
@@ -468,10 +462,20 @@ async def process_date(message: types.Message, state: FSMContext):
 
     time_buttons = types.ReplyKeyboardMarkup(resize_keyboard=True)
 
-    # TODO: написать логику извлечения этих данных из БД
-    time_buttons.add(InlineKeyboardButton("11:00"))
-    time_buttons.add(InlineKeyboardButton("13:30"))
-    time_buttons.add(InlineKeyboardButton("15:30"))
+    # Заполненность всех слотов выбранной даты – одним запросом, полные слоты не предлагаем
+    try:
+        date_lesson = ManagerCustomerReg.formatting_date_reg_for_database(message.text)
+        occupancy = await AppointmentManager(INSPIRA_DB).aio.get_occupancy_for_slots([date_lesson])
+        available_times = [_time for _time in LESSON_TIMES if occupancy[(date_lesson, _time)] < LESSON_GUESTS_LIMIT]
+    except ValueError:
+        available_times = LESSON_TIMES
+
+    if not available_times:
+        await message.answer("К сожалению, на эту дату все места заняты :(\n\nВыберите другую дату:")
+        return
+
+    for available_time in available_times:
+        time_buttons.add(InlineKeyboardButton(available_time))
 
     await message.answer("Выберите время:", reply_markup=time_buttons)
     await FormRegistrationForLesson.time.set()
@@ -521,10 +525,10 @@ async def process_comments(message: types.Message, state: FSMContext):
         service_name = user_data['activity']
 
         # Проверка записи на занятие
-        appointment_record = appointment_manager.signup_guest_for_lesson(
+        appointment_record = await appointment_manager.aio.signup_guest_for_lesson(
             id_user, service_name, date_lesson, time_lesson)
 
-        if appointment_record is False:
+        if appointment_record is ReservationResult.ALREADY_BOOKED:
             markup = InlineKeyboardMarkup()
 
             ready_button = InlineKeyboardButton(
@@ -532,31 +536,30 @@ async def process_comments(message: types.Message, state: FSMContext):
 
             markup.add(ready_button)
 
-            await bot.send_message(
+            await enqueue_message(
                 message.from_user.id, "<b>Вы уже записаны</b>\n\nЖдём Вас с нетерпением :)",
-                reply_markup=markup,
-                parse_mode='HTML')
-        elif appointment_record is None:
-            await bot.send_message(
+                reply_markup=markup)
+        elif appointment_record is ReservationResult.FULL:
+            await enqueue_message(
                 message.from_user.id,
-                "<b>К сожалению, все места заняты</b>\n\nПопробуйте выбрать другую дату и время :(",
-                parse_mode='HTML')
-        else:
-            await bot.send_photo(
+                "<b>К сожалению, все места заняты</b>\n\nПопробуйте выбрать другую дату и время :(")
+        elif appointment_record is ReservationResult.BOOKED:
+            await enqueue_message(
                 message.from_user.id,
-                photo=InputFile(output_file["output_file"], filename=output_file["output_filename"]),
-                parse_mode='HTML',
+                f'<b>Ваш билет {CONFIRM_SYMBOL}</b>\n\n'
+                f'Вы успешно записаны! Бот уведомит о занятии за день до него :)',
                 reply_markup=keyboard,
-                caption=f'<b>Ваш билет {CONFIRM_SYMBOL}</b>\n\n'
-                        f'Вы успешно записаны! Бот уведомит о занятии за день до него :)')
+                photo=output_file["output_file"], photo_filename=output_file["output_filename"])
 
             _db_manager = ProductManager(INSPIRA_DB)
-            _db_manager.update_user_group(id_user, f'{date_lesson}_{time_lesson.replace(":", ".")}', "WAIT")
+            await _db_manager.aio.update_user_group(id_user, f'{date_lesson}_{time_lesson.replace(":", ".")}', "WAIT")
 
-            await administrators.sending_messages_to_admins(
+            await administrators.notify_admins(
                 f"<b>Гость {id_user} записался {CONFIRM_SYMBOL}</b>\n\n"
                 f"Дата: {date_format_for_display['day']} {date_format_for_display['month']}\n"
                 f"Время: {time_lesson}")
+        else:
+            raise RuntimeError(f"signup is not completed: {appointment_record}")
 
     except Exception as fatal:
         await message.reply("Не удалось записаться :(\n\nПожалуйста, повторите попытку позже")
@@ -579,7 +582,7 @@ async def process_product_confirm(callback_query: types.CallbackQuery):
 
     try:
         product_manager = ProductManager(INSPIRA_DB)
-        user_group = product_manager.get_group(user_id)
+        user_group = await product_manager.aio.get_group(user_id)
         tracer_l.tracer_charge(
             'INFO', callback_query.from_user.id, process_product_confirm.__name__,
             f"success product confirm")
@@ -589,7 +592,7 @@ async def process_product_confirm(callback_query: types.CallbackQuery):
             f"", fail)
         return
 
-    await administrators.sending_messages_to_admins(
+    await administrators.notify_admins(
         f"{ADMIN_PREFIX_TEXT}Гость {user_id} из группы {user_group} подтвердил запись на занятие {CONFIRM_SYMBOL}")
 
 
@@ -600,12 +603,12 @@ async def cancel_signup_by_user(callback_query: types.CallbackQuery):
 
     try:
         appointment_manager = AppointmentManager(INSPIRA_DB)
-        status_delete = appointment_manager.cancel_signup(user_id)
+        status_delete = await appointment_manager.aio.cancel_signup(user_id)
 
         if status_delete:
-            await bot.send_message(user_id, f"Запись отменена {STOP_SYMBOL}")
+            await enqueue_message(user_id, f"Запись отменена {STOP_SYMBOL}")
 
-            await administrators.sending_messages_to_admins(f"Гость {user_id} отменил запись на занятие {STOP_SYMBOL}")
+            await administrators.notify_admins(f"Гость {user_id} отменил запись на занятие {STOP_SYMBOL}")
 
             tracer_l.tracer_charge(
                 'INFO', callback_query.from_user.id, process_product_confirm.__name__,
@@ -657,7 +660,7 @@ ADMIN_PANEL_BUTTONS = [
 @dp.message_handler(lambda message: message.text == '/ADMIN/')
 @dp.message_handler(commands=['inspira'])
 async def admin_panel(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         keyboard = types.ReplyKeyboardMarkup(keyboard=ADMIN_PANEL_BUTTONS, resize_keyboard=True)
         await message.reply(
             "[ INSPIRA • Admin Panel ]\n\n"
@@ -683,7 +686,7 @@ async def start_form(callback_query: types.CallbackQuery, state: FSMContext):
         f"admin set group number for {user_id}")
 
     user_manager = UserManager(INSPIRA_DB)
-    guest_contact = user_manager.get_user_contact_info(user_id)
+    guest_contact = await user_manager.aio.get_user_contact_info(user_id)
 
     await callback_query.message.answer(
         f"<b>ПРОГРЕСС 1/2</b>\nВведите номер группы гостя {guest_contact}", parse_mode='HTML')
@@ -698,7 +701,7 @@ async def process_group(message: types.Message, state: FSMContext):
     product_manager = ProductManager(INSPIRA_DB)
 
     async with state.proxy() as data:
-        group_number = product_manager.get_group(data['user_id'])
+        group_number = await product_manager.aio.get_group(data['user_id'])
 
         if group_number is not None:
             data['group'] = group_number
@@ -706,7 +709,7 @@ async def process_group(message: types.Message, state: FSMContext):
             data['group'] = message.text
 
     user_manager = UserManager(INSPIRA_DB)
-    guest_contact = user_manager.get_user_contact_info(data['user_id'])
+    guest_contact = await user_manager.aio.get_user_contact_info(data['user_id'])
 
     await message.answer(
         f"<b>ПРОГРЕСС 2/2</b>\nВведите номер изделия гостя {guest_contact}", parse_mode='HTML')
@@ -733,7 +736,7 @@ async def process_product_number(message: types.Message, state: FSMContext):
     guest_product_card_text += f"Номер группы  – {data['group']}\n"
     guest_product_card_text += f"Номер изделия – {data['product_id']}\n\n"
 
-    check_phone = control_access_confirmed_users.check_access_user(user_id=message.from_user.id)
+    check_phone = await control_access_confirmed_users.check_access_user(user_id=message.from_user.id)
 
     guest_product_card_text += '<i>Телефон '
     if check_phone:
@@ -744,8 +747,10 @@ async def process_product_number(message: types.Message, state: FSMContext):
 
     try:
         _db_manager = ProductManager(INSPIRA_DB)
-        _db_manager.update_user_group(target_user_id, data['group'], "WAIT")
-        _db_manager.update_product_id(target_user_id, data['product_id'])
+        # Оба изменения уходят в одну групповую транзакцию
+        await asyncio.gather(
+            _db_manager.aio.update_user_group(target_user_id, data['group'], "WAIT"),
+            _db_manager.aio.update_product_id(target_user_id, data['product_id']))
 
         await message.answer(
             guest_product_card_text,
@@ -768,29 +773,22 @@ async def process_product_number(message: types.Message, state: FSMContext):
 
 @dp.callback_query_handler(lambda c: c.data.startswith('bring_the_product_to_work:'))
 async def bring_the_product_to_work(callback_query: types.CallbackQuery):
-    if callback_query.from_user.id in administrators.get_list_of_admins():
+    if callback_query.from_user.id in await administrators.aio.get_list_of_admins():
         user_id = int(callback_query.data.split(':')[1])
 
         try:
             product_manager = ProductManager(INSPIRA_DB)
-            product_manager.update_product_status(user_id, "WORK")
-            user_product_card_dict = product_manager.get_user_product_card(user_id=user_id)
+            await product_manager.aio.update_product_status(user_id, "WORK")
+            user_product_card_dict = await product_manager.aio.get_user_product_card(user_id=user_id)
             user_product_card_text = product_manager.get_user_product_card_for_display(user_product_card_dict, PRODUCT_STATUSES)
 
-            await administrators.sending_messages_to_admins(
+            await administrators.notify_admins(
                 f"{ADMIN_PREFIX_TEXT}<b>ПРИНЯТО В РАБОТУ</b>\n{user_id}\n{user_product_card_text}")
 
-            try:
-                await bot.send_message(
-                    user_id,
-                    f"{USER_PREFIX_TEXT}"
-                    f"Ваше изделие принято в работу!\n\n<i>Вам придёт уведомление о готовности</i>",
-                    parse_mode='HTML'
-                )
-            except Exception as fail:
-                tracer_l.tracer_charge(
-                    'ERROR', callback_query.from_user.id, bring_the_product_to_work.__name__,
-                    f"error while trying send message to {user_id}", fail)
+            await notify_guest(
+                user_id,
+                f"{USER_PREFIX_TEXT}"
+                f"Ваше изделие принято в работу!\n\n<i>Вам придёт уведомление о готовности</i>")
 
             tracer_l.tracer_charge(
                 'ADMIN', callback_query.from_user.id, bring_the_product_to_work.__name__,
@@ -810,7 +808,7 @@ async def process_set_status_ready(callback_query: types.CallbackQuery):
     user_id = int(callback_query.data.split(':')[1])
 
     product_manager = ProductManager(INSPIRA_DB)
-    status_update_product_status = product_manager.update_product_status(user_id, "DONE")
+    status_update_product_status = await product_manager.aio.update_product_status(user_id, "DONE")
 
     markup = InlineKeyboardMarkup()
     ready_button = InlineKeyboardButton("ИЗДЕЛИЕ ПОЛУЧИЛ", callback_data=f"product_has_been_received:{user_id}")
@@ -818,12 +816,12 @@ async def process_set_status_ready(callback_query: types.CallbackQuery):
 
     if status_update_product_status:
         message_for_admin = f'{ADMIN_PREFIX_TEXT}<b>ГОТОВО {CONFIRM_SYMBOL}</b>\n\n<i>Изделие гостя {user_id} приведено в статус готовности</i>'
-        await bot.send_message(
+        await notify_guest(
             user_id,
             f"{USER_PREFIX_TEXT}"
             f"Ваше изделие готово, можете забирать!\n\n"
             f"<i>Как только получите, пожалуйста, подтвердите получение по кнопке ниже.</i>",
-            parse_mode='HTML', reply_markup=markup
+            reply_markup=markup
         )
 
         tracer_l.tracer_charge(
@@ -836,7 +834,7 @@ async def process_set_status_ready(callback_query: types.CallbackQuery):
             'ADMIN', callback_query.from_user.id, process_set_status_ready.__name__,
             f"unknown product status for {user_id}", "product status is not set")
 
-    await administrators.sending_messages_to_admins(message_for_admin)
+    await administrators.notify_admins(message_for_admin)
 
 
 @dp.callback_query_handler(lambda c: c.data.startswith('product_has_been_received:'))
@@ -850,8 +848,8 @@ async def process_product_confirm(callback_query: types.CallbackQuery):
 
     try:
         product_manager = ProductManager(INSPIRA_DB)
-        status_update_product_status = product_manager.update_product_status(user_id, "RECEIVED")
-        user_group = product_manager.get_group(user_id)
+        status_update_product_status = await product_manager.aio.update_product_status(user_id, "RECEIVED")
+        user_group = await product_manager.aio.get_group(user_id)
         tracer_l.tracer_charge(
             'INFO', callback_query.from_user.id, process_product_confirm.__name__,
             f"product status for {user_id}: product has been received")
@@ -861,56 +859,66 @@ async def process_product_confirm(callback_query: types.CallbackQuery):
             f"critical error while update status in database {user_id}", critical)
         return
 
-    await administrators.sending_messages_to_admins(
+    await administrators.notify_admins(
         f"{ADMIN_PREFIX_TEXT}Гость {user_id} из группы {user_group} подтвердил получение {CONFIRM_SYMBOL}")
 
     if status_update_product_status:
         message_for_user = (f'<b>Расскажите о своих впечатлениях!</b>\n\n'
                             f'Уделите совсем немного времени, чтобы рассказать о своих впечатлениях в этом опросе:\n'
                             f'<a href="https://google.com">тут крч ссылка будет</a>')
-        try:
-            await bot.send_message(callback_query.from_user.id, message_for_user, parse_mode='HTML')
-            tracer_l.tracer_charge(
-                'INFO', callback_query.from_user.id, process_product_confirm.__name__,
-                f"finally message will send")
-        except Exception as error:
-            tracer_l.tracer_charge(
-                'WARNING', callback_query.from_user.id, process_product_confirm.__name__,
-                f"fail while send finally message", f"{error}")
+        await notify_guest(callback_query.from_user.id, message_for_user)
+        tracer_l.tracer_charge(
+            'INFO', callback_query.from_user.id, process_product_confirm.__name__,
+            f"finally message is enqueued")
 
 
 GROUPS_PER_PAGE = 20  # Количество групп на странице алмина
 
 
 @dp.message_handler(lambda message: message.text == '/GROUPS/')
-async def show_all_groups(message: types.Message, page: int = 0):
-    if message.from_user.id in administrators.get_list_of_admins():
+async def show_all_groups(message: types.Message, direction: str = None, cursor: str = None):
+    """
+        Список групп постранично. Страницы листаются по ключу – номеру крайней группы.
+        :param direction: 'next' / 'prev' при листании, None – первая страница
+        :param cursor: номер крайней группы текущей страницы
+    """
+    if message.chat.id in await administrators.aio.get_list_of_admins():
         await construction_to_delete_messages(message)
-        print(f"Showing groups for page: {page}")
 
         product_manager = ProductManager(INSPIRA_DB)
-        unique_groups = product_manager.get_all_groups()
-
-        total_pages = (len(unique_groups) + GROUPS_PER_PAGE - 1) // GROUPS_PER_PAGE
-        start_index = page * GROUPS_PER_PAGE
-        end_index = start_index + GROUPS_PER_PAGE
-        groups_to_display = unique_groups[start_index:end_index]
+        if direction == 'prev':
+            groups_to_display, has_more = await product_manager.aio.get_groups_page(
+                before=cursor, limit=GROUPS_PER_PAGE)
+            has_prev, has_next = has_more, True
+        else:
+            groups_to_display, has_more = await product_manager.aio.get_groups_page(
+                after=cursor, limit=GROUPS_PER_PAGE)
+            has_prev, has_next = cursor is not None, has_more
 
-        print(f"Total groups: {len(unique_groups)}, Total pages: {total_pages}, Groups on this page: {len(groups_to_display)}")
+        print(f"Showing groups {direction or 'first'} from {cursor}: {len(groups_to_display)} on this page")
 
         markup = InlineKeyboardMarkup()
         for group in groups_to_display:
-            button = InlineKeyboardButton(f"ГРУППА {group}", callback_data=f"list_all_users_by_group:{group}")
+            group_number = group['group_number']
+            statuses = ', '.join(f"{status or '-'} {count}" for status, count in group['statuses'].items())
+            button = InlineKeyboardButton(
+                f"ГРУППА {group_number} • {group['members']} ({statuses})",
+                callback_data=f"list_all_users_by_group:{group_number}")
             markup.add(button)
 
-        if page > 0:
-            markup.add(InlineKeyboardButton("Назад", callback_data=f"show_groups:{page - 1}"))
-        else:
-            markup.add(InlineKeyboardButton("Вперед", callback_data=f"show_groups:{page + 1}"))
-
-        if page == 0:
+        navigation_buttons = []
+        if has_prev and groups_to_display:
+            navigation_buttons.append(InlineKeyboardButton(
+                "Назад", callback_data=f"show_groups:prev:{groups_to_display[0]['group_number']}"))
+        if has_next and groups_to_display:
+            navigation_buttons.append(InlineKeyboardButton(
+                "Вперед", callback_data=f"show_groups:next:{groups_to_display[-1]['group_number']}"))
+        if navigation_buttons:
+            markup.row(*navigation_buttons)
+
+        if direction is None:
             _sent_message = await bot.send_message(
-                message.from_user.id,
+                message.chat.id,
                 f"{ADMIN_PREFIX_TEXT}СПИСОК ВСЕХ ДОСТУПНЫХ ГРУПП", reply_markup=markup, parse_mode='HTML'
             )
             await drop_admin_message(message, _sent_message)
@@ -926,29 +934,21 @@ async def show_all_groups(message: types.Message, page: int = 0):
 
 @dp.callback_query_handler(lambda callback_query: callback_query.data.startswith("show_groups:"))
 async def handle_group_navigation(callback_query: types.CallbackQuery):
-    page = int(callback_query.data.split(":")[1])
-    await show_all_groups(callback_query.message, page)
+    _, direction, cursor = callback_query.data.split(":", 2)
+    await show_all_groups(callback_query.message, direction, cursor)
     await callback_query.answer()
 
 
 @dp.message_handler(lambda message: message.text == '/ADMINS/')
 async def show_all_admins(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         await construction_to_delete_messages(message)
 
-        users_id_of_admins = administrators.get_list_of_admins()
-        users_man = UserManager(INSPIRA_DB)
+        admins_with_contacts = await administrators.aio.get_administrators_with_contacts()
 
         markup = InlineKeyboardMarkup()
 
-        for admin_id in users_id_of_admins:
-            user_data = users_man.get_user_data(admin_id)
-            try:
-                first_name = user_data[2]
-                phone_number = user_data[3]
-            except TypeError:
-                first_name = '-'
-                phone_number = '-'
+        for admin_id, first_name, phone_number in admins_with_contacts:
             button = InlineKeyboardButton(f"{first_name} • {phone_number}", callback_data=f"admin_card:{admin_id}")
             markup.add(button)
 
@@ -961,19 +961,16 @@ async def show_all_admins(message: types.Message):
 
 @dp.callback_query_handler(lambda c: c.data.startswith('list_all_users_by_group:'))
 async def list_all_users_by_group(callback_query: types.CallbackQuery):
-    if callback_query.from_user.id in administrators.get_list_of_admins():
+    if callback_query.from_user.id in await administrators.aio.get_list_of_admins():
         await construction_to_delete_messages(callback_query.message)
 
         group_number = callback_query.data.split(':')[1]
 
         product_manager = ProductManager(INSPIRA_DB)
-        list_users_from_group = product_manager.find_all_users_from_group(group_number)
-
-        users_manager = UserManager(INSPIRA_DB)
+        group_members = await product_manager.aio.get_group_members(group_number)
 
         markup = InlineKeyboardMarkup()
-        for user_id in list_users_from_group:
-            user_from_db = users_manager.get_user_contact_info(user_id=user_id)
+        for user_id, user_from_db in group_members:
             button = InlineKeyboardButton(f"Гость {user_from_db}", callback_data=f"user_card:{user_id}")
             markup.add(button)
 
@@ -985,20 +982,22 @@ async def list_all_users_by_group(callback_query: types.CallbackQuery):
 
 @dp.callback_query_handler(lambda c: c.data.startswith('user_card:'))
 async def user_card(callback_query: types.CallbackQuery):
-    if callback_query.from_user.id in administrators.get_list_of_admins():
+    if callback_query.from_user.id in await administrators.aio.get_list_of_admins():
         await construction_to_delete_messages(callback_query.message)
         selected_user_id = int(callback_query.data.split(':')[1])
 
-        product_manager = ProductManager(INSPIRA_DB)
-        product_card_user = product_manager.get_user_product_card(selected_user_id)
-        product_card_user_text = product_manager.get_user_product_card_for_display(product_card_user, PRODUCT_STATUSES)
+        dossier = await UserManager(INSPIRA_DB).aio.get_guest_dossier(selected_user_id)
+        if dossier is None:
+            _sent_message = await bot.send_message(callback_query.from_user.id, f"➜ USER not exist ❌")
+            await drop_admin_message(callback_query.message, _sent_message)
+            return
 
-        users_manager = UserManager(INSPIRA_DB)
-        user_phone = users_manager.get_phone(selected_user_id)
-        get_user_contact_info = users_manager.get_user_contact_info(selected_user_id)
+        product_card_user = dossier.product_card
+        product_card_user_text = ProductManager.get_user_product_card_for_display(product_card_user, PRODUCT_STATUSES)
+        get_user_contact_info = dossier.contact_info
 
         # Префикс текстового сообщения о статусе гостя
-        status_confirmed_user = CONFIRM_SYMBOL if user_phone is not None else WARNING_SYMBOL
+        status_confirmed_user = CONFIRM_SYMBOL if dossier.phone else WARNING_SYMBOL
 
         markup = InlineKeyboardMarkup()
 
@@ -1044,7 +1043,7 @@ async def user_card(callback_query: types.CallbackQuery):
 
 @dp.message_handler(lambda message: message.text == '/COMMANDS/')
 async def show_all_commands(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         await construction_to_delete_messages(message)
 
         dict_commands = {
@@ -1052,6 +1051,10 @@ async def show_all_commands(message: types.Message):
             "/block <user_id>": "блокировка пользователя по ID",
             "/sms <user_id>": "отправить пользователю сообщение",
             "/limited_users": "просмотреть список заблокированных пользователей",
+            "/refs <количество>": "последние переходы по рекламным ссылкам",
+            "/broadcasts": "прогресс рассылок /all",
+            "/jobs": "задания по расписанию: последний запуск и длительность",
+            "/ref_stats <дней>": "показатели рекламных источников по дням",
             "/i": "показать карточку пользователю"
         }
 
@@ -1065,51 +1068,70 @@ async def show_all_commands(message: types.Message):
         await drop_admin_message(message, _sent_message)
 
 
+USERS_PER_PAGE = 20  # Количество пользователей на странице ленты /USERS/
+
+
 @dp.message_handler(lambda message: message.text == '/USERS/')
-async def show_all_users(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
-        wait_message = await message.answer("➜ LOADING DB... ///")
+async def show_all_users(message: types.Message, direction: str = None, cursor: tuple = None):
+    """
+        Лента последних регистраций, от новых к старым.
+        :param direction: 'next' – к более старым, 'prev' – к более новым, None – первая страница
+        :param cursor: (date_register_ts, id) крайнего пользователя текущей страницы
+    """
+    if message.chat.id in await administrators.aio.get_list_of_admins():
         await construction_to_delete_messages(message)
 
         user_manager = UserManager(INSPIRA_DB)
-        all_users = user_manager.read_users_from_db()
+        if direction == 'prev':
+            latest_users = await user_manager.aio.get_latest_users(USERS_PER_PAGE, before=cursor)
+        else:
+            latest_users = await user_manager.aio.get_latest_users(USERS_PER_PAGE, after=cursor)
 
         users_from_db = '➜ LAST USERS ➜\n\n'
-        users_from_db_count = 0
 
-        cnt_users = len(all_users)
+        for id_in_db, user_id, firstname, username, date in latest_users['users']:
+            users_from_db += f"[{id_in_db}]: ({str(date).split(' ')[-1]}) {firstname}\n{user_id}\n"
 
-        date_format = "%H:%M %d-%m-%Y"
-        sorted_users = reversed(sorted(all_users, key=lambda x: datetime.datetime.strptime(x[5], date_format)))
+        if direction is None and latest_users['next']:
+            users_from_db += f"... и еще {latest_users['total'] - len(latest_users['users'])}\n"
+            users_from_db += f"[ADMIN] {await user_manager.aio.get_first_registered_user_id()}"
 
-        for user in sorted_users:
-            id_in_db = user[0]
-            user_id = user[1]
-            firstname = user[2]
-            username = user[4]
-            date = user[5]
+        users_from_db += f"\n\n<b>➜ TOTAL {latest_users['total']}</b>"
 
-            users_from_db += f"[{id_in_db}]: ({str(date).split(' ')[1]}) {firstname}\n{user_id}\n"
-            users_from_db_count += 1
+        navigation_buttons = []
+        if latest_users['prev']:
+            navigation_buttons.append(InlineKeyboardButton(
+                "Назад", callback_data=f"show_users:prev:{latest_users['prev'][0]}:{latest_users['prev'][1]}"))
+        if latest_users['next']:
+            navigation_buttons.append(InlineKeyboardButton(
+                "Вперед", callback_data=f"show_users:next:{latest_users['next'][0]}:{latest_users['next'][1]}"))
+        markup = InlineKeyboardMarkup().row(*navigation_buttons) if navigation_buttons else None
 
-            if users_from_db_count >= 20:
-                users_from_db += f'... и еще {cnt_users - 20}\n'
-                users_from_db += f'[ADMIN] ' \
-                                 f'{sorted(all_users, key=lambda x: datetime.datetime.strptime(x[5], date_format))[0][1]}'
-                break
+        if direction is None:
+            sent_message = await message.answer(users_from_db, reply_markup=markup, parse_mode="HTML")
+            await drop_admin_message(message, sent_message)
+        else:
+            await bot.edit_message_text(
+                users_from_db,
+                chat_id=message.chat.id,
+                message_id=message.message_id,
+                reply_markup=markup,
+                parse_mode='HTML'
+            )
 
-        users_from_db += f"\n\n<b>➜ TOTAL {cnt_users}</b>"
 
-        await wait_message.delete()
-        sent_message = await message.answer(users_from_db, parse_mode="HTML")
-        await drop_admin_message(message, sent_message)
+@dp.callback_query_handler(lambda callback_query: callback_query.data.startswith("show_users:"))
+async def handle_users_navigation(callback_query: types.CallbackQuery):
+    _, direction, date_register_ts, id_in_db = callback_query.data.split(":")
+    await show_all_users(callback_query.message, direction, (int(date_register_ts), int(id_in_db)))
+    await callback_query.answer()
 
 
 @dp.message_handler(lambda message: message.text == '/LESSONS/')
-async def show_all_users(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
+async def show_upcoming_lessons(message: types.Message):
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         appointments = AppointmentManager(INSPIRA_DB)
-        sorted_lessons_dict = appointments.get_upcoming_lessons()
+        sorted_lessons_dict = await appointments.aio.get_upcoming_lessons()
 
         appointment_str = ''
         for date_time, count in sorted_lessons_dict.items():
@@ -1120,13 +1142,17 @@ async def show_all_users(message: types.Message):
 
 @dp.message_handler(lambda message: message.text == '/PC/')
 async def monitor_process(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         await construction_to_delete_messages(message)
         try:
             from server_info import MachineResources
 
             machine_resources = MachineResources()
-            sent_message = await message.answer(machine_resources.get_all_info())
+            sqlite_profile = await db_manager.aio.get_sqlite_profile_report()
+            sent_message = await message.answer(
+                f"{machine_resources.get_all_info()}\n"
+                f"---------------------------\n"
+                f"DATABASE\n{sqlite_profile}")
 
             await drop_admin_message(message, sent_message)
         except ModuleNotFoundError as e:
@@ -1147,7 +1173,7 @@ async def cmd_add_admin(message: types.Message):
 
         try:
             admin_man = AdminsManager(INSPIRA_DB)
-            admin_man.drop_admin_from_db(selected_admin_id)
+            await admin_man.aio.drop_admin_from_db(selected_admin_id)
             await message.reply("[ OK ] ✅")
         except Exception:
             await message.reply("[ ERROR ] ❌")
@@ -1166,7 +1192,7 @@ async def process_add_new_admin(message: types.Message, state: FSMContext):
             else:
                 security_clearance = "2"
 
-            admins_manager.add_new_admin(admin_user_id, security_clearance)
+            await admins_manager.aio.add_new_admin(admin_user_id, security_clearance)
 
             await message.reply(f"Администратор с user_id {admin_user_id} добавлен {CONFIRM_SYMBOL}")
             await state.finish()
@@ -1189,7 +1215,7 @@ limited_users_manager = LimitedUsersManager(INSPIRA_DB)
 
 @dp.message_handler(commands=['limited_users'])
 async def blacklist_cat_users(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         await construction_to_delete_messages(message)
 
         blocked_users = await limited_users_manager.fetch_all_limited_users()
@@ -1198,9 +1224,46 @@ async def blacklist_cat_users(message: types.Message):
         await drop_admin_message(message, sent_message)
 
 
+LATEST_REFERRALS_COUNT = 20  # Количество переходов в /refs по умолчанию
+LATEST_REFERRALS_MAX = 100
+
+
+@dp.message_handler(commands=['refs'])
+async def show_latest_referrals(message: types.Message):
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
+        await construction_to_delete_messages(message)
+
+        count_argument = message.get_args()
+        count_refs = int(count_argument) if count_argument.isdigit() else LATEST_REFERRALS_COUNT
+        count_refs = max(1, min(count_refs, LATEST_REFERRALS_MAX))
+
+        latest_referrals = await ReferralArrival(INSPIRA_DB).aio.get_latest_referrals_records_formats(count_refs)
+        sent_message = await message.answer(f"➜ LAST REFERRALS ➜\n\n{latest_referrals or '/// EMPTY ///'}")
+
+        await drop_admin_message(message, sent_message)
+
+
+REFERRAL_STATS_DAYS = 7  # Период /ref_stats по умолчанию, дней
+
+
+@dp.message_handler(commands=['ref_stats'])
+async def show_referral_stats(message: types.Message):
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
+        await construction_to_delete_messages(message)
+
+        days_argument = message.get_args()
+        days = max(1, int(days_argument)) if days_argument.isdigit() else REFERRAL_STATS_DAYS
+
+        referral_stats = await ReferralArrival(INSPIRA_DB).aio.get_referral_stats_formats(days)
+        sent_message = await message.answer(
+            f"➜ REFERRAL STATS ({days} дн.) ➜\n\n{referral_stats or '/// EMPTY ///'}")
+
+        await drop_admin_message(message, sent_message)
+
+
 @dp.message_handler(commands=['block'])
 async def block_user(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         await construction_to_delete_messages(message)
 
         try:
@@ -1225,7 +1288,7 @@ async def block_user(message: types.Message):
 
 @dp.message_handler(commands=['unblock'])
 async def unblock_user(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         await construction_to_delete_messages(message)
         try:
             answer = await limited_users_manager.unblock_user(message.text)
@@ -1237,26 +1300,21 @@ async def unblock_user(message: types.Message):
 
 @dp.message_handler(commands=['i'])
 async def req_in_db(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         await construction_to_delete_messages(message)
         _user_id = int(message.text.split()[1])
 
-        user_manager = UserManager(INSPIRA_DB)
-        _user_card = user_manager.get_user_card(_user_id, 'user')
-
-        products_manager = ProductManager(INSPIRA_DB)
-        user_product_card = products_manager.get_user_product_card(user_id=_user_id)
-
-        _user_card += products_manager.get_user_product_card_for_display(user_product_card, PRODUCT_STATUSES)
-
         try:
-            status_user_in_bot = await limited_users_manager.check_user_for_block(_user_id)
+            dossier = await UserManager(INSPIRA_DB).aio.get_guest_dossier(_user_id)
         except OverflowError as overflow:
             await message.answer(f"➜ ERROR ➜\n\n{overflow}")
             return
 
-        if _user_card:
-            if status_user_in_bot:
+        if dossier:
+            _user_card = UserManager.get_guest_dossier_for_display(dossier)
+            _user_card += ProductManager.get_user_product_card_for_display(dossier.product_card, PRODUCT_STATUSES)
+
+            if dossier.is_blocked:
                 text_status_user_in_bot = '➜ (ЛИКВИДИРОВАН ❌)'
             else:
                 text_status_user_in_bot = ''
@@ -1271,14 +1329,14 @@ async def req_in_db(message: types.Message):
 
 @dp.message_handler(commands=['drop'])
 async def req_in_db(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         try:
             _user_id = int(message.text.split()[1])
 
             user_manager = UserManager(INSPIRA_DB)
 
             try:
-                user_manager.drop_user_from_db(_user_id)
+                await user_manager.aio.drop_user_from_db(_user_id)
                 await message.answer("<b>DROP USER: OK ✅</b>", parse_mode='HTML')
             except Exception as e:
                 await message.answer(f"<b>DROP USER: ERROR ❌</b>\n\n{e}", parse_mode='HTML')
@@ -1292,7 +1350,7 @@ async def send_html_message(message: types.Message):
     """
         Отправка сообщения пользователю по user_id, с HTML-форматированием
     """
-    if message.from_user.id in administrators.get_list_of_admins():
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         try:
             adv_text = len(message.text.split())
             if adv_text > 2:
@@ -1313,10 +1371,9 @@ async def send_html_message(message: types.Message):
 
 @dp.message_handler(commands=['all'])
 async def sent_message_to_user(message: types.Message):
-    if message.from_user.id in administrators.get_list_of_admins():
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
         keyboard = types.ReplyKeyboardMarkup(keyboard=ADMIN_PANEL_BUTTONS, resize_keyboard=True)
 
-        # try:
         split_cnt = len(message.text.split())
         if split_cnt > 2:
             _message = ' '.join(message.text.split()[1:])
@@ -1324,76 +1381,111 @@ async def sent_message_to_user(message: types.Message):
             _message = message.text.split()[1]
         _message = _message.replace("\\n", "\n")
 
-        user_manager = UserManager(INSPIRA_DB)
-        users_load = user_manager.read_users_from_db()
+        # Задание с получателями (без заблокированных гостей) сохраняется до начала рассылки
+        job_id = await BroadcastManager(INSPIRA_DB).aio.create_broadcast_job(message.from_user.id, _message, 'HTML')
 
-        cnt_users = 0
-        cnt_er = 0
-        count = 0
+        sent_mes = await bot.send_message(
+            message.from_user.id, f"➜ <b>SENDING STREAM MESSAGES</b> #{job_id} ... [wait]\n\n"
+                                  f"<i>/broadcasts – прогресс</i>", parse_mode='HTML')
 
-        import time
+        report = await run_broadcast_job(bot, job_id, _message, 'HTML')
 
-        sent_mes = await bot.send_message(admin_user_id, "➜ <b>SENDING STREAM MESSAGES</b> ... [wait]", parse_mode='HTML')
-        start_time = time.time()
+        tracer_l.tracer_charge(
+            'ADMIN', message.from_user.id, sent_message_to_user.__name__,
+            f"broadcast job {job_id}: sent {report.sent}, failed {report.failed}")
 
-        for row in users_load:
-            count += 1
-            _user_id = row[1]
+        await sent_mes.delete()
+        await bot.send_message(
+            message.from_user.id, f"➜ DONE {report.sent}\n➜ NOT COMPLETED {report.failed}\n"
+                                  f"{format_failures(report.failures)}\n"
+                                  f"➜ TIMING - {report.format_execution_time()}",
+            reply_markup=keyboard)
 
-            try:
-                status_user_in_bot = await limited_users_manager.check_user_for_block(_user_id)
 
-                if (cnt_users % 15 == 0) and (cnt_users != 0):
-                    print('sleep 5:', cnt_users, len(users_load), count)
-                    await asyncio.sleep(5)
-                else:
-                    print('sleep 0.25:', cnt_users, len(users_load), count)
-                    await asyncio.sleep(.25)
+@dp.message_handler(commands=['broadcasts'])
+async def show_broadcasts_progress(message: types.Message):
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
+        await construction_to_delete_messages(message)
 
-                if status_user_in_bot:
-                    print('pass user', count)
-                else:
-                    await bot.send_message(chat_id=_user_id, text=_message, parse_mode="HTML")
-                    cnt_users += 1
+        broadcast_manager = BroadcastManager(INSPIRA_DB)
+        broadcasts = await broadcast_manager.aio.get_broadcast_progress()
+        failures = await broadcast_manager.aio.get_broadcast_failures([broadcast[0] for broadcast in broadcasts])
 
-            except Exception:
-                cnt_er += 1
+        progress = '➜ BROADCASTS ➜\n\n'
+        for job_id, status, total, sent, failed, created_date in broadcasts:
+            progress += (f"#{job_id} [{status}] {created_date}\n"
+                         f"{sent + failed}/{total} • доставлено {sent} • ошибок {failed}\n"
+                         f"{format_failures(failures[job_id])}\n")
+        if not broadcasts:
+            progress += '/// EMPTY ///'
 
-        end_time = time.time()
-        execution_time = round(end_time - start_time)
+        progress += '\n\n➜ OUTBOX (приоритет • статус • сообщений) ➜\n'
+        for priority, status, count in await OutboxManager(INSPIRA_DB).aio.get_outbox_summary():
+            progress += f"{priority} • {status} • {count}\n"
 
-        hours = int(execution_time // 3600)
-        minutes = int((execution_time % 3600) // 60)
-        seconds = int(execution_time % 60)
-        final_people_text_execution_time = f'{hours} h, {minutes} m, {seconds} s'
+        sent_message = await message.answer(progress)
+        await drop_admin_message(message, sent_message)
+
+
+# Расписание заданий в формате cron, переопределяется секцией "schedule" в config.json
+DEFAULT_SCHEDULE = {
+    'daily_stats': '0 12 * * *',
+    'lessons_summary': '0 10 * * *',
+    'lesson_confirmation': '0 11 * * *'
+}
+SCHEDULE = load_config_section('schedule', DEFAULT_SCHEDULE)
+LESSONS_SUMMARY_COUNT = 10  # Количество ближайших занятий в утренней сводке администраторам
+
+scheduler = Scheduler(INSPIRA_DB)
 
-        await sent_mes.delete()
-        await bot.send_message(
-            admin_user_id, f"➜ DONE {cnt_users}\n➜ NOT COMPLETED {cnt_er}\n\n"
-                           f"➜ TIMING - {final_people_text_execution_time}",
-            reply_markup=keyboard)
 
+async def send_daily_stats():
+    """ Показатели прошедшего дня: одна строка счётчиков daily_stats """
+    daily_stats = await StatControl(INSPIRA_DB).aio.get_daily_stats_formats(-1)
+    await administrators.notify_admins(f"{ADMIN_PREFIX_TEXT}{daily_stats}")
 
-async def general_coroutine():
-    print("\nSTART the COROUTINE: [ OK ]\n")
-    while True:
-        now = datetime.datetime.now()
 
-        if now.hour == 12 and now.minute == 0:
-            for admin_id in administrators.get_list_of_admins():
-                await bot.send_message(admin_id, "Статистика за день: ...")
-            await asyncio.sleep(60)
-        if now.hour == 10 and now.minute == 0:
-            # TODO: Отправка сведений ближайших X занятиях
-            pass
-        if now.hour == 11 and now.minute == 0:
-            # TODO: Запрос подтверждения прихода на занятие от пользователей (в день занятия)
-            pass
-        if now.hour == 17 and now.minute == 2:
-            for admin_id in administrators.get_list_of_admins():
-                await bot.send_message(admin_id, "Test: test ...")
+async def send_lessons_summary():
+    """ Сводка администраторам: ближайшие занятия и количество записанных гостей """
+    upcoming_lessons = await AppointmentManager(INSPIRA_DB).aio.get_upcoming_lessons() or {}
 
-        await asyncio.sleep(30)
+    summary = f"{ADMIN_PREFIX_TEXT}<b>БЛИЖАЙШИЕ ЗАНЯТИЯ</b>\n\n"
+    for date_time, count in list(upcoming_lessons.items())[:LESSONS_SUMMARY_COUNT]:
+        summary += f"{date_time}: {count} чел.\n"
+    if not upcoming_lessons:
+        summary += '/// EMPTY ///'
+
+    await administrators.notify_admins(summary)
+
+
+async def request_lesson_confirmation():
+    """ Запрос подтверждения прихода гостям, записанным на занятие сегодня """
+    for user_id, time_lesson, service_name in await AppointmentManager(INSPIRA_DB).aio.get_guests_for_lesson_day():
+        markup = InlineKeyboardMarkup()
+        markup.add(InlineKeyboardButton("Я ПРИДУ", callback_data=f"registration:{user_id}"),
+                   InlineKeyboardButton("Я НЕ ПРИДУ", callback_data=f"cancel_signup:{user_id}"))
+
+        await notify_guest(
+            user_id,
+            f"{USER_PREFIX_TEXT}"
+            f"Сегодня в {time_lesson} Вас ждёт занятие ({service_name})!\n\n"
+            f"<i>Пожалуйста, подтвердите, что придёте.</i>",
+            reply_markup=markup)
+
+
+scheduler.add_job('daily_stats', SCHEDULE['daily_stats'], send_daily_stats, jitter=30, catch_up=6 * 3600)
+scheduler.add_job('lessons_summary', SCHEDULE['lessons_summary'], send_lessons_summary, jitter=30, catch_up=3600)
+scheduler.add_job('lesson_confirmation', SCHEDULE['lesson_confirmation'], request_lesson_confirmation,
+                  jitter=30, catch_up=3600)
+
+
+@dp.message_handler(commands=['jobs'])
+async def show_scheduled_jobs(message: types.Message):
+    if message.from_user.id in await administrators.aio.get_list_of_admins():
+        await construction_to_delete_messages(message)
+
+        sent_message = await message.answer(f"➜ JOBS ➜\n\n{scheduler.get_report()}")
+        await drop_admin_message(message, sent_message)
 
 
 # ------------- АДМИНИСТРИРОВАНИЕ СЕРВЕРНОЙ ЧАСТИ -----------
@@ -1437,7 +1529,9 @@ async def on_startup(dp):
     )
     print(f'===== DEBUG: {DEBUG} =============================================')
     print(f'===== INSPIRA: {__version__}  =======================================')
-    # await general_coroutine()
+    await start_outbox_workers(bot)
+    await resume_broadcast_jobs(bot)
+    await scheduler.start()
     tracer_l.tracer_charge(
         "SYSTEM", 0, on_startup.__name__, "start the server")
 
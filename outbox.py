@@ -0,0 +1,164 @@
+"""
+    Исходящая очередь сообщений (outbox).
+    Обработчики записывают сообщение в таблицу outbox (OutboxManager) и сразу возвращаются,
+    отправляет пул воркеров: сначала ответы гостю, затем уведомления о статусе изделия,
+    затем уведомления администраторам. Темп отправки общий с рассылками (broadcast.send_bucket).
+    Временные ошибки повторяются с экспоненциальной задержкой, состояние переживает перезапуск.
+"""
+import asyncio
+import io
+import random
+
+from aiogram import Bot
+from aiogram.types import InputFile
+from aiogram.utils.exceptions import RetryAfter, TelegramAPIError
+
+from database_manager import (load_config_section, OutboxManager, INSPIRA_DB, UNREACHABLE_REASONS,
+                              OUTBOX_PRIORITY_REPLY, OUTBOX_PRIORITY_GUEST)
+from broadcast import send_bucket, classify_send_error
+from tracer import TracerManager, TRACER_FILE
+
+
+__version__ = '1.0.0'
+
+
+# Переопределяется секцией "outbox" в config.json, ex. {"outbox": {"workers": 2}}
+DEFAULT_OUTBOX = {
+    'workers': 4,               # параллельные отправители
+    'poll_interval': 1.0,       # сек, проверка отложенных повторов при пустой очереди
+    'max_attempts': 6,          # попыток на сообщение, затем FAILED
+    'retry_base_delay': 2,      # сек, задержка повтора: base * 2 ** (попытка - 1), не больше max
+    'retry_max_delay': 600,
+    'keep_days': 7              # сколько дней хранить отправленные и недоставленные сообщения
+}
+OUTBOX = load_config_section('outbox', DEFAULT_OUTBOX)
+
+
+tracer_l = TracerManager(TRACER_FILE)
+
+_outbox_manager = OutboxManager(INSPIRA_DB)
+# Будит воркеры при постановке нового сообщения, иначе они проверяют очередь раз в poll_interval
+_new_message = asyncio.Event()
+# Запущенные воркеры – ссылки держатся до остановки
+_workers = set()
+
+
+def retry_delay(attempts: int) -> float:
+    """ Экспоненциальная задержка повтора со случайным разбросом, чтобы повторы не шли пачкой """
+    delay = min(OUTBOX['retry_base_delay'] * 2 ** (attempts - 1), OUTBOX['retry_max_delay'])
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def enqueue_message(chat_id: int, text: str, priority: int = OUTBOX_PRIORITY_REPLY, parse_mode: str = 'HTML',
+                          reply_markup=None, photo: io.BytesIO = None, photo_filename: str = None) -> int:
+    """
+        Постановка сообщения в очередь. Возвращается, как только сообщение сохранено в БД.
+        :param reply_markup: клавиатура aiogram, сохраняется как JSON
+        :param photo: изображение, text в этом случае – подпись к нему
+        :return: идентификатор сообщения в очереди
+    """
+    message_id = await _outbox_manager.aio.enqueue_message(
+        chat_id, text, priority, parse_mode,
+        reply_markup.as_json() if reply_markup is not None else None,
+        photo.getvalue() if photo is not None else None, photo_filename)
+    _new_message.set()
+
+    return message_id
+
+
+async def notify_guest(chat_id: int, text: str, parse_mode: str = 'HTML', reply_markup=None) -> int:
+    """ Уведомление гостя о статусе изделия – после ответов, но раньше уведомлений администраторам """
+    return await enqueue_message(chat_id, text, OUTBOX_PRIORITY_GUEST, parse_mode, reply_markup)
+
+
+async def enqueue_for_admins(text: str, parse_mode: str = 'HTML', reply_markup=None) -> int:
+    """ :return: количество администраторов, которым поставлено сообщение """
+    enqueued = await _outbox_manager.aio.enqueue_for_admins(
+        text, parse_mode, reply_markup.as_json() if reply_markup is not None else None)
+    _new_message.set()
+
+    return enqueued
+
+
+async def _deliver(bot: Bot, chat_id: int, text: str, parse_mode: str, reply_markup: str,
+                   photo: bytes, photo_filename: str):
+    # reply_markup уже JSON – aiogram передаёт строку в Telegram без изменений
+    if photo is not None:
+        await bot.send_photo(chat_id, photo=InputFile(io.BytesIO(photo), filename=photo_filename),
+                             caption=text, parse_mode=parse_mode, reply_markup=reply_markup)
+    else:
+        await bot.send_message(chat_id, text, parse_mode=parse_mode, reply_markup=reply_markup)
+
+
+async def _process(bot: Bot, message: tuple):
+    message_id, chat_id, priority, text, parse_mode, reply_markup, photo, photo_filename, attempts = message
+
+    await send_bucket.acquire(priority)
+    try:
+        await _deliver(bot, chat_id, text, parse_mode, reply_markup, photo, photo_filename)
+    except RetryAfter as flood_error:
+        send_bucket.pause(flood_error.timeout)
+        # ограничение темпа – не ошибка сообщения: попытка возвращается в бюджет max_attempts
+        await _outbox_manager.aio.reschedule_message(message_id, flood_error.timeout, 'flood', count_attempt=False)
+        return
+    except Exception as send_error:
+        reason = classify_send_error(send_error) if isinstance(send_error, TelegramAPIError) else 'error'
+        tracer_l.tracer_charge(
+            "WARNING", chat_id, f"{__name__} -> {_process.__name__}",
+            f"fail while send outbox message {message_id} (attempt {attempts})", f"{send_error}")
+
+        if reason in UNREACHABLE_REASONS or attempts >= OUTBOX['max_attempts']:
+            await _outbox_manager.aio.mark_message_failed(message_id, chat_id, reason, f"{send_error}")
+        else:
+            await _outbox_manager.aio.reschedule_message(message_id, retry_delay(attempts), f"{send_error}")
+        return
+
+    await _outbox_manager.aio.mark_message_sent(message_id)
+
+
+async def _worker(bot: Bot):
+    while True:
+        try:
+            message = await _outbox_manager.aio.claim_next_message()
+        except Exception as claim_error:
+            message = None
+            tracer_l.tracer_charge(
+                "ERROR", 0, f"{__name__} -> {_worker.__name__}",
+                "fail while claim next outbox message", f"{claim_error}")
+
+        if message is None:
+            _new_message.clear()
+            try:
+                await asyncio.wait_for(_new_message.wait(), OUTBOX['poll_interval'])
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await _process(bot, message)
+        except Exception as worker_error:
+            # сообщение остаётся в SENDING и вернётся в очередь при следующем запуске
+            tracer_l.tracer_charge(
+                "ERROR", message[1], f"{__name__} -> {_worker.__name__}",
+                f"outbox message {message[0]} is not processed", f"{worker_error}")
+
+
+async def start_outbox_workers(bot: Bot, workers: int = OUTBOX['workers']) -> list:
+    """
+        Запуск воркеров очереди. Вызывается при старте бота: сообщения, прерванные
+        перезапуском, возвращаются в очередь и отправляются первыми по своему приоритету.
+        :return: запущенные задачи asyncio
+    """
+    requeued = await _outbox_manager.aio.recover_outbox(OUTBOX['keep_days'])
+    tracer_l.tracer_charge(
+        "SYSTEM", 0, f"{__name__} -> {start_outbox_workers.__name__}",
+        f"start {workers} outbox workers, requeued {requeued} interrupted messages")
+
+    tasks = []
+    for _ in range(workers):
+        task = asyncio.create_task(_worker(bot))
+        _workers.add(task)
+        task.add_done_callback(_workers.discard)
+        tasks.append(task)
+
+    return tasks
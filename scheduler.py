@@ -0,0 +1,235 @@
+"""
+    Планировщик периодических заданий бота.
+    Задания хранятся в куче по времени следующего запуска: цикл спит ровно до ближайшего,
+    расписание задаётся в формате cron ('минуты часы дни_месяца месяцы дни_недели').
+    Плановое время последнего запуска сохраняется в БД (ScheduledJobsManager), поэтому запуск,
+    пропущенный из-за перезапуска бота, выполняется один раз при старте.
+"""
+import asyncio
+import datetime
+import heapq
+import itertools
+import random
+from time import time, monotonic
+
+from database_manager import ScheduledJobsManager, INSPIRA_DB
+from date_codec import format_timestamp
+from tracer import TracerManager, TRACER_FILE
+
+
+__version__ = '1.0.0'
+
+
+JOB_OK = 'OK'
+JOB_ERROR = 'ERROR'
+
+# Сколько дней вперёд искать ближайшее совпадение расписания (високосный год – с запасом)
+CRON_SEARCH_DAYS = 366 * 4 + 1
+
+
+tracer_l = TracerManager(TRACER_FILE)
+
+
+class CronSpec:
+    """
+        Расписание в формате cron: 'минуты часы дни_месяца месяцы дни_недели', ex. '0 12 * * *'.
+        Поле – '*', число, список через запятую, диапазон 'a-b' и шаг '/n'. День недели: 0 или 7 – воскресенье.
+        Как и в cron, если заданы и дни месяца, и дни недели, достаточно совпадения любого из них.
+    """
+    FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, spec: str):
+        fields = spec.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron spec must have 5 fields: {spec!r}")
+
+        self.spec = spec
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self.__parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELD_RANGES))
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        self.days_restricted = fields[2] != '*'
+        self.weekdays_restricted = fields[4] != '*'
+
+    @staticmethod
+    def __parse_field(field: str, low: int, high: int) -> list:
+        values = set()
+        for part in field.split(','):
+            value_range, _, step = part.partition('/')
+            if value_range == '*':
+                start, end = low, high
+            elif '-' in value_range:
+                start, end = (int(value) for value in value_range.split('-'))
+            else:
+                start = end = int(value_range)
+                if step:
+                    end = high
+
+            if not low <= start <= end <= high:
+                raise ValueError(f"cron field {field!r} is out of range {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return sorted(values)
+
+    def _day_matches(self, day: datetime.date) -> bool:
+        if day.month not in self.months:
+            return False
+        day_match = day.day in self.days
+        weekday_match = (day.weekday() + 1) % 7 in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def next_after(self, moment: datetime.datetime) -> datetime.datetime:
+        """ Ближайшее время запуска строго после moment (с точностью до минуты) """
+        start = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+
+        for day_offset in range(CRON_SEARCH_DAYS):
+            day = start.date() + datetime.timedelta(days=day_offset)
+            if not self._day_matches(day):
+                continue
+            for hour in self.hours:
+                for minute in self.minutes:
+                    candidate = datetime.datetime.combine(day, datetime.time(hour, minute))
+                    if candidate >= start:
+                        return candidate
+
+        raise ValueError(f"cron spec {self.spec!r} never fires")
+
+
+class ScheduledJob:
+    __slots__ = ('name', 'cron', 'func', 'jitter', 'max_instances', 'catch_up',
+                 'running', 'next_run', 'last_run', 'last_duration', 'last_status', 'runs', 'skipped')
+
+    def __init__(self, name: str, spec: str, func, jitter: float, max_instances: int, catch_up: int):
+        self.name = name
+        self.cron = CronSpec(spec)
+        self.func = func
+        self.jitter = jitter                # сек, случайная задержка запуска от 0 до jitter
+        self.max_instances = max_instances  # одновременных запусков задания
+        self.catch_up = catch_up            # сек, насколько поздно ещё выполнять пропущенный запуск, 0 – не выполнять
+        self.running = 0
+        self.next_run = None
+        self.last_run = None
+        self.last_duration = None
+        self.last_status = None
+        self.runs = 0
+        self.skipped = 0
+
+
+class Scheduler:
+    def __init__(self, db_name: str = INSPIRA_DB):
+        self.jobs_manager = ScheduledJobsManager(db_name)
+        self.jobs = {}
+        self._heap = []             # (время запуска, номер, задание, плановое время)
+        self._sequence = itertools.count()
+        self._tasks = set()
+        self._loop_task = None
+
+    def add_job(self, name: str, spec: str, func, jitter: float = 0, max_instances: int = 1, catch_up: int = 0):
+        """
+            :param spec: расписание cron, ex. '0 10 * * *' – ежедневно в 10:00
+            :param func: корутинная функция без аргументов
+        """
+        self.jobs[name] = ScheduledJob(name, spec, func, jitter, max_instances, catch_up)
+
+    def _push(self, job: ScheduledJob, run_at: float, scheduled_ts: int):
+        job.next_run = run_at
+        heapq.heappush(self._heap, (run_at, next(self._sequence), job, scheduled_ts))
+
+    async def start(self):
+        """ Расчёт первых запусков (с учётом пропущенных) и запуск цикла. Вызывается при старте бота """
+        job_states = await self.jobs_manager.aio.get_job_states() or {}
+        now = datetime.datetime.now()
+
+        for job in self.jobs.values():
+            last_scheduled_ts, job.last_run, job.last_duration, job.last_status, job.runs, job.skipped = (
+                job_states.get(job.name, (None, None, None, None, 0, 0)))
+
+            if job.catch_up and last_scheduled_ts is not None:
+                # пропущенные запуски ищутся только в окне catch_up, выполняется один – последний
+                missed_run = job.cron.next_after(max(datetime.datetime.fromtimestamp(last_scheduled_ts),
+                                                     now - datetime.timedelta(seconds=job.catch_up)))
+                while missed_run <= now and job.cron.next_after(missed_run) <= now:
+                    missed_run = job.cron.next_after(missed_run)
+                if missed_run <= now:
+                    tracer_l.tracer_charge(
+                        "SYSTEM", 0, f"{__name__} -> {self.start.__name__}",
+                        f"catch up missed run of {job.name} at {missed_run}")
+                    self._push(job, time(), int(missed_run.timestamp()))
+                    continue
+
+            next_run = job.cron.next_after(now)
+            self._push(job, next_run.timestamp(), int(next_run.timestamp()))
+
+        self._loop_task = asyncio.create_task(self.__run())
+
+    async def __run(self):
+        while True:
+            if not self._heap:
+                return
+
+            run_at, _, job, scheduled_ts = self._heap[0]
+            delay = run_at - time()
+            if delay > 0:
+                # короткими отрезками: перевод системных часов учитывается не позже чем через минуту
+                await asyncio.sleep(min(delay, 60))
+                continue
+
+            heapq.heappop(self._heap)
+            self.__fire(job, scheduled_ts)
+
+            # от планового времени: ранний выход из sleep не даёт повторить тот же запуск
+            scheduled = datetime.datetime.fromtimestamp(scheduled_ts)
+            next_run = job.cron.next_after(max(scheduled, datetime.datetime.now()))
+            self._push(job, next_run.timestamp(), int(next_run.timestamp()))
+
+    def __fire(self, job: ScheduledJob, scheduled_ts: int):
+        if job.running >= job.max_instances:
+            job.skipped += 1
+            tracer_l.tracer_charge(
+                "WARNING", 0, f"{__name__} -> {job.name}",
+                f"run is skipped: {job.running} runs are still in progress")
+            task = asyncio.create_task(self.jobs_manager.aio.record_job_skip(job.name, scheduled_ts))
+        else:
+            job.running += 1
+            task = asyncio.create_task(self.__execute(job, scheduled_ts))
+
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def __execute(self, job: ScheduledJob, scheduled_ts: int):
+        try:
+            if job.jitter:
+                await asyncio.sleep(random.uniform(0, job.jitter))
+
+            job.last_run = int(time())
+            started_at = monotonic()
+            status, error = JOB_OK, None
+            try:
+                await self.jobs_manager.aio.record_job_start(job.name, scheduled_ts, job.last_run)
+                await job.func()
+            except Exception as job_error:
+                status, error = JOB_ERROR, f"{job_error}"
+                tracer_l.tracer_charge(
+                    "ERROR", 0, f"{__name__} -> {job.name}", "scheduled job failed", error)
+
+            job.runs += 1
+            job.last_duration, job.last_status = monotonic() - started_at, status
+            try:
+                await self.jobs_manager.aio.record_job_finish(job.name, job.last_duration, status, error)
+            except Exception as record_error:
+                tracer_l.tracer_charge(
+                    "ERROR", 0, f"{__name__} -> {job.name}", "fail while record job finish", f"{record_error}")
+        finally:
+            job.running -= 1
+
+    def get_report(self) -> str:
+        """ Отчёт администратору: расписание, последний запуск, длительность и следующий запуск каждого задания """
+        report = ''
+        for job in sorted(self.jobs.values(), key=lambda scheduled_job: scheduled_job.next_run or 0):
+            duration = '-' if job.last_duration is None else f"{job.last_duration:.2f} s"
+            report += (f"{job.name} [{job.cron.spec}] {job.last_status or '-'}\n"
+                       f"последний: {format_timestamp(job.last_run)} • {duration}\n"
+                       f"следующий: {format_timestamp(job.next_run)}\n"
+                       f"запусков {job.runs} • пропущено {job.skipped}"
+                       f"{' • выполняется' if job.running else ''}\n\n")
+        return report or '/// EMPTY ///'
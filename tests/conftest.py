@@ -0,0 +1,17 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture
+def db_name(tmp_path, monkeypatch):
+    """ Новая база со схемой последней версии. Рабочий каталог – tmp_path: туда пишутся журнал и config.json """
+    monkeypatch.chdir(tmp_path)
+    from database_manager import SchemaMigrator
+
+    db_name = str(tmp_path / 'inspira.db')
+    SchemaMigrator(db_name).migrate()
+    return db_name
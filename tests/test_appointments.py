@@ -0,0 +1,34 @@
+from database_manager import AppointmentManager, ReservationResult
+
+DATE_LESSON = '01.12.2030'
+
+
+def test_signup_already_booked_and_full(db_name):
+    appointments = AppointmentManager(db_name)
+
+    assert appointments.signup_guest_for_lesson(1, 'Гончарный круг', DATE_LESSON, '11:00', limiter=2) == ReservationResult.BOOKED
+    assert appointments.signup_guest_for_lesson(1, 'Лепка', DATE_LESSON, '13:30', limiter=2) == ReservationResult.ALREADY_BOOKED
+    # ограничитель общий для слота, услуги не разделяют места
+    assert appointments.signup_guest_for_lesson(2, 'Лепка', DATE_LESSON, '11:00', limiter=2) == ReservationResult.BOOKED
+    assert appointments.signup_guest_for_lesson(3, 'Лепка', DATE_LESSON, '11:00', limiter=2) == ReservationResult.FULL
+    assert appointments.signup_guest_for_lesson(3, 'Лепка', DATE_LESSON, '13:30', limiter=2) == ReservationResult.BOOKED
+
+    assert appointments.get_quantity_guests_in_lesson(DATE_LESSON, '11:00') == 2
+    assert appointments.get_occupancy_for_slots([DATE_LESSON]) == {
+        (DATE_LESSON, '11:00'): 2, (DATE_LESSON, '13:30'): 1, (DATE_LESSON, '15:30'): 0}
+
+
+def test_headcount_follows_appointment_rows(db_name):
+    appointments = AppointmentManager(db_name)
+    for user_id in (1, 2):
+        appointments.signup_guest_for_lesson(user_id, 'Лепка', DATE_LESSON, '11:00', limiter=2)
+
+    # снятый с занятия гость остаётся в appointments и занимает место
+    appointments.remove_from_lesson(1)
+    assert appointments.get_quantity_guests_in_lesson(DATE_LESSON, '11:00') == 2
+    appointments.confirm_signup(1, 'Гончарный круг', 'CONFIRMED')
+    assert appointments.get_quantity_guests_in_lesson(DATE_LESSON, '11:00') == 2
+
+    assert appointments.cancel_signup(1) is True
+    assert appointments.get_quantity_guests_in_lesson(DATE_LESSON, '11:00') == 1
+    assert appointments.signup_guest_for_lesson(3, 'Лепка', DATE_LESSON, '11:00', limiter=2) == ReservationResult.BOOKED
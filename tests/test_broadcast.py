@@ -0,0 +1,35 @@
+import asyncio
+
+from broadcast import TokenBucket
+from database_manager import OUTBOX_PRIORITY_REPLY, OUTBOX_PRIORITY_ADMIN, OUTBOX_PRIORITY_BROADCAST
+
+
+def test_token_bucket_serves_waiters_by_priority():
+    async def run() -> list:
+        bucket = TokenBucket(rate=50, capacity=1)
+        await bucket.acquire()      # токенов нет: дальше все ждут пополнения
+        served = []
+
+        async def send(priority: int, name: str):
+            await bucket.acquire(priority)
+            served.append(name)
+
+        waiters = [asyncio.create_task(send(priority, name)) for priority, name in (
+            (OUTBOX_PRIORITY_BROADCAST, 'broadcast 1'), (OUTBOX_PRIORITY_ADMIN, 'admin'),
+            (OUTBOX_PRIORITY_BROADCAST, 'broadcast 2'), (OUTBOX_PRIORITY_REPLY, 'reply'))]
+        await asyncio.gather(*waiters)
+        return served
+
+    assert asyncio.run(run()) == ['reply', 'admin', 'broadcast 1', 'broadcast 2']
+
+
+def test_token_bucket_pause_delays_all_senders():
+    async def run() -> float:
+        loop = asyncio.get_running_loop()
+        bucket = TokenBucket(rate=1000, capacity=10)
+        bucket.pause(0.2)
+        started_at = loop.time()
+        await bucket.acquire(OUTBOX_PRIORITY_REPLY)
+        return loop.time() - started_at
+
+    assert asyncio.run(run()) >= 0.19
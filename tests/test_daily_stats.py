@@ -0,0 +1,44 @@
+import pytest
+
+from database_manager import (StatControl, UserManager, ProductManager, AppointmentManager,
+                              USERS_TABLE_NAME, PRODUCTS_TABLE_NAME, build_daily_stats_increment)
+
+
+def add_user(users: UserManager, user_id: int):
+    users.add_record(USERS_TABLE_NAME, {
+        'user_id': user_id, 'fullname': f'Гость {user_id}', 'phone': None, 'username': None,
+        'date_register': None, 'user_status': True, 'user_status_date_upd': None})
+
+
+def test_counters_increment_with_events(db_name):
+    stats = StatControl(db_name)
+    assert set(stats.get_daily_stats().values()) == {0}
+
+    users = UserManager(db_name)
+    for user_id in (1, 2, 3):
+        add_user(users, user_id)
+
+    products = ProductManager(db_name)
+    products.add_record(PRODUCTS_TABLE_NAME, {'user_id': 1, 'status': 'WAIT', 'group_number': '01'})
+    products.update_product_status(1, 'WORK')
+    products.update_product_status(1, 'WORK')     # статус не изменился – не считается
+    products.update_product_status(1, 'DONE')
+    products.update_product_status(2, 'DONE')     # изделия нет – не считается
+
+    appointments = AppointmentManager(db_name)
+    appointments.signup_guest_for_lesson(1, 'Лепка', '01.12.2030', '11:00')
+    appointments.signup_guest_for_lesson(2, 'Лепка', '01.12.2030', '11:00')
+    appointments.cancel_signup(2)
+    appointments.cancel_signup(3)                 # не был записан – не считается
+
+    daily_stats = stats.get_daily_stats()
+    assert daily_stats['new_users'] == 3
+    assert (daily_stats['products_wait'], daily_stats['products_work'], daily_stats['products_done']) == (0, 1, 1)
+    assert (daily_stats['lesson_signups'], daily_stats['lesson_cancellations']) == (2, 1)
+    # другие дни не затронуты
+    assert set(stats.get_daily_stats(-1).values()) == {0}
+
+
+def test_unknown_counter_is_rejected():
+    with pytest.raises(ValueError):
+        build_daily_stats_increment('visits')
@@ -0,0 +1,81 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def create_baseline_database(db_path: Path):
+    """ База в том виде, в каком её оставляла версия до миграций: без schema_version и колонок _ts """
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE users (id INTEGER PRIMARY KEY, user_id INTEGER, fullname TEXT, phone TEXT, username TEXT,
+                            date_register TEXT, user_status BOOL, user_status_date_upd TEXT);
+        CREATE TABLE products (id INTEGER PRIMARY KEY, product_id TEXT, status TEXT, user_id INTEGER,
+                               group_number TEXT, status_update_date TEXT);
+        CREATE TABLE referrals (id INTEGER PRIMARY KEY, user_id TEXT, arrival_id TEXT, date_arrival TEXT);
+        CREATE TABLE limited_users (id INTEGER PRIMARY KEY, user_id INTEGER, date TEXT);
+        CREATE TABLE admins (id INTEGER PRIMARY KEY, user_id INTEGER, security_clearance INTEGER, admin_status BOOL);
+        CREATE TABLE appointments (appointment_id INTEGER PRIMARY KEY, user_id INTEGER, service_name TEXT,
+                                   status BOOL, date_lesson TEXT, time_lesson TEXT, date_update TEXT);
+        CREATE TABLE referral (user_id TEXT, id_arrival TEXT, date TEXT);
+    ''')
+    conn.executemany('INSERT INTO referral (user_id, id_arrival, date) VALUES (?, ?, ?)', [
+        ('100', 'vk', '01.09.2024-10:00:00'),
+        ('100', 'tg', '02.09.2024-10:00:00'),
+        ('200', 'vk', '03.09.2024-10:00:00'),
+    ])
+    conn.execute("INSERT INTO referrals (user_id, arrival_id, date_arrival) VALUES ('200', 'inst', '04.09.2024-10:00:00')")
+    conn.commit()
+    conn.close()
+
+
+def test_migrate_baseline_database_with_duplicate_referrals(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from database_manager import SchemaMigrator, MIGRATIONS
+
+    db_path = tmp_path / 'inspira.db'
+    create_baseline_database(db_path)
+
+    schema_version = SchemaMigrator(str(db_path)).migrate()
+    assert schema_version == MIGRATIONS[-1]['version']
+
+    conn = sqlite3.connect(db_path)
+    referrals = conn.execute('SELECT user_id, arrival_id FROM referrals ORDER BY user_id').fetchall()
+    # у каждого гостя остаётся первая запись: для 200 – уже лежавшая в referrals
+    assert referrals == [('100', 'vk'), ('200', 'inst')]
+
+    index_is_unique = conn.execute(
+        "SELECT [unique] FROM pragma_index_list('referrals') WHERE name = 'idx_referrals_user_id'").fetchone()
+    assert index_is_unique == (1,)
+    conn.close()
+
+
+def test_migrate_new_database_matches_current_schema(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import database_manager
+
+    db_path = tmp_path / 'inspira.db'
+    database_manager.SchemaMigrator(str(db_path)).migrate()
+
+    conn = sqlite3.connect(db_path)
+    for name in dir(database_manager):
+        if not name.startswith('FIELDS_FOR_'):
+            continue
+        table_name = getattr(database_manager, name.replace('FIELDS_FOR_', '') + '_TABLE_NAME')
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table_name})')]
+        assert columns == [field['name'] for field in getattr(database_manager, name)], table_name
+
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'idx_products_group_number' not in indexes
+    assert {'idx_products_group_status', 'idx_users_date_register_ts', 'idx_lesson_slots_date_lesson_ts'} <= indexes
+
+    for name in dir(database_manager):
+        if not name.startswith('INDEXES_FOR_'):
+            continue
+        for index in getattr(database_manager, name):
+            index_is_unique = conn.execute(
+                "SELECT [unique] FROM sqlite_master JOIN pragma_index_list(tbl_name) ON pragma_index_list.name = ? "
+                "WHERE type = 'index' AND sqlite_master.name = ?", (index['name'], index['name'])).fetchone()
+            assert index_is_unique == (int(index.get('unique', False)),), index['name']
+    conn.close()
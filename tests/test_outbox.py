@@ -0,0 +1,67 @@
+import asyncio
+
+from aiogram.utils.exceptions import RetryAfter
+
+from broadcast import TokenBucket
+from database_manager import (OutboxManager, Query, OUTBOX_TABLE_NAME, OUTBOX_PENDING, OUTBOX_FAILED,
+                              OUTBOX_PRIORITY_REPLY, OUTBOX_PRIORITY_GUEST, OUTBOX_PRIORITY_ADMIN)
+
+
+class FailingBot:
+    def __init__(self, error: Exception):
+        self.error = error
+        self.calls = 0
+
+    async def send_message(self, *args, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+def get_message_state(manager: OutboxManager, message_id: int) -> tuple:
+    return manager._fetch_one(Query(OUTBOX_TABLE_NAME, ['status', 'attempts']).where(id=message_id))
+
+
+def test_claim_by_priority_then_enqueue_order(db_name):
+    manager = OutboxManager(db_name)
+    admin_id = manager.enqueue_message(1, 'admin', OUTBOX_PRIORITY_ADMIN)
+    first_reply_id = manager.enqueue_message(2, 'reply', OUTBOX_PRIORITY_REPLY)
+    guest_id = manager.enqueue_message(3, 'guest', OUTBOX_PRIORITY_GUEST)
+    second_reply_id = manager.enqueue_message(4, 'reply', OUTBOX_PRIORITY_REPLY)
+
+    claimed = [manager.claim_next_message()[0] for _ in range(4)]
+
+    assert claimed == [first_reply_id, second_reply_id, guest_id, admin_id]
+    assert manager.claim_next_message() is None
+
+
+def test_attempts_budget(db_name, monkeypatch):
+    # модуль открывает очередь в рабочем каталоге при импорте – только после перехода в tmp_path
+    import outbox
+
+    manager = OutboxManager(db_name)
+    monkeypatch.setattr(outbox, '_outbox_manager', manager)
+    monkeypatch.setattr(outbox, 'send_bucket', TokenBucket(1000, 1000))
+    monkeypatch.setitem(outbox.OUTBOX, 'max_attempts', 3)
+    monkeypatch.setitem(outbox.OUTBOX, 'retry_base_delay', 0)
+
+    flood_message_id = manager.enqueue_message(1, 'flood', OUTBOX_PRIORITY_REPLY)
+    failing_message_id = manager.enqueue_message(2, 'error', OUTBOX_PRIORITY_GUEST)
+
+    async def deliver(bot):
+        while (message := manager.claim_next_message()) is not None:
+            await outbox._process(bot, message)
+
+    # ожидание flood control не расходует попытки: сообщение остаётся в очереди сколько угодно раз
+    flood_bot = FailingBot(RetryAfter(0))
+    for _ in range(5):
+        message = manager.claim_next_message()
+        assert message[0] == flood_message_id
+        asyncio.run(outbox._process(flood_bot, message))
+    assert get_message_state(manager, flood_message_id) == (OUTBOX_PENDING, 0)
+
+    manager._execute(f'DELETE FROM {OUTBOX_TABLE_NAME} WHERE id = ?', (flood_message_id,))
+    error_bot = FailingBot(Exception('network is unreachable'))
+    asyncio.run(deliver(error_bot))
+
+    assert error_bot.calls == 3
+    assert get_message_state(manager, failing_message_id) == (OUTBOX_FAILED, 3)
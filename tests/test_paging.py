@@ -0,0 +1,47 @@
+from database_manager import UserManager, ProductManager, USERS_TABLE_NAME, PRODUCTS_TABLE_NAME
+
+
+def get_group_numbers(groups_page: tuple) -> tuple:
+    groups, has_more = groups_page
+    return [group['group_number'] for group in groups], has_more
+
+
+def test_groups_keyset_paging(db_name):
+    products = ProductManager(db_name)
+    for user_id, group_number, status in ((1, '01', 'WORK'), (2, '01', 'DONE'), (3, '02', 'WORK'), (4, '03', 'WAIT'),
+                                          (5, '04', 'WAIT'), (6, '05', 'DONE'), (7, None, 'WAIT')):
+        products.add_record(PRODUCTS_TABLE_NAME, {'user_id': user_id, 'group_number': group_number, 'status': status})
+
+    first_page = products.get_groups_page(limit=2)
+    assert get_group_numbers(first_page) == (['01', '02'], True)
+    assert first_page[0][0] == {'group_number': '01', 'members': 2, 'statuses': {'WORK': 1, 'DONE': 1}}
+
+    assert get_group_numbers(products.get_groups_page(after='02', limit=2)) == (['03', '04'], True)
+    assert get_group_numbers(products.get_groups_page(after='04', limit=2)) == (['05'], False)
+    assert get_group_numbers(products.get_groups_page(before='05', limit=2)) == (['03', '04'], True)
+    assert get_group_numbers(products.get_groups_page(before='03', limit=2)) == (['01', '02'], False)
+
+
+def test_latest_users_keyset_paging(db_name):
+    users = UserManager(db_name)
+    # у двоих одинаковое время регистрации: порядок внутри – по id
+    for user_id, date_register in ((1, '01-09-2024 10:00:00'), (2, '02-09-2024 10:00:00'),
+                                   (3, '02-09-2024 10:00:00'), (4, '03-09-2024 10:00:00'),
+                                   (5, '04-09-2024 10:00:00')):
+        users.add_record(USERS_TABLE_NAME, {'user_id': user_id, 'fullname': f'Гость {user_id}',
+                                            'date_register': date_register, 'user_status_date_upd': date_register})
+
+    def user_ids(page: dict) -> list:
+        return [user[1] for user in page['users']]
+
+    first_page = users.get_latest_users(limit=2)
+    assert (user_ids(first_page), first_page['prev'], first_page['total']) == ([5, 4], None, 5)
+
+    second_page = users.get_latest_users(limit=2, after=first_page['next'])
+    assert user_ids(second_page) == [3, 2]
+
+    last_page = users.get_latest_users(limit=2, after=second_page['next'])
+    assert (user_ids(last_page), last_page['next']) == ([1], None)
+
+    assert user_ids(users.get_latest_users(limit=2, before=last_page['prev'])) == [3, 2]
+    assert user_ids(users.get_latest_users(limit=2, before=second_page['prev'])) == [5, 4]
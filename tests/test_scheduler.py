@@ -0,0 +1,68 @@
+import asyncio
+import datetime
+from time import time
+
+import pytest
+
+from scheduler import CronSpec, Scheduler
+
+
+@pytest.mark.parametrize('spec, moment, expected', [
+    ('*/15 * * * *', datetime.datetime(2024, 1, 1, 10, 7, 30), datetime.datetime(2024, 1, 1, 10, 15)),
+    ('5/20 * * * *', datetime.datetime(2024, 1, 1, 10, 45), datetime.datetime(2024, 1, 1, 11, 5)),
+    # строго после moment: совпавшая минута не повторяется
+    ('0 12 * * *', datetime.datetime(2024, 1, 1, 12, 0), datetime.datetime(2024, 1, 2, 12, 0)),
+    # пятница 05.01.2024 -> понедельник
+    ('0 9 * * 1-5', datetime.datetime(2024, 1, 5, 10, 0), datetime.datetime(2024, 1, 8, 9, 0)),
+    ('0 0 * * 7', datetime.datetime(2024, 1, 1, 0, 0), datetime.datetime(2024, 1, 7, 0, 0)),
+    # дни месяца и дни недели заданы оба – достаточно любого: пятница раньше 13-го
+    ('0 0 13 * 5', datetime.datetime(2024, 1, 1, 0, 0), datetime.datetime(2024, 1, 5, 0, 0)),
+    ('30 8 29 2 *', datetime.datetime(2024, 3, 1, 0, 0), datetime.datetime(2028, 2, 29, 8, 30)),
+])
+def test_cron_next_after(spec, moment, expected):
+    assert CronSpec(spec).next_after(moment) == expected
+
+
+@pytest.mark.parametrize('spec', ['* * * *', '60 * * * *', '0 24 * * *', '0 0 0 * *', '0 0 * 13 *', '5-1 * * * *'])
+def test_cron_invalid_spec(spec):
+    with pytest.raises(ValueError):
+        CronSpec(spec)
+
+
+def test_cron_spec_that_never_fires():
+    with pytest.raises(ValueError):
+        CronSpec('0 0 31 2 *').next_after(datetime.datetime(2024, 1, 1))
+
+
+def test_start_catches_up_only_missed_runs_inside_window(db_name):
+    scheduler = Scheduler(db_name)
+    now = datetime.datetime.now()
+    # время запуска далеко от текущего: последний плановый запуск сутки назад, окно catch_up – 10 минут
+    far_hour = (now.hour + 12) % 24
+
+    for name in ('minutely', 'daily'):
+        scheduler.jobs_manager.record_job_start(name, int(time()) - 86400, int(time()) - 86400)
+
+    async def start():
+        async def job():
+            pass
+
+        scheduler.add_job('minutely', '* * * * *', job, catch_up=600)
+        scheduler.add_job('daily', f'0 {far_hour} * * *', job, catch_up=600)
+        scheduler.add_job('new', '* * * * *', job, catch_up=600)
+        await scheduler.start()
+        scheduler._loop_task.cancel()
+        return {job.name: (run_at, scheduled_ts) for run_at, _, job, scheduled_ts in scheduler._heap}
+
+    runs = asyncio.run(start())
+
+    # пропущен ежеминутный запуск: выполняется сразу один раз, за последнюю прошедшую минуту
+    run_at, scheduled_ts = runs['minutely']
+    assert run_at <= time()
+    assert time() - 60 <= scheduled_ts <= time()
+    # пропущенный запуск старше окна не выполняется, задание ждёт следующего по расписанию
+    run_at, scheduled_ts = runs['daily']
+    assert run_at == scheduled_ts > time()
+    # без сохранённого состояния догонять нечего
+    run_at, _ = runs['new']
+    assert run_at > time()